@@ -1,6 +1,6 @@
 from .github import GithubReleaseResource
 from .item import SyncItem, TextOutputSyncItem, RemoteSyncItem, CustomSyncItem, ResourceNotChange, LocalFileSyncItem
 from .local import LocalDirectoryResource
-from .resource import SyncResource, SyncTree, MetadataItem
+from .resource import SyncResource, SyncTree, MetadataItem, CompleteItem
 from .sourceforge import SourceForgeFilesResource
 from .version import VersionBasedResource
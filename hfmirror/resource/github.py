@@ -63,3 +63,4 @@ class GithubReleaseResource(VersionBasedResource):
                 yield 'version', tag_name, tag_name
                 release_metadata = {'version': release.tag_name, 'title': release.title, 'url': release.html_url}
                 yield 'metadata', release_metadata, tag_name
+                yield '__complete__', None, tag_name
@@ -1,24 +1,35 @@
 import abc
 import os.path
+import shutil
+import threading
 import time
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from email.utils import parsedate_to_datetime
-from typing import List, ContextManager, Optional, Type, Any, Dict
+from hashlib import sha1
+from typing import List, ContextManager, Optional, Type, Any, Dict, AsyncContextManager, Mapping, Tuple
 
 import requests
 from hbutils.string import truncate
 from hbutils.system.filesystem.tempfile import TemporaryDirectory
 from hbutils.system.network import urlsplit
 
-from ..utils import download_file, srequest, get_requests_session, hash_anything
+from ..utils import download_file, srequest, get_shared_session, hash_anything, adownload_file, asrequest, \
+    optional_aiohttp_session, to_thread, thread_context, release_file_digests
 
 
 class ResourceNotChange(Exception):
-    pass
+    def __init__(self, *args, requested: bool = True):
+        Exception.__init__(self, *args)
+        # whether a request has been sent to find out the resource is not changed
+        self.requested = requested
 
 
 class SyncItem(metaclass=abc.ABCMeta):
     __type__: str = None
+    __mark_requests__: bool = False  # whether refresh_mark sends requests
+    __owned_file__: bool = False  # whether load_file yields a temporary file, which can be moved away
+    __digest_mark__: bool = False  # whether the digests computed when loading are saved in the mark
+    __slots__ = ('_value', 'metadata', 'segments')
 
     def __init__(self, value, metadata: dict, segments: List[str]):
         self._value = value
@@ -31,6 +42,26 @@ class SyncItem(metaclass=abc.ABCMeta):
     def refresh_mark(self, mark: Optional[Dict[str, Any]]):
         return mark or {}
 
+    def aload_file(self, session=None) -> AsyncContextManager[str]:
+        # async version of load_file, which loads the file in a thread by default
+        # session is the aiohttp session shared by the async sync task
+        _ = session
+        return thread_context(self.load_file())
+
+    def stable_until(self, mark: Optional[Dict[str, Any]]) -> Optional[float]:
+        # timestamp until which the mark is known to be valid without refreshing it
+        # 0 means not stable, None means stable forever (e.g. the file is determined by the value)
+        _ = mark
+        return 0
+
+    async def arefresh_mark(self, mark: Optional[Dict[str, Any]], session=None):
+        # async version of refresh_mark, which refreshes the mark in a thread by default
+        _ = session
+        if type(self).refresh_mark is SyncItem.refresh_mark:  # nothing blocking
+            return self.refresh_mark(mark)
+        else:
+            return await to_thread(self.refresh_mark, mark)
+
     def __hash__(self):
         return hash_anything((type(self), self._value, self.metadata, self.segments))
 
@@ -44,10 +75,36 @@ class SyncItem(metaclass=abc.ABCMeta):
             return False
 
 
+_RESUME_LOCKS: Dict[str, Tuple[threading.Lock, List[int]]] = {}
+_RESUME_LOCKS_LOCK = threading.Lock()
+
+
+@contextmanager
+def _resume_lock(directory: str):
+    # lock of the resume directory, removed when no one is using it
+    with _RESUME_LOCKS_LOCK:
+        lock, users = _RESUME_LOCKS.setdefault(directory, (threading.Lock(), [0]))
+        users[0] += 1
+    try:
+        with lock:
+            yield
+    finally:
+        with _RESUME_LOCKS_LOCK:
+            users[0] -= 1
+            if users[0] == 0:
+                del _RESUME_LOCKS[directory]
+
+
 class RemoteSyncItem(SyncItem):
     __type__ = 'remote'
+    __mark_requests__ = True
+    __owned_file__ = True
+    __digest_mark__ = True
     __headers__ = {}
     __request_kwargs__ = {}
+    __download_segments__ = 1  # max parallel range segments of the large files, 1 means a single stream
+    __resume_dir__: Optional[str] = None  # directory to keep the partial downloads for the next runs
+    __slots__ = ('url', '_session')
 
     def __init__(self, url, metadata, segments: List[str]):
         SyncItem.__init__(self, url, metadata, segments)
@@ -55,7 +112,8 @@ class RemoteSyncItem(SyncItem):
         self._session = None
 
     def get_new_session(self):
-        return get_requests_session(headers=self.__headers__)
+        # the items with the same headers share one session, so the connections are reused
+        return get_shared_session(headers=self.__headers__)
 
     def _get_session(self) -> requests.Session:
         if self._session is None:
@@ -66,41 +124,72 @@ class RemoteSyncItem(SyncItem):
     def _file_process(self, filename):
         pass
 
+    def _keeps_digests(self) -> bool:
+        # the digests computed when downloading are lost when the file is processed
+        return type(self)._file_process is RemoteSyncItem._file_process
+
+    @contextmanager
+    def _download_directory(self) -> ContextManager[str]:
+        if self.__resume_dir__ is None:
+            with TemporaryDirectory() as td:
+                yield td
+        else:
+            # the same directory for the same url and target, it is kept when the download failed
+            key = '\n'.join([self.url, '/'.join(self.segments)])
+            td = os.path.join(self.__resume_dir__, sha1(key.encode()).hexdigest())
+            with _resume_lock(td):  # the same item may be loaded by several threads
+                os.makedirs(td, exist_ok=True)
+                yield td
+                shutil.rmtree(td, ignore_errors=True)
+
     @contextmanager
     def load_file(self) -> ContextManager[str]:
-        with TemporaryDirectory() as td:
+        with self._download_directory() as td:
             filename = os.path.join(td, urlsplit(self.url).filename or 'unnamed_file')
-            download_file(self.url, filename, session=self._get_session(), **self.__request_kwargs__)
-            self._file_process(filename)
-            yield filename
+            download_file(self.url, filename, session=self._get_session(), segments=self.__download_segments__,
+                          resume=self.__resume_dir__ is not None, digests=self._keeps_digests(),
+                          **self.__request_kwargs__)
+            try:
+                self._file_process(filename)
+                yield filename
+            finally:
+                release_file_digests(filename)
+
+    @asynccontextmanager
+    async def aload_file(self, session=None) -> AsyncContextManager[str]:
+        if type(self).load_file is not RemoteSyncItem.load_file:  # customized blocking loader
+            async with SyncItem.aload_file(self, session) as filename:
+                yield filename
+            return
 
-    def refresh_mark(self, mark: Optional[Dict[str, Any]]):
-        mark = dict(mark or {})
+        with TemporaryDirectory() as td:
+            filename = os.path.join(td, urlsplit(self.url).filename or 'unnamed_file')
+            await adownload_file(self.url, filename, session=session, headers=self._request_headers({}),
+                                 digests=self._keeps_digests())
+            try:
+                await to_thread(self._file_process, filename)
+                yield filename
+            finally:
+                release_file_digests(filename)
+
+    def _mark_request_headers(self, mark: Dict[str, Any]) -> Dict[str, str]:
         url = mark.get('url')
         if url == self.url:  # url not changed
             expires = mark.get('expires')
             if expires is not None and time.time() < expires:
-                raise ResourceNotChange
+                raise ResourceNotChange(requested=False)
 
             etag = mark.get('etag')
-            headers = {'If-None-Match': etag} if etag else {}
+            return {'If-None-Match': etag} if etag else {}
         else:
-            headers = {}
-
-        kwargs = self.__request_kwargs__.copy()
-        if 'headers' in kwargs:
-            headers.update(kwargs['headers'])
-            kwargs.pop('headers')
+            return {}
 
-        resp = srequest(
-            self._get_session(), 'HEAD', self.url,
-            allow_redirects=True, headers=headers,
-            **kwargs
-        )
-        if resp.status_code == 304:
-            raise ResourceNotChange
+    def _request_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        # headers of the async requests, which can not be set to a shared session
+        # only the headers in __request_kwargs__ are used, other kwargs are for requests
+        return {**self.__headers__, **headers, **self.__request_kwargs__.get('headers', {})}
 
-        headers = resp.headers
+    def _mark_from_headers(self, headers: Mapping[str, str]) -> Dict[str, Any]:
         etag = headers.get('ETag')
         expires = headers.get('Expires')
         expires = parsedate_to_datetime(expires).timestamp() if expires else None
@@ -116,12 +205,49 @@ class RemoteSyncItem(SyncItem):
             'content_type': content_type,
         }
 
+    def refresh_mark(self, mark: Optional[Dict[str, Any]]):
+        headers = self._mark_request_headers(dict(mark or {}))
+        kwargs = self.__request_kwargs__.copy()
+        if 'headers' in kwargs:
+            headers.update(kwargs['headers'])
+            kwargs.pop('headers')
+
+        resp = srequest(
+            self._get_session(), 'HEAD', self.url,
+            allow_redirects=True, headers=headers,
+            **kwargs
+        )
+        if resp.status_code == 304:
+            raise ResourceNotChange
+
+        return self._mark_from_headers(resp.headers)
+
+    def stable_until(self, mark: Optional[Dict[str, Any]]) -> Optional[float]:
+        if mark and mark.get('url') == self.url and mark.get('expires') is not None:
+            return mark['expires']
+        else:
+            return 0
+
+    async def arefresh_mark(self, mark: Optional[Dict[str, Any]], session=None):
+        if type(self).refresh_mark is not RemoteSyncItem.refresh_mark:  # customized blocking refresher
+            return await SyncItem.arefresh_mark(self, mark, session)
+
+        headers = self._request_headers(self._mark_request_headers(dict(mark or {})))
+        async with optional_aiohttp_session(session) as session:
+            resp = await asrequest(session, 'HEAD', self.url, allow_redirects=True, headers=headers)
+            async with resp:
+                if resp.status == 304:
+                    raise ResourceNotChange
+
+                return self._mark_from_headers(resp.headers)
+
     def __repr__(self):
         return f'<{self.__class__.__name__} url: {self.url!r}>'
 
 
 class CustomSyncItem(SyncItem):
     __type__ = 'custom'
+    __slots__ = ('gene',)
 
     def __init__(self, gene, metadata, segments):
         SyncItem.__init__(self, gene, metadata, segments)
@@ -138,6 +264,8 @@ class CustomSyncItem(SyncItem):
 
 class TextOutputSyncItem(SyncItem):
     __type__ = 'text'
+    __owned_file__ = True
+    __slots__ = ('content',)
 
     def __init__(self, content, metadata, segments):
         SyncItem.__init__(self, content, metadata, segments)
@@ -152,12 +280,16 @@ class TextOutputSyncItem(SyncItem):
 
             yield filename
 
+    def stable_until(self, mark: Optional[Dict[str, Any]]) -> Optional[float]:
+        return None
+
     def __repr__(self):
         return f'<{self.__class__.__name__} content: {truncate(self.content, tail_length=15, show_length=True)!r}>'
 
 
 class LocalFileSyncItem(SyncItem):
     __type__ = 'local'
+    __slots__ = ('filename',)
 
     def __init__(self, filename, metadata, segments):
         SyncItem.__init__(self, filename, metadata, segments)
@@ -168,7 +300,7 @@ class LocalFileSyncItem(SyncItem):
         yield self.filename
 
 
-_PRESERVED_NAMES = {'metadata'}
+_PRESERVED_NAMES = {'metadata', '__complete__'}
 _REGISTERED_SYNC_TYPES: Dict[str, Type[SyncItem]] = {}
 
 
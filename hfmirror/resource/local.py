@@ -14,8 +14,10 @@ class LocalDirectoryResource(SyncResource):
         Tuple[str, Any, TargetPathType, Mapping],
         Tuple[str, Any, TargetPathType],
     ]]:
-        for root, dirs, files in os.walk(self.directory):
+        # bottom-up, so all the sub-directories are completed before their parent
+        for root, dirs, files in os.walk(self.directory, topdown=False):
             for file in files:
                 path = os.path.abspath(os.path.join(root, file))
                 relpath = os.path.relpath(path, self.directory)
                 yield 'local', path, relpath
+            yield '__complete__', None, os.path.relpath(root, self.directory)
@@ -1,7 +1,7 @@
 import io
 import warnings
 from operator import itemgetter
-from typing import Tuple, List, Mapping, Any, Iterable, Union, Dict, Callable
+from typing import Tuple, List, Mapping, Any, Iterable, Union, Dict, Callable, Optional
 
 from hbutils.string.tree import format_tree
 
@@ -10,6 +10,8 @@ from ..utils import hash_anything, to_segments, TargetPathType, text_concat, tex
 
 
 class MetadataItem:
+    __slots__ = ('data', 'segments')
+
     def __init__(self, data: Mapping, segments: List[str]):
         self.data = data
         self.segments = segments
@@ -29,6 +31,27 @@ class MetadataItem:
         return f'<{self.__class__.__name__} data: {self.data!r}>'
 
 
+class CompleteItem:
+    __slots__ = ('segments',)
+
+    def __init__(self, segments: List[str]):
+        self.segments = segments
+
+    def __hash__(self):
+        return hash_anything((self.__class__, self.segments))
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, CompleteItem):
+            return self.segments == other.segments
+        else:
+            return False
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} path: {"/".join(self.segments)!r}>'
+
+
 def _metadata_repr(metadata: Mapping):
     with io.StringIO() as f:
         for key in sorted(metadata.keys()):
@@ -38,60 +61,65 @@ def _metadata_repr(metadata: Mapping):
 
 
 class SyncTree:
+    # there may be millions of trees and items, so no __dict__ for them
+    __slots__ = ('metadata', 'items')
+
     def __init__(self):
         self.metadata: dict = {}
         self.items: Dict[str, Union[SyncItem, SyncTree]] = {}
 
     def _add_item_with_segment(self, item: SyncItem, segments: List[str]):
-        current = segments[0]
-        if len(segments) > 1:  # still a path
-            if current not in self.items or isinstance(self.items[current], SyncTree):
-                if current not in self.items:
-                    self.items[current] = SyncTree()
-                self.items[current]._add_item_with_segment(item, segments[1:])
-            elif isinstance(self.items[current], SyncItem):
-                raise TypeError(f'Sync item ({"/".join(segments)}) is an item, '
+        # iterative, without slicing the segments at each level
+        node = self
+        for i, current in enumerate(segments[:-1]):
+            child = node.items.get(current)
+            if child is None:
+                child = node.items[current] = SyncTree()
+            elif isinstance(child, SyncItem):
+                raise TypeError(f'Sync item ({"/".join(segments[i:])}) is an item, '
                                 f'unable to be set a child item ({item!r}) for it.')
-            else:
-                assert False, 'Unable to reach here #1, ' \
-                              'please open an issue to let the author know.'  # pragma: no cover
-
-        else:  # is a file
-            if current not in self.items:
-                self.items[current] = item
-            elif isinstance(self.items[current], SyncItem):
-                warnings.warn(f'Sync item ({self.items[current]!r}) at {"/".join(segments)} '
-                              f'will be replaced by {item!r}.')
-                self.items[current] = item
-            elif isinstance(self.items[current], SyncTree):
-                raise TypeError(f'Sync position ({"/".join(segments)}) is a folder, '
-                                f'unable to be replace with item {item!r}.')
-            else:
-                assert False, 'Unable to reach here #2, ' \
-                              'please open an issue to let the author know.'  # pragma: no cover
+            elif type(child)._add_item_with_segment is not SyncTree._add_item_with_segment:
+                child._add_item_with_segment(item, segments[i + 1:])  # customized sub-tree
+                return
+            node = child
+
+        current = segments[-1]
+        existing = node.items.get(current)
+        if existing is None:
+            node.items[current] = item
+        elif isinstance(existing, SyncItem):
+            warnings.warn(f'Sync item ({existing!r}) at {current} will be replaced by {item!r}.')
+            node.items[current] = item
+        elif isinstance(existing, SyncTree):
+            raise TypeError(f'Sync position ({current}) is a folder, '
+                            f'unable to be replace with item {item!r}.')
+        else:
+            assert False, 'Unable to reach here #2, ' \
+                          'please open an issue to let the author know.'  # pragma: no cover
 
     def add_item(self, item: SyncItem):
         self._add_item_with_segment(item, item.segments)
 
     def _add_meta_item_with_segment(self, item: MetadataItem, segments: List[str]):
-        if not segments:
-            self.metadata.update(**item.data)
-        else:
-            current = segments[0]
-            if current not in self.items:
-                self.items[current] = SyncTree()
-
-            if isinstance(self.items[current], SyncItem):
-                if len(segments) == 1:
-                    self.items[current].metadata.update(**item.data)
+        node = self
+        for i, current in enumerate(segments):
+            child = node.items.get(current)
+            if child is None:
+                child = node.items[current] = SyncTree()
+
+            if isinstance(child, SyncItem):
+                if i == len(segments) - 1:
+                    child.metadata.update(**item.data)
+                    return
                 else:
-                    raise TypeError(f'Unable to set metadata {item.data!r} with position {"/".join(segments)} to '
-                                    f'the child position of an item {"/".join(self.items[current].segments)}.')
-            elif isinstance(self.items[current], SyncTree):
-                self.items[current]._add_meta_item_with_segment(item, segments[1:])
-            else:
-                assert False, 'Unable to reach here #3, ' \
-                              'please open an issue to let the author know.'  # pragma: no cover
+                    raise TypeError(f'Unable to set metadata {item.data!r} with position {"/".join(segments[i:])} '
+                                    f'to the child position of an item {"/".join(child.segments)}.')
+            elif type(child)._add_meta_item_with_segment is not SyncTree._add_meta_item_with_segment:
+                child._add_meta_item_with_segment(item, segments[i + 1:])  # customized sub-tree
+                return
+            node = child
+
+        node.metadata.update(**item.data)
 
     def add_meta_item(self, item: MetadataItem):
         self._add_meta_item_with_segment(item, item.segments)
@@ -126,7 +154,7 @@ class SyncTree:
             return False
 
 
-SyncItemType = Union[SyncItem, MetadataItem]
+SyncItemType = Union[SyncItem, MetadataItem, CompleteItem]
 
 
 class SyncResource:
@@ -166,6 +194,13 @@ class SyncResource:
                                           f'will be ignored when defining metadata.')
                         yield MetadataItem(value, segments)
 
+                    elif type_ == '__complete__':
+                        # all the items inside this directory have been yielded
+                        if value is not None or attached_data:
+                            warnings.warn(f'Value {value!r} and attached data {attached_data!r} '
+                                          f'for position {tpl!r} will be ignored when completing directory.')
+                        yield CompleteItem(segments)
+
                     else:
                         assert False, f'Undefined preserved operation - {type_!r}, ' \
                                       f'please notice the author about this.'  # pragma: no cover
@@ -177,13 +212,14 @@ class SyncResource:
             else:
                 raise TypeError(f'Invalid sync type data - {tpl!r}.')
 
-    def sync_tree(self) -> SyncTree:
+    def sync_tree(self, items: Optional[Iterable[SyncItemType]] = None) -> SyncTree:
+        # items is None, build the tree with the items grabbed by iter_sync_items
         tree = SyncTree()
         meta_items: List[MetadataItem] = []
-        for item in self.iter_sync_items():
+        for item in (items if items is not None else self.iter_sync_items()):
             if isinstance(item, MetadataItem):
                 meta_items.append(item)
-            else:
+            elif isinstance(item, SyncItem):
                 tree.add_item(item)
 
         for item in meta_items:
@@ -10,11 +10,11 @@ from tqdm.auto import tqdm
 
 from .item import RemoteSyncItem, register_sync_type
 from .version import VersionBasedResource
-from ..utils import TargetPathType, srequest, get_requests_session, to_segments
+from ..utils import TargetPathType, srequest, get_shared_session, to_segments
 
 
 def _iterdir_on_sourceforge(url, segments, session=None) -> Iterable[Tuple[str, str, str]]:
-    session = session or get_requests_session()
+    session = session or get_shared_session()
     resp = srequest(session, 'GET', url)
 
     list_tqdm = tqdm(list(pq(resp.text)('#files_list tbody > tr').items()))
@@ -64,7 +64,7 @@ class SourceForgeFilesResource(VersionBasedResource):
         return None
 
     def _walk_on_sourceforge(self, url, segments, session=None):
-        session = session or get_requests_session()
+        session = session or get_shared_session()
         for type_, name, download_url in _iterdir_on_sourceforge(url, segments, session):
             current_segments = [*segments, name]
             _to_segments = self._process_segments(type_, current_segments)
@@ -72,14 +72,19 @@ class SourceForgeFilesResource(VersionBasedResource):
                 yield type_, _to_segments, download_url
                 if type_ == 'directory':
                     yield from self._walk_on_sourceforge(download_url, current_segments, session)
+                    yield 'complete', _to_segments, None
 
     def grab_for_items(self) -> Iterable[Union[
         Tuple[str, Any, TargetPathType, Mapping],
         Tuple[str, Any, TargetPathType],
     ]]:
         yield 'metadata', {'source': self.root_url}, ''
-        session = get_requests_session()
+        session = get_shared_session()
         for type_, segments, download_url in self._walk_on_sourceforge(self.root_url, [], session):
+            if type_ == 'complete':
+                yield '__complete__', None, segments
+                continue
+
             if type_ == 'file':
                 yield 'wget', download_url, segments
             else:  # directory
@@ -1,4 +1,6 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Dict
+
+from ..utils import to_thread
 
 
 class BaseStorage:
@@ -11,5 +13,32 @@ class BaseStorage:
     def read_text(self, file: List[str], encoding: str = 'utf-8') -> str:
         raise NotImplementedError  # pragma: no cover
 
+    def read_binary(self, file: List[str]) -> bytes:
+        raise NotImplementedError  # pragma: no cover
+
     def batch_change_files(self, changes: List[Tuple[Optional[str], List[str]]]):
         raise NotImplementedError  # pragma: no cover
+
+    def read_all_texts(self, filename: str, encoding: str = 'utf-8') -> Optional[Dict[Tuple[str, ...], str]]:
+        # read all the files named `filename`, mapped from the segments of their directories
+        # None means not supported, and the files should be read one by one
+        return None
+
+    # async versions of the methods above, used by AsyncSyncTask
+    # the blocking methods are called in threads by default, override them with native async implementations
+
+    async def afile_exists(self, file: List[str]) -> bool:
+        return await to_thread(self.file_exists, file)
+
+    async def aread_text(self, file: List[str], encoding: str = 'utf-8') -> str:
+        return await to_thread(self.read_text, file, encoding)
+
+    async def aread_binary(self, file: List[str]) -> bytes:
+        return await to_thread(self.read_binary, file)
+
+    async def abatch_change_files(self, changes: List[Tuple[Optional[str], List[str]]]):
+        return await to_thread(self.batch_change_files, changes)
+
+    async def aread_all_texts(self, filename: str, encoding: str = 'utf-8') \
+            -> Optional[Dict[Tuple[str, ...], str]]:
+        return await to_thread(self.read_all_texts, filename, encoding)
@@ -1,22 +1,25 @@
 import datetime
 import os
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial, lru_cache
-from hashlib import sha256, sha1
 from typing import List, Tuple, Optional, Union, Dict
 
 from huggingface_hub import HfApi, hf_hub_url, CommitOperationAdd, CommitOperationDelete, configure_http_backend
+from huggingface_hub.utils import RepositoryNotFoundError, RevisionNotFoundError
 
 from .base import BaseStorage
-from ..utils import to_segments, srequest, get_requests_session
+from ..utils import to_segments, srequest, get_shared_session, RetryPolicy, file_digest
 
 DEFAULT_TIMEOUT: int = 10
 
 
 @lru_cache()
 def _register_session_for_hf(max_retries: int = 5, timeout: int = DEFAULT_TIMEOUT,
-                             headers: Optional[Dict[str, str]] = None):
-    configure_http_backend(backend_factory=partial(get_requests_session, max_retries, timeout, headers))
+                             headers: Optional[Dict[str, str]] = None, retry_policy: Optional[RetryPolicy] = None):
+    # all the threads of huggingface hub share the same session, and the same retry policy
+    configure_http_backend(backend_factory=partial(get_shared_session, max_retries, timeout, headers,
+                                                   retry_policy=retry_policy))
 
 
 def _single_resource_is_duplicated(local_filename: str, is_lfs: bool, oid: str, filesize: int,
@@ -24,20 +27,8 @@ def _single_resource_is_duplicated(local_filename: str, is_lfs: bool, oid: str,
     if filesize != os.path.getsize(local_filename):
         return False
 
-    if is_lfs:
-        sha = sha256()
-    else:
-        sha = sha1()
-        sha.update(f'blob {filesize}\0'.encode('utf-8'))
-    with open(local_filename, 'rb') as f:
-        # make sure the big files will not cause OOM
-        while True:
-            data = f.read(chunk_for_hash)
-            if not data:
-                break
-            sha.update(data)
-
-    return sha.hexdigest() == oid
+    # the digests computed when downloading are reused, the file is not read again
+    return file_digest(local_filename, 'sha256' if is_lfs else 'git_sha1', chunk_for_hash) == oid
 
 
 def hf_local_upload_check(uploads: List[Tuple[Optional[str], str]],
@@ -53,13 +44,13 @@ def hf_local_upload_check(uploads: List[Tuple[Optional[str], str]],
     :param repo_type: Repository type, the same as that in huggingface library.
     :param revision: Revision of repository, the same as that in huggingface library.
     :param chunk_for_hash: Chunk size for hashing calculation.
-    :param session: Session of requests, will be auto created when not given.
+    :param session: Session of requests, the shared session will be used when not given.
     :return: Uploads are necessary or not, in form of lists of boolean.
     """
     if not uploads:
         return []
 
-    session = session or get_requests_session()
+    session = session or get_shared_session()
     files_in_repo = [f for _, f in uploads]
     resp = srequest(
         session,
@@ -105,7 +96,7 @@ def _check_repo_type(repo_type):
 class HuggingfaceStorage(BaseStorage):
     def __init__(self, repo: str, repo_type: str = 'dataset', revision: str = 'main',
                  hf_client: Optional[HfApi] = None, access_token: Optional[str] = None,
-                 namespace: Union[List[str], str, None] = None):
+                 namespace: Union[List[str], str, None] = None, retry_policy: Optional[RetryPolicy] = None):
         if hf_client and access_token:
             warnings.warn('Huggingface client provided, so access token will be ignored.', stacklevel=2)
         self.hf_client = hf_client or HfApi(token=access_token)
@@ -113,7 +104,9 @@ class HuggingfaceStorage(BaseStorage):
         self.repo_type = _check_repo_type(repo_type)
         self.revision = revision
         self.namespace = to_segments(namespace or [])
-        self.session = get_requests_session()
+        # retry_policy is shared by the session of this storage and the sessions of huggingface hub
+        self.retry_policy = retry_policy
+        self.session = get_shared_session(retry_policy=retry_policy)
 
     def path_join(self, path, *segments):
         return '/'.join((*self.namespace, path, *segments))
@@ -131,10 +124,33 @@ class HuggingfaceStorage(BaseStorage):
             resp.raise_for_status()  # pragma: no cover
 
     def read_text(self, file: List[str], encoding: str = 'utf-8') -> str:
-        return srequest(self.session, 'GET', self._file_url(file)).content.decode(encoding=encoding)
+        return self.read_binary(file).decode(encoding=encoding)
+
+    def read_binary(self, file: List[str]) -> bytes:
+        return srequest(self.session, 'GET', self._file_url(file)).content
+
+    def read_all_texts(self, filename: str, encoding: str = 'utf-8', workers: int = 8) \
+            -> Optional[Dict[Tuple[str, ...], str]]:
+        _register_session_for_hf(retry_policy=self.retry_policy)
+        try:
+            # one listing of the whole repository, instead of checking the files one by one
+            files_in_repo = self.hf_client.list_repo_files(self.repo, repo_type=self.repo_type, revision=self.revision)
+        except (RepositoryNotFoundError, RevisionNotFoundError):
+            return {}
+
+        directories = []
+        for file_in_repo in files_in_repo:
+            segments = file_in_repo.split('/')
+            if segments[-1] == filename and segments[:len(self.namespace)] == self.namespace:
+                directories.append(segments[len(self.namespace):-1])
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            texts = list(executor.map(lambda x: self.read_text([*x, filename], encoding), directories))
+
+        return {tuple(segments): text for segments, text in zip(directories, texts)}
 
     def batch_change_files(self, changes: List[Tuple[Optional[str], List[str]]]):
-        _register_session_for_hf()
+        _register_session_for_hf(retry_policy=self.retry_policy)
 
         _map_changes = {}
         for local_filename, file_in_repo in changes:
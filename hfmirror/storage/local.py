@@ -1,13 +1,13 @@
 import os.path
 import pathlib
 from contextlib import contextmanager
-from typing import List, Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union, Dict
 
 from hbutils.system import copy, remove
 from hbutils.system.filesystem.tempfile import TemporaryDirectory
 
 from .base import BaseStorage
-from ..utils import to_segments
+from ..utils import to_segments, clone_file
 
 
 class LocalStorage(BaseStorage):
@@ -26,6 +26,20 @@ class LocalStorage(BaseStorage):
         file = self.path_join(*file)
         return pathlib.Path(file).read_text(encoding=encoding)
 
+    def read_binary(self, file: List[str]) -> bytes:
+        file = self.path_join(*file)
+        return pathlib.Path(file).read_bytes()
+
+    def read_all_texts(self, filename: str, encoding: str = 'utf-8') -> Optional[Dict[Tuple[str, ...], str]]:
+        root = os.path.join(self.root_directory, *self.namespace)
+        texts = {}
+        for directory, _, files in os.walk(root):
+            if filename in files:
+                segments = tuple(to_segments(os.path.relpath(directory, root)))
+                texts[segments] = pathlib.Path(directory, filename).read_text(encoding=encoding)
+
+        return texts
+
     @contextmanager
     def recover_state_when_failed(self, state: List[List[str]]):
         with TemporaryDirectory() as td:
@@ -36,7 +50,7 @@ class LocalStorage(BaseStorage):
                 if os.path.exists(file_in_storage):
                     file_in_temp = os.path.join(td, f'{i}', os.path.basename(file_in_storage))
                     os.makedirs(os.path.join(td, f'{i}'), exist_ok=True)
-                    copy(file_in_storage, file_in_temp)
+                    clone_file(file_in_storage, file_in_temp)
                     records.append(file_in_temp)
                 else:
                     records.append(None)
@@ -70,4 +84,4 @@ class LocalStorage(BaseStorage):
                     directory = os.path.dirname(file_in_storage)
                     if directory:
                         os.makedirs(directory, exist_ok=True)
-                    copy(local_file, file_in_storage)
+                    clone_file(local_file, file_in_storage)
@@ -1 +1,9 @@
+from .aio import AsyncSyncTask
+from .batch import BatchPolicy, CountBatchPolicy, BudgetBatchPolicy, AdaptiveBatchPolicy, FlushDecision
+from .fanout import FanoutSyncTask
+from .lanes import SizeLanes
+from .metafile import MetaFormat, JsonMetaFormat, JsonLinesMetaFormat, MsgpackMetaFormat
+from .metrics import SyncReport
+from .plan import DirectoryPlan, SyncPlan
+from .shard import ShardManifest, sync_shards
 from .sync import SyncTask
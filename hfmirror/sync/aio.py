@@ -0,0 +1,192 @@
+import asyncio
+import os.path
+import time
+from typing import List, Tuple, Dict, Optional, Callable
+
+from hbutils.system.filesystem.tempfile import TemporaryDirectory
+from tqdm.auto import tqdm
+
+from .batch import BatchType, FlushDecision
+from .journal import SyncJournal
+from .marks import arefresh_marks
+from .metafile import MetaFormatType
+from .metrics import SyncReport
+from .plan import DirectoryPlan, SyncPlan
+from .scheduler import AsyncLoadScheduler
+from .sync import SyncTask, _SyncContext, _StagedChanges, _MetaDataType, _count_trees, _merge_metas
+from ..resource import SyncResource, SyncTree, SyncItem
+from ..storage import BaseStorage
+from ..utils import get_aiohttp_session, to_thread
+
+
+class AsyncSyncTask(SyncTask):
+    """
+    Overview:
+        Asyncio-native version of :class:`hfmirror.sync.SyncTask`, which runs on one event loop, \
+        so that lots of tasks can be synced in one process.
+
+        The marks and files are refreshed and loaded with :meth:`SyncItem.arefresh_mark` and \
+        :meth:`SyncItem.aload_file` through one shared aiohttp session, and the storage is accessed \
+        with its async methods (e.g. :meth:`BaseStorage.abatch_change_files`). The blocking parts, \
+        such as grabbing the resource and the items or storages without native async implementations, \
+        are run in the default executor of the event loop.
+
+        The stream mode is not supported yet.
+
+    Examples::
+        >>> import asyncio
+        >>> asyncio.run(AsyncSyncTask(resource, storage, concurrency=32).sync())
+    """
+
+    def __init__(self, resource: SyncResource, storage: BaseStorage, meta_filename='.meta.json',
+                 batch: BatchType = 50, concurrency: int = 16, mark_concurrency: Optional[int] = None,
+                 on_flush: Optional[Callable[[FlushDecision], None]] = None, journal: Optional[str] = None,
+                 prefetch_meta: bool = False, staging_dir: Optional[str] = None, skip_unchanged: bool = False,
+                 on_report: Optional[Callable[[SyncReport], None]] = None, meta_format: MetaFormatType = 'json'):
+        SyncTask.__init__(self, resource, storage, meta_filename, batch, on_flush=on_flush, journal=journal,
+                          prefetch_meta=prefetch_meta, staging_dir=staging_dir, skip_unchanged=skip_unchanged,
+                          on_report=on_report, meta_format=meta_format)
+
+        # concurrency, max number of files loaded at the same time
+        self.concurrency = concurrency
+
+        # mark_concurrency, max number of marks refreshed at the same time, the same as concurrency when not given
+        self.mark_concurrency = mark_concurrency or concurrency
+
+    async def _acommit(self, changes: List[Tuple[Optional[str], List[str]]], decision: FlushDecision,
+                       journal: Optional[SyncJournal]):
+        start_time = time.time()
+        await self.storage.abatch_change_files(changes)
+        decision.seconds = time.time() - start_time
+        self._after_commit(changes, decision, journal)
+
+    async def _aflush(self, preserved: _StagedChanges, decision: FlushDecision):
+        await self._acommit(preserved.changes, decision, preserved.journal)
+        self._cleanup(preserved.clear)
+
+    def _tree_segments(self, tree: SyncTree, segments: List[str], ctx: _SyncContext) -> List[List[str]]:
+        retval = [segments]
+        for key, value in tree.items.items():
+            folder_segments = [*segments, key]
+            if isinstance(value, SyncTree) and \
+                    not (ctx.journal is not None and ctx.journal.is_finished(folder_segments)):
+                retval.extend(self._tree_segments(value, folder_segments, ctx))
+        return retval
+
+    async def _aread_old_metas(self, tree: SyncTree, ctx: _SyncContext) -> Dict[Tuple[str, ...], _MetaDataType]:
+        if self.prefetch_meta and not self.meta_format.__binary__:
+            old_metas = _merge_metas(
+                await self.storage.aread_all_texts(self.meta_filename),
+                await self.storage.aread_all_texts(self.legacy_meta_filename) if self._has_legacy_meta else {},
+            )
+            if old_metas is not None:
+                return old_metas
+
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+
+        async def _read(segments: List[str]) -> Optional[_MetaDataType]:
+            meta_file_segments = [*segments, self.meta_filename]
+            legacy_file_segments = [*segments, self.legacy_meta_filename]
+            async with semaphore:
+                if await self.storage.afile_exists(meta_file_segments):
+                    if self.meta_format.__binary__:
+                        return await self.storage.aread_binary(meta_file_segments), False
+                    else:
+                        return await self.storage.aread_text(meta_file_segments), False
+                elif self._has_legacy_meta and await self.storage.afile_exists(legacy_file_segments):
+                    return await self.storage.aread_text(legacy_file_segments), True
+                else:
+                    return None
+
+        all_segments = self._tree_segments(tree, [], ctx)
+        metas = await asyncio.gather(*[_read(segments) for segments in all_segments])
+        return {tuple(segments): meta for segments, meta in zip(all_segments, metas) if meta is not None}
+
+    async def _aplan_tree(self, tree: SyncTree, ctx: _SyncContext, session) -> List[DirectoryPlan]:
+        start_time = time.time()
+        ctx.old_metas = await self._aread_old_metas(tree, ctx)
+        self.report.add_phase('meta_read', time.time() - start_time)
+        states: List[DirectoryPlan] = []
+        if ctx.journal is None or not ctx.journal.is_finished([]):
+            self._collect_trees(tree, [], states, ctx)
+
+        start_time = time.time()
+        marks = await arefresh_marks(self._mark_jobs(states), self.mark_concurrency, self.mark_stats, session=session)
+        self.report.add_phase('mark', time.time() - start_time)
+        self._set_marks(states, marks)
+        return states
+
+    async def _astage_changes(self, changes: List[Tuple[Optional[str], List[str]]],
+                              need_load_files: List[Tuple[str, SyncItem, dict]], ctx: _SyncContext):
+        preserved = ctx.preserved
+        if self.batch_policy.immediate:
+            if not changes:
+                return  # nothing to commit
+            sizes = [os.path.getsize(file) for file, _ in changes if file is not None]
+            await self._acommit(changes, FlushDecision('immediate', len(changes), sum(sizes)), ctx.journal)
+        else:
+            for i, (local_file, remote_segs) in enumerate(changes):
+                size = os.path.getsize(local_file) if local_file is not None else 0
+                decision = self.batch_policy.before_add(len(preserved), preserved.size, size)
+                if decision is not None:
+                    await self._aflush(preserved, decision)
+                self._stage_change(i, local_file, remote_segs, size, need_load_files, ctx)
+
+            decision = self.batch_policy.after_directory(len(preserved), preserved.size)
+            if decision is not None:
+                await self._aflush(preserved, decision)
+
+    async def _async_directory(self, state: DirectoryPlan, ctx: _SyncContext, scheduler: AsyncLoadScheduler):
+        meta_data, need_load_files = self._directory_meta(state, ctx)
+
+        async def _apply(file_paths: List[str]):
+            with TemporaryDirectory() as td:
+                changes = self._directory_changes(state, meta_data, need_load_files, file_paths, td)
+                await self._astage_changes(changes, need_load_files, ctx)
+            self._update_file_tqdm(len(need_load_files), ctx)
+
+        await scheduler.submit(self._directory_loaders(state, need_load_files, ctx), _apply)
+        ctx.tqdms[0].update()
+
+    async def plan(self) -> SyncPlan:
+        self._reset_stats()
+        tree: SyncTree = await to_thread(self._grab_tree)
+        ctx = _SyncContext(None, None, None)
+        async with get_aiohttp_session() as session:
+            states = await self._aplan_tree(tree, ctx, session)
+        return SyncPlan(states, self.batch_policy, ctx.stables, ctx.digests)
+
+    async def sync(self, plan: Optional[SyncPlan] = None) -> SyncReport:
+        if plan is None:  # or continue with the statistics of planning
+            self._reset_stats()
+        journal = SyncJournal(self.journal) if self.journal is not None else None
+        preserved = _StagedChanges(journal, self.staging_dir)
+        try:
+            async with get_aiohttp_session(limit=max(self.concurrency, self.mark_concurrency)) as session:
+                if plan is not None:
+                    tqdms = (tqdm(total=len(plan.directories)), tqdm(total=plan.total_files))
+                    ctx = _SyncContext(tqdms, preserved, None)
+                    states = self._planned_states(plan, ctx)
+                else:
+                    tree: SyncTree = await to_thread(self._grab_tree)
+                    total_trees, total_files = _count_trees(tree)
+                    ctx = _SyncContext(None, preserved, None)
+                    states = await self._aplan_tree(tree, ctx, session)
+                    ctx.tqdms = (tqdm(total=total_trees), tqdm(total=total_files))
+
+                async with AsyncLoadScheduler(self.concurrency, session=session) as scheduler:
+                    for state in states:
+                        await self._async_directory(state, ctx, scheduler)
+
+            if preserved:
+                await self._aflush(preserved, FlushDecision('final', len(preserved), preserved.size))
+        finally:
+            if journal is not None:
+                journal.close()
+
+        if journal is not None:
+            self._cleanup(journal.finish)
+        self.report.finish()
+        if self.on_report is not None:
+            self.on_report(self.report)
+        return self.report
@@ -0,0 +1,147 @@
+from typing import Optional, Union
+
+
+class FlushDecision:
+    def __init__(self, reason: str, operations: int, size: int):
+        self.reason = reason
+        self.operations = operations
+        self.size = size
+        self.seconds: Optional[float] = None  # time cost of the commit, set after committed
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, FlushDecision):
+            return (self.reason, self.operations, self.size) == (other.reason, other.operations, other.size)
+        else:
+            return False
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} reason: {self.reason!r}, ' \
+               f'operations: {self.operations!r}, size: {self.size!r}>'
+
+
+class BatchPolicy:
+    """
+    Overview:
+        Policy deciding when the staged changes should be committed to storage.
+
+        :meth:`before_add` is checked before each change is staged, and :meth:`after_directory` is \
+        checked after all the changes of a directory are staged. When a :class:`FlushDecision` is \
+        returned, the staged changes are committed, and the time cost is reported with :meth:`feedback`.
+    """
+
+    @property
+    def immediate(self) -> bool:
+        return False
+
+    def before_add(self, operations: int, size: int, new_size: int) -> Optional[FlushDecision]:
+        _ = operations, size, new_size
+        return None
+
+    def after_directory(self, operations: int, size: int) -> Optional[FlushDecision]:
+        raise NotImplementedError  # pragma: no cover
+
+    def feedback(self, operations: int, size: int, seconds: float):
+        pass
+
+
+class CountBatchPolicy(BatchPolicy):
+    def __init__(self, count: int):
+        # count < 0, do not submit until the end of sync
+        # count == 0, submit immediately every time
+        # count > 0, submit changes when changes over `count`
+        self.count = count
+
+    @property
+    def immediate(self) -> bool:
+        return self.count == 0
+
+    def after_directory(self, operations: int, size: int) -> Optional[FlushDecision]:
+        if 0 < self.count <= operations:
+            return FlushDecision('count', operations, size)
+        else:
+            return None
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} count: {self.count!r}>'
+
+
+class BudgetBatchPolicy(BatchPolicy):
+    def __init__(self, max_size: Optional[int] = None, max_operations: Optional[int] = None):
+        if max_size is None and max_operations is None:
+            raise ValueError('At least one of max_size and max_operations should be given.')
+        self.max_size = max_size
+        self.max_operations = max_operations
+
+    def before_add(self, operations: int, size: int, new_size: int) -> Optional[FlushDecision]:
+        if operations > 0:
+            if self.max_operations is not None and operations + 1 > self.max_operations:
+                return FlushDecision('operations', operations, size)
+            if self.max_size is not None and size + new_size > self.max_size:
+                return FlushDecision('size', operations, size)
+
+        return None
+
+    def after_directory(self, operations: int, size: int) -> Optional[FlushDecision]:
+        if self.max_operations is not None and operations >= self.max_operations:
+            return FlushDecision('operations', operations, size)
+        elif self.max_size is not None and size >= self.max_size:
+            return FlushDecision('size', operations, size)
+        else:
+            return None
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} max_size: {self.max_size!r}, max_operations: {self.max_operations!r}>'
+
+
+class AdaptiveBatchPolicy(BudgetBatchPolicy):
+    """
+    Overview:
+        Budget policy which resizes its budgets after each commit, so that one commit takes \
+        about ``target_seconds``. The throughputs (bytes and operations per second) are \
+        estimated with exponential moving average of the observed commits.
+    """
+
+    def __init__(self, target_seconds: float = 60.0,
+                 initial_size: int = 1 << 30, min_size: int = 16 << 20, max_size: int = 50 << 30,
+                 initial_operations: int = 500, min_operations: int = 10, max_operations: int = 10000,
+                 smoothing: float = 0.5):
+        BudgetBatchPolicy.__init__(self, initial_size, initial_operations)
+        self.target_seconds = target_seconds
+        self.size_range = (min_size, max_size)
+        self.operations_range = (min_operations, max_operations)
+        self.smoothing = smoothing
+        self.size_throughput: Optional[float] = None
+        self.operations_throughput: Optional[float] = None
+
+    def _smooth(self, old: Optional[float], new: float) -> float:
+        if old is None:
+            return new
+        else:
+            return self.smoothing * new + (1.0 - self.smoothing) * old
+
+    def feedback(self, operations: int, size: int, seconds: float):
+        if seconds <= 0:
+            return
+
+        if size > 0:  # commits of deletions only tell nothing about the bandwidth
+            self.size_throughput = self._smooth(self.size_throughput, size / seconds)
+            min_size, max_size = self.size_range
+            self.max_size = int(min(max(self.size_throughput * self.target_seconds, min_size), max_size))
+        self.operations_throughput = self._smooth(self.operations_throughput, operations / seconds)
+        min_operations, max_operations = self.operations_range
+        self.max_operations = int(min(max(
+            self.operations_throughput * self.target_seconds, min_operations), max_operations))
+
+
+BatchType = Union[int, BatchPolicy]
+
+
+def to_batch_policy(batch: BatchType) -> BatchPolicy:
+    if isinstance(batch, BatchPolicy):
+        return batch
+    elif isinstance(batch, int):
+        return CountBatchPolicy(batch)
+    else:
+        raise TypeError(f'Unknown batch type - {batch!r}.')
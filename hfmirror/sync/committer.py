@@ -0,0 +1,73 @@
+import queue
+import threading
+from typing import Callable, Optional
+
+
+class BackgroundCommitter:
+    """
+    Overview:
+        Write-behind committer, which calls ``commit`` in a background thread, \
+        so that the files of the next batch can be loaded while the current batch is being committed.
+
+        The batches are committed one by one in the order of submission. Once a commit fails, \
+        the rest batches are dropped, and the error is raised in the next :meth:`submit` or :meth:`join`.
+
+    :param commit: Function to commit a batch, called with the arguments of :meth:`submit`.
+    :param max_pending: Max number of batches waiting in the queue, :meth:`submit` will block \
+        when the queue is full.
+    """
+
+    def __init__(self, commit: Callable[..., None], max_pending: int = 1):
+        self.commit = commit
+        self.max_pending = max(max_pending, 1)
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='hfmirror-committer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    break
+
+                args, cleanup = job
+                if self._error is None:
+                    try:
+                        self.commit(*args)
+                    except BaseException as err:
+                        self._error = err
+                    else:
+                        if cleanup is not None:
+                            cleanup()
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, *args, cleanup: Optional[Callable[[], None]] = None):
+        # cleanup is called after the batch is committed successfully
+        self._check()
+        self._queue.put((args, cleanup))
+
+    def join(self):
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.join()
+        finally:
+            self.close()
@@ -0,0 +1,137 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple, Dict, Optional, Any, ContextManager, AsyncContextManager
+
+from hbutils.system.filesystem.tempfile import TemporaryDirectory
+from hbutils.system.network import urlsplit
+
+from .metrics import SyncReport
+from .plan import DirectoryPlan
+from ..resource import SyncItem, RemoteSyncItem
+from ..utils import FilePool, clone_file, thread_context, cached_file_digests, register_file_digests, \
+    release_file_digests
+
+
+def dedup_keys(item: SyncItem, mark: Optional[Dict[str, Any]]) -> List[Tuple]:
+    """
+    Overview:
+        Keys of the content of an item, the items with any key in common are regarded as the same file.
+
+        The remote items are keyed with their urls, and the items with strong ``etag`` and ``content_length`` \
+        in their marks are keyed with them and the host, because the etags are only meaningful on the same server.
+    """
+    keys = []
+    if isinstance(item, RemoteSyncItem):
+        keys.append(('url', item.__type__, item.url))
+        if isinstance(mark, dict):
+            etag, content_length = mark.get('etag'), mark.get('content_length')
+            if etag and not etag.startswith('W/') and content_length is not None:
+                keys.append(('etag', urlsplit(item.url).host, etag, content_length))
+    return keys
+
+
+class _DedupGroup:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.members = 0
+        self.count = 0  # items not loaded yet
+        self.filename: Optional[str] = None  # the loaded copy
+
+
+class _DedupItem:
+    # loader of an item in a group, the first one loads the file, and the others clone the loaded copy
+    __owned_file__ = True
+
+    def __init__(self, item, group: _DedupGroup, cache: 'DedupCache'):
+        self.item = item
+        self.group = group
+        self.cache = cache
+
+    @contextmanager
+    def load_file(self) -> ContextManager[str]:
+        group = self.group
+        with TemporaryDirectory() as td:
+            with group.lock:
+                if group.filename is None:
+                    with self.item.load_file() as loaded:
+                        group.filename = self.cache.file_pool.put_file(loaded, owned=self.item.__owned_file__)
+                else:
+                    self.cache.report.count('files_deduplicated')
+                    self.cache.report.count('bytes_deduplicated', os.path.getsize(group.filename))
+
+                filename = os.path.join(td, os.path.basename(group.filename))
+                digests = cached_file_digests(group.filename)
+                group.count -= 1
+                if group.count > 0:
+                    clone_file(group.filename, filename)
+                else:  # the last one takes the loaded copy away
+                    os.rename(group.filename, filename)
+                    release_file_digests(group.filename)
+                    group.filename = None
+
+            register_file_digests(filename, digests)
+            try:
+                yield filename
+            finally:
+                release_file_digests(filename)
+
+    def aload_file(self, session=None) -> AsyncContextManager[str]:
+        _ = session
+        return thread_context(self.load_file())
+
+
+class DedupCache:
+    """
+    Overview:
+        Deduplication of the items with the same content in one sync, found by :func:`dedup_keys` \
+        before loading. Only one copy of them is loaded, and it is kept until all of them are staged.
+
+    :param report: Report of the sync, ``files_deduplicated`` and ``bytes_deduplicated`` are counted to it.
+    :param staging_dir: Directory to keep the loaded copies, default is the system temporary directory.
+    """
+
+    def __init__(self, report: SyncReport, staging_dir: Optional[str] = None):
+        self.report = report
+        self.file_pool = FilePool(staging_dir, persistent=False)
+        self._groups: Dict[Tuple, _DedupGroup] = {}
+        self._item_groups: Dict[int, _DedupGroup] = {}
+
+    def register(self, states: List[DirectoryPlan]):
+        # find the groups of the items to load, before any of them is loaded
+        for state in states:
+            for (_, item), (need_load, mark) in zip(state.items, state.marks):
+                if not need_load:
+                    continue
+                keys = dedup_keys(item, mark)
+                if not keys:
+                    continue
+
+                group = next((self._groups[key] for key in keys if key in self._groups), None)
+                if group is None:
+                    group = _DedupGroup()
+                for key in keys:
+                    self._groups.setdefault(key, group)
+                with group.lock:
+                    group.members += 1
+                    group.count += 1
+                self._item_groups[id(item)] = group
+
+    def loader(self, item: SyncItem, loader):
+        # loader of the item, wrapped when it has duplicates
+        group = self._item_groups.pop(id(item), None)
+        if group is not None and group.members > 1:
+            return _DedupItem(loader, group, self)
+        else:
+            if group is not None:
+                with group.lock:
+                    group.count -= 1
+            return loader
+
+    def close(self):
+        self.file_pool.cleanup()
+        self._groups.clear()
+        self._item_groups.clear()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} groups: {len(set(map(id, self._groups.values())))!r}>'
@@ -0,0 +1,164 @@
+import json
+from typing import List, Tuple, Dict, Optional, Callable, Union, Sequence
+
+from hbutils.string import plural_word
+from hbutils.system.filesystem.tempfile import TemporaryDirectory
+from tqdm.auto import tqdm
+
+from .batch import BatchType, FlushDecision
+from .marks import refresh_marks, MarkRefreshStats
+from .metafile import MetaFormatType
+from .plan import DirectoryPlan, SyncPlan
+from .scheduler import LoadScheduler
+from .sync import SyncTask, _SyncContext, _StagedChanges, _count_trees
+from ..resource import SyncResource, SyncTree, SyncItem
+from ..storage import BaseStorage
+
+
+def _tree_order(tree: SyncTree, segments: List[str], order: List[Tuple[str, ...]]):
+    for key in sorted(tree.items.keys()):
+        value = tree.items[key]
+        if isinstance(value, SyncTree):
+            _tree_order(value, [*segments, key], order)
+    order.append(tuple(segments))
+
+
+class FanoutSyncTask:
+    """
+    Overview:
+        Sync one resource to several storages, e.g. a local cache and some huggingface repositories.
+
+        Each storage is synced with the state of its own meta files and its own batch policy, \
+        while each changed file is loaded only once and applied to all the storages which need it. \
+        The marks of the items are refreshed only once for the storages with the same old file data.
+
+        The journal, stream mode, pipeline and lanes of :class:`SyncTask` are not supported yet.
+
+    :param resource: Resource to sync.
+    :param storages: Storages to sync to.
+    :param batch: Batch policy of the storages, a list of them can be given for the storages separately.
+    :param on_flush: Callback when changes are committed to any storage, with the storage and the decision.
+
+    Examples::
+        >>> FanoutSyncTask(resource, [LocalStorage('cache'), repo_storage], batch=[0, 50], workers=8).sync()
+    """
+
+    def __init__(self, resource: SyncResource, storages: Sequence[BaseStorage], meta_filename='.meta.json',
+                 batch: Union[BatchType, Sequence[BatchType]] = 50, workers: int = 0, mark_workers: int = 0,
+                 on_flush: Optional[Callable[[BaseStorage, FlushDecision], None]] = None,
+                 prefetch_meta: bool = False, staging_dir: Optional[str] = None, skip_unchanged: bool = False,
+                 meta_format: MetaFormatType = 'json'):
+        self.resource = resource
+        self.storages = list(storages)
+        batches = list(batch) if isinstance(batch, (list, tuple)) else [batch] * len(self.storages)
+        if len(batches) != len(self.storages):
+            raise ValueError(f'Batch policies should be given for {len(self.storages)} storages, '
+                             f'but {len(batches)} found.')
+
+        self.targets: List[SyncTask] = [
+            SyncTask(
+                resource, storage, meta_filename, batch_,
+                on_flush=(lambda decision, s=storage: on_flush(s, decision)) if on_flush is not None else None,
+                prefetch_meta=prefetch_meta, staging_dir=staging_dir, skip_unchanged=skip_unchanged,
+                meta_format=meta_format,
+            )
+            for storage, batch_ in zip(self.storages, batches)
+        ]
+        self.workers = workers
+        self.mark_workers = mark_workers
+        self.mark_stats = MarkRefreshStats()
+
+    def _contexts(self) -> List[_SyncContext]:
+        ctxs = []
+        for target in self.targets:
+            # the progress is displayed by the fan-out task
+            tqdms = (tqdm(disable=True), tqdm(disable=True))
+            ctx = _SyncContext(tqdms, _StagedChanges(None, target.staging_dir), None, target._prefetch_metas())
+            ctx.shared_files = len(self.targets) > 1
+            ctxs.append(ctx)
+        return ctxs
+
+    def _plan_trees(self, tree: SyncTree, ctxs: List[_SyncContext]) -> List[List[DirectoryPlan]]:
+        all_states = []
+        for target, ctx in zip(self.targets, ctxs):
+            states = []
+            target._collect_trees(tree, [], states, ctx)
+            all_states.append(states)
+
+        # refresh the marks only once for the same item with the same old file data
+        jobs, job_ids, slots = [], {}, []
+        for target, states in zip(self.targets, all_states):
+            target_slots = []
+            for item, old_file_data in target._mark_jobs(states):
+                key = (id(item), json.dumps(old_file_data, sort_keys=True, default=repr))
+                if key not in job_ids:
+                    job_ids[key] = len(jobs)
+                    jobs.append((item, old_file_data))
+                target_slots.append(job_ids[key])
+            slots.append(target_slots)
+
+        marks = refresh_marks(jobs, self.mark_workers, self.mark_stats)
+        for target, states, target_slots in zip(self.targets, all_states, slots):
+            target._set_marks(states, [marks[i] for i in target_slots])
+        return all_states
+
+    def plan(self) -> List[SyncPlan]:
+        self.mark_stats = MarkRefreshStats()
+        tree: SyncTree = self.resource.sync_tree()
+        all_states = self._plan_trees(tree, self._contexts())
+        return [SyncPlan(states, target.batch_policy) for target, states in zip(self.targets, all_states)]
+
+    def _sync_directory(self, entries: List[Tuple[SyncTask, _SyncContext, DirectoryPlan]],
+                        scheduler: LoadScheduler, tqdms):
+        tree_tqdm, file_tqdm = tqdms
+        state = entries[0][2]
+        tree_tqdm.set_description('/'.join(state.segments))
+
+        directories = []
+        files: Dict[str, SyncItem] = {}
+        for target, ctx, target_state in entries:
+            meta_data, need_load_files = target._directory_meta(target_state, ctx)
+            directories.append((target, ctx, target_state, meta_data, need_load_files))
+            for key, item, _ in need_load_files:
+                files.setdefault(key, item)
+        keys = list(files.keys())
+
+        def _apply(file_paths: List[str]):
+            paths = dict(zip(keys, file_paths))
+            for target_, ctx_, state_, meta_data_, need_load_files_ in directories:
+                with TemporaryDirectory() as td:
+                    changes = target_._directory_changes(
+                        state_, meta_data_, need_load_files_, [paths[key_] for key_, _, _ in need_load_files_], td)
+                    target_._stage_changes(changes, need_load_files_, ctx_)
+            file_tqdm.update(len(state.items))
+            file_tqdm.set_description(plural_word(file_tqdm.n, 'file'))
+
+        scheduler.submit([files[key] for key in keys], _apply)
+        tree_tqdm.update()
+
+    def sync(self):
+        self.mark_stats = MarkRefreshStats()
+        tree: SyncTree = self.resource.sync_tree()
+        total_trees, total_files = _count_trees(tree)
+        ctxs = self._contexts()
+        all_states = self._plan_trees(tree, ctxs)
+
+        order = []
+        _tree_order(tree, [], order)
+        states_maps = [{tuple(state.segments): state for state in states} for states in all_states]
+
+        tqdms = (tqdm(total=total_trees), tqdm(total=total_files))
+        with LoadScheduler(self.workers) as scheduler:
+            for segments in order:
+                entries = [
+                    (target, ctx, states_map[segments])
+                    for target, ctx, states_map in zip(self.targets, ctxs, states_maps)
+                    if segments in states_map
+                ]
+                if entries:
+                    self._sync_directory(entries, scheduler, tqdms)
+
+        for target, ctx in zip(self.targets, ctxs):
+            preserved = ctx.preserved
+            if preserved:
+                target._flush(preserved, FlushDecision('final', len(preserved), preserved.size))
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import threading
+from typing import List, Dict, Tuple, Set, Optional, Any
+
+from ..utils import file_digest
+
+
+def _file_sha256(filename: str, chunk_for_hash: int = 1 << 20) -> str:
+    return file_digest(filename, 'sha256', chunk_for_hash)
+
+
+def _normalize(obj):
+    return json.loads(json.dumps(obj))
+
+
+# fields of the marks not deciding the content, e.g. the rolling Expires of the remote files
+_VOLATILE_MARK_FIELDS = ('expires', 'content_type')
+
+
+def _stable_mark(mark: Dict[str, Any]) -> Dict[str, Any]:
+    mark = _normalize(mark)
+    if isinstance(mark, dict):
+        mark = {key: value for key, value in mark.items() if key not in _VOLATILE_MARK_FIELDS}
+    return mark
+
+
+class SyncJournal:
+    """
+    Overview:
+        On-disk checkpoint journal of a sync task, saved in ``directory``.
+
+        The journal is a JSON-lines file recording the staged files and the commits. When a sync dies halfway, \
+        the next sync with the same journal directory will
+
+        * skip the directories whose ``.meta.json`` have already been committed, including their subtrees \
+            (all the directories are committed in post-order);
+        * reuse the staged but not committed files, when their sizes and sha256 digests are still valid, \
+            and their marks are the same as the newly refreshed ones (except the volatile fields like ``expires``).
+
+        The journal directory is removed when the sync is finished successfully.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.staging_directory = os.path.join(directory, 'staged')
+        self.journal_file = os.path.join(directory, 'journal.jsonl')
+
+        self.finished_directories: Set[Tuple[str, ...]] = set()
+        self.recovered_files: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._load()
+        self._file = None
+        self._lock = threading.Lock()  # commits may be recorded by the background committer
+
+    def _load(self):
+        if not os.path.exists(self.journal_file):
+            return
+
+        pending = {}
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # the last line may be broken when crashed
+                    break
+
+                if record['type'] == 'stage':
+                    pending[tuple(record['path'])] = record
+                elif record['type'] == 'commit':
+                    if 'files' in record:
+                        for path in record['files']:
+                            pending.pop(tuple(path), None)
+                    else:  # all the staged files are committed together
+                        pending.clear()
+                    self.finished_directories.update(map(tuple, record['directories']))
+
+        self.recovered_files = pending
+
+    def _write(self, record: dict):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(self.journal_file, 'a', encoding='utf-8')
+
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def is_finished(self, segments: List[str]) -> bool:
+        return tuple(segments) in self.finished_directories
+
+    def is_inside_finished(self, segments: List[str]) -> bool:
+        return any(self.is_finished(segments[:i]) for i in range(len(segments) + 1))
+
+    def find_staged(self, segments: List[str], type_: str, mark: Optional[Dict[str, Any]]) -> Optional[str]:
+        record = self.recovered_files.get(tuple(segments))
+        if not record or not mark or record['item_type'] != type_ or \
+                _stable_mark(record['mark']) != _stable_mark(mark):
+            return None
+
+        filename = record['file']
+        if not os.path.isfile(filename) or os.path.getsize(filename) != record['size'] or \
+                _file_sha256(filename) != record['sha256']:
+            return None
+
+        return filename
+
+    def record_stage(self, segments: List[str], filename: str, type_: str, mark: Optional[Dict[str, Any]]):
+        if not mark:  # nothing to validate with when recovering
+            return
+
+        self._write({
+            'type': 'stage',
+            'path': list(segments),
+            'file': os.path.abspath(filename),
+            'size': os.path.getsize(filename),
+            'sha256': _file_sha256(filename),
+            'item_type': type_,
+            'mark': mark,
+        })
+
+    def record_commit(self, directories: List[List[str]], files: Optional[List[List[str]]] = None):
+        # files is None means all the staged files are committed
+        record = {
+            'type': 'commit',
+            'directories': [list(segments) for segments in directories],
+        }
+        if files is not None:
+            record['files'] = [list(segments) for segments in files]
+        self._write(record)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.finished_directories.clear()
+        self.recovered_files.clear()
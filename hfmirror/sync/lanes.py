@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Tuple, Optional, Callable, Dict, Deque, Any
+
+from .batch import BatchType, FlushDecision, to_batch_policy
+from .plan import _mark_size
+from ..resource import SyncItem
+from ..utils import FilePool
+
+_ChangeType = Tuple[Optional[str], List[str]]
+_LoadFileType = Tuple[str, SyncItem, Dict[str, Any]]  # name, item and mark of the file to load
+
+
+class SizeLanes:
+    """
+    Overview:
+        Size-aware scheduling policy of :class:`hfmirror.sync.SyncTask`, which routes the files \
+        into two lanes with the ``content_length`` in their refreshed marks.
+
+        * Small lane: the files smaller than ``threshold``, or without ``content_length`` (e.g. text files). \
+            They are loaded smallest first with the ``workers`` and ``batch`` of the sync task, \
+            so they will not be stalled by the large files in the same directory.
+        * Large lane: the files not smaller than ``threshold``. They are loaded with their own \
+            ``large_workers`` threads and committed with their own ``large_batch``, in the background.
+
+        The meta file of a directory with large files is held back until all its large files are committed, \
+        and so are the meta files after it, so that the meta files are never committed before their files.
+
+    :param threshold: Size threshold of large files, in bytes.
+    :param large_workers: Max number of large files loaded concurrently.
+    :param large_batch: Batch policy of the large lane, default is ``0``, which means commit each large file \
+        once it is loaded.
+    """
+
+    def __init__(self, threshold: int = 64 << 20, large_workers: int = 2, large_batch: BatchType = 0):
+        self.threshold = threshold
+        self.large_workers = max(large_workers, 1)
+        self.large_batch = large_batch
+
+    def is_large(self, mark: Optional[Dict[str, Any]]) -> bool:
+        size = _mark_size(mark)
+        return size is not None and size >= self.threshold
+
+    def split(self, files: List[_LoadFileType]) -> Tuple[List[_LoadFileType], List[_LoadFileType]]:
+        small, large = [], []
+        for file in files:
+            _, _, mark = file
+            (large if self.is_large(mark) else small).append(file)
+
+        # smallest first, the files without sizes are usually small ones like text files
+        small.sort(key=lambda x: _mark_size(x[2]) or 0)
+        return small, large
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} threshold: {self.threshold!r}, ' \
+               f'large_workers: {self.large_workers!r}, large_batch: {self.large_batch!r}>'
+
+
+class LargeFileLane:
+    """
+    Overview:
+        Runtime of the large lane. The large files are loaded in a thread pool, staged and committed \
+        with ``commit`` in the loading threads (one commit at a time), and the held meta files are \
+        released with :meth:`release_ready` on the caller's thread.
+    """
+
+    def __init__(self, lanes: SizeLanes, commit: Callable[[List[_ChangeType], FlushDecision], None],
+                 staging_dir: Optional[str] = None, on_committed: Optional[Callable[[int], None]] = None):
+        self.lanes = lanes
+        self.policy = to_batch_policy(lanes.large_batch)
+        self.commit = commit
+        self.on_committed = on_committed
+        self._executor = ThreadPoolExecutor(max_workers=lanes.large_workers)
+        self._futures: List[Future] = []
+
+        self._lock = threading.Lock()
+        self._file_pool = FilePool(staging_dir, persistent=False)
+        self._staged: List[Tuple[_ChangeType, Tuple[str, ...]]] = []
+        self._staged_size = 0
+
+        # number of large files not committed yet, of each directory
+        self._waiting: Dict[Tuple[str, ...], int] = {}
+        # held meta files, in the order of syncing
+        self._held: Deque[Tuple[Tuple[str, ...], Callable[[], None]]] = deque()
+
+    def submit(self, segments: List[str], files: List[Tuple[str, SyncItem]],
+               on_loaded: Optional[Callable[[str, str], None]] = None):
+        # on_loaded is called with the key and the local file of each loaded file, before it is staged
+        directory = tuple(segments)
+        with self._lock:
+            self._waiting[directory] = self._waiting.get(directory, 0) + len(files)
+        for key, item in files:
+            self._futures.append(self._executor.submit(self._load, directory, key, item, on_loaded))
+
+    def _load(self, directory: Tuple[str, ...], key: str, item: SyncItem,
+              on_loaded: Optional[Callable[[str, str], None]] = None):
+        with item.load_file() as local_file:
+            if on_loaded is not None:
+                on_loaded(key, local_file)
+            size = os.path.getsize(local_file)
+            with self._lock:
+                if self.policy.immediate:
+                    self._stage(local_file, directory, key, item, size)
+                    self._flush(FlushDecision('immediate', 1, size))
+                else:
+                    decision = self.policy.before_add(len(self._staged), self._staged_size, size)
+                    if decision is not None:
+                        self._flush(decision)
+                    self._stage(local_file, directory, key, item, size)
+                    decision = self.policy.after_directory(len(self._staged), self._staged_size)
+                    if decision is not None:
+                        self._flush(decision)
+
+    def _stage(self, local_file: str, directory: Tuple[str, ...], key: str, item: SyncItem, size: int):
+        staged_file = self._file_pool.put_file(local_file, owned=item.__owned_file__)
+        self._staged.append(((staged_file, [*directory, key]), directory))
+        self._staged_size += size
+
+    def _flush(self, decision: FlushDecision):
+        # should be called with the lock
+        if not self._staged:
+            return
+
+        self.commit([change for change, _ in self._staged], decision)
+        for _, directory in self._staged:
+            self._waiting[directory] -= 1
+        if self.on_committed is not None:
+            self.on_committed(len(self._staged))
+
+        self._staged.clear()
+        self._staged_size = 0
+        self._file_pool.cleanup()
+
+    def is_holding(self, segments: List[str]) -> bool:
+        # whether the meta file of this directory should be held
+        with self._lock:
+            return bool(self._held) or self._waiting.get(tuple(segments), 0) > 0
+
+    def hold(self, segments: List[str], release: Callable[[], None]):
+        self._held.append((tuple(segments), release))
+
+    def _check_errors(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._futures = [future for future in self._futures if not future.done()]
+
+    def release_ready(self):
+        self._check_errors()
+        while self._held:
+            directory, release = self._held[0]
+            with self._lock:
+                if self._waiting.get(directory, 0) > 0:
+                    break
+            self._held.popleft()
+            release()
+
+    def finish(self):
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+        with self._lock:
+            self._flush(FlushDecision('final', len(self._staged), self._staged_size))
+        self.release_ready()
+
+    def close(self):
+        for future in self._futures:  # only happens when failed, the files not loaded yet are abandoned
+            future.cancel()
+        self._executor.shutdown(wait=True)
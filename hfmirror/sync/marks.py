@@ -0,0 +1,128 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Mapping, Any, Dict
+
+from tqdm.auto import tqdm
+
+from ..resource import SyncItem, ResourceNotChange
+
+
+class MarkRefreshStats:
+    def __init__(self):
+        self.items = 0
+        self.changed = 0
+        self.not_changed = 0
+        self.requests = 0  # requests sent by refresh_mark
+        self.saved_requests = 0  # requests skipped because the old marks are not expired
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} items: {self.items!r}, changed: {self.changed!r}, ' \
+               f'not_changed: {self.not_changed!r}, requests: {self.requests!r}, ' \
+               f'saved_requests: {self.saved_requests!r}>'
+
+
+def _refresh_mark(item: SyncItem, old_file_data: Optional[Mapping[str, Any]]) \
+        -> Tuple[bool, Dict[str, Any], bool]:
+    if old_file_data and old_file_data['type'] == item.__type__:
+        try:
+            mark = item.refresh_mark(old_file_data['mark'])
+        except ResourceNotChange as err:
+            return False, old_file_data['mark'], err.requested
+        else:
+            return True, mark, True
+    else:
+        return True, item.refresh_mark(None), True
+
+
+async def _arefresh_mark(item: SyncItem, old_file_data: Optional[Mapping[str, Any]], session=None) \
+        -> Tuple[bool, Dict[str, Any], bool]:
+    if old_file_data and old_file_data['type'] == item.__type__:
+        try:
+            mark = await item.arefresh_mark(old_file_data['mark'], session=session)
+        except ResourceNotChange as err:
+            return False, old_file_data['mark'], err.requested
+        else:
+            return True, mark, True
+    else:
+        return True, await item.arefresh_mark(None, session=session), True
+
+
+def _record_stats(stats: MarkRefreshStats, item: SyncItem, need_load: bool, requested: bool):
+    stats.items += 1
+    if need_load:
+        stats.changed += 1
+    else:
+        stats.not_changed += 1
+    if item.__mark_requests__:
+        if requested:
+            stats.requests += 1
+        else:
+            stats.saved_requests += 1
+
+
+def refresh_marks(jobs: List[Tuple[SyncItem, Optional[Mapping[str, Any]]]], workers: int = 0,
+                  stats: Optional[MarkRefreshStats] = None, desc: str = 'Mark') \
+        -> List[Tuple[bool, Dict[str, Any]]]:
+    """
+    Overview:
+        Refresh the marks of sync items, with ``workers`` threads at most.
+
+    :param jobs: Tuples of sync item and its old file data in meta file (``None`` when not exist).
+    :param workers: Max number of concurrent threads, ``0`` means refreshing one by one.
+    :param stats: Statistics object to be updated, will not be recorded when not given.
+    :param desc: Description of the progress bar.
+    :return: Need to load the item or not, and the new marks, in the same order of ``jobs``.
+    """
+    stats = stats if stats is not None else MarkRefreshStats()
+    if workers > 0 and len(jobs) > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(_refresh_mark, *job) for job in jobs]
+        results = (future.result() for future in futures)
+    else:
+        executor, futures = None, []
+        results = (_refresh_mark(*job) for job in jobs)
+
+    try:
+        retval = []
+        pbar = tqdm(results, total=len(jobs), desc=desc)
+        for (item, _), (need_load, mark, requested) in zip(jobs, pbar):
+            _record_stats(stats, item, need_load, requested)
+            pbar.set_postfix({'requests': stats.requests, 'saved': stats.saved_requests})
+            retval.append((need_load, mark))
+
+        return retval
+    finally:
+        if executor is not None:
+            for future in futures:  # when failed, the refreshes not started are abandoned
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+async def arefresh_marks(jobs: List[Tuple[SyncItem, Optional[Mapping[str, Any]]]], concurrency: int = 16,
+                         stats: Optional[MarkRefreshStats] = None, desc: str = 'Mark', session=None) \
+        -> List[Tuple[bool, Dict[str, Any]]]:
+    """
+    Overview:
+        Async version of :func:`refresh_marks`, with ``concurrency`` marks refreshed at the same time at most.
+
+    :param session: Aiohttp session shared by the items, a temporary one will be created by each item when not given.
+    """
+    stats = stats if stats is not None else MarkRefreshStats()
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    with tqdm(total=len(jobs), desc=desc) as pbar:
+        async def _refresh(item: SyncItem, old_file_data: Optional[Mapping[str, Any]]):
+            async with semaphore:
+                need_load, mark, requested = await _arefresh_mark(item, old_file_data, session)
+
+            _record_stats(stats, item, need_load, requested)
+            pbar.update()
+            pbar.set_postfix({'requests': stats.requests, 'saved': stats.saved_requests})
+            return need_load, mark
+
+        tasks = [asyncio.ensure_future(_refresh(item, old_file_data)) for item, old_file_data in jobs]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
@@ -0,0 +1,181 @@
+import json
+import os
+from typing import Union, Dict, Any, Iterator, Tuple
+
+try:
+    import orjson
+except (ImportError, ModuleNotFoundError):  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except (ImportError, ModuleNotFoundError):  # pragma: no cover
+    msgpack = None
+
+_ENTRY_KEYS = {'files': 'f', 'folders': 'd'}
+_ENTRY_KINDS = {kind: key for key, kind in _ENTRY_KEYS.items()}
+
+
+def _split_meta(meta_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Iterator[Tuple[str, Dict[str, Any]]]]:
+    # the header, and the entries of files and folders
+    header = {key: value for key, value in meta_data.items() if key not in _ENTRY_KEYS}
+
+    def _entries():
+        for key, kind in _ENTRY_KEYS.items():
+            for entry in meta_data.get(key, []):
+                yield kind, entry
+
+    return header, _entries()
+
+
+def _join_meta(header: Dict[str, Any], entries: Iterator) -> Dict[str, Any]:
+    meta_data = {**header, 'files': [], 'folders': []}
+    for kind, entry in entries:
+        meta_data[_ENTRY_KINDS[kind]].append(entry)
+    return meta_data
+
+
+class MetaFormat:
+    """
+    Overview:
+        Format of the meta files, which are written by :meth:`dump` and read by :meth:`loads`.
+
+        The meta file of a format is named with the legacy meta filename and its own suffix, \
+        e.g. ``.meta.jsonl`` for ``.meta.json``.
+    """
+    __suffix__: str = '.json'
+    __binary__: bool = False  # whether the meta files should be read as bytes
+
+    def filename_of(self, legacy_filename: str) -> str:
+        base, _ = os.path.splitext(legacy_filename)
+        return base + self.__suffix__
+
+    def dump(self, meta_data: Dict[str, Any], filename: str):
+        raise NotImplementedError  # pragma: no cover
+
+    def loads(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        raise NotImplementedError  # pragma: no cover
+
+
+class JsonMetaFormat(MetaFormat):
+    # the legacy format, one indented json object
+    def __init__(self, indent: int = 4):
+        self.indent = indent
+
+    def filename_of(self, legacy_filename: str) -> str:
+        return legacy_filename
+
+    def dump(self, meta_data: Dict[str, Any], filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(meta_data, f, indent=self.indent, ensure_ascii=False)
+
+    def loads(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        return json.loads(data)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} indent: {self.indent!r}>'
+
+
+class JsonLinesMetaFormat(MetaFormat):
+    """
+    Overview:
+        Compact JSON lines format. The first line is the header with the path, metadata and digest, \
+        and each of the following lines is ``["f", {...}]`` for a file or ``["d", {...}]`` for a folder, \
+        so the files are written and parsed one by one.
+
+    :param codec: JSON codec, ``json`` for the standard library, ``orjson`` for the faster one, \
+        ``auto`` means using ``orjson`` when it is installed.
+    """
+    __suffix__ = '.jsonl'
+
+    def __init__(self, codec: str = 'auto'):
+        if codec == 'auto':
+            codec = 'orjson' if orjson is not None else 'json'
+        if codec not in {'json', 'orjson'}:
+            raise ValueError(f'Unknown json codec - {codec!r}.')
+        elif codec == 'orjson' and orjson is None:
+            raise ModuleNotFoundError('Package orjson is required for the orjson codec, '
+                                      'please install it with `pip install hfmirror[meta]`.')
+        self.codec = codec
+
+    def _dumps(self, obj) -> bytes:
+        if self.codec == 'orjson':
+            return orjson.dumps(obj)
+        else:
+            return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def _loads(self, line: Union[str, bytes]):
+        if self.codec == 'orjson':
+            return orjson.loads(line)
+        else:
+            return json.loads(line)
+
+    def dump(self, meta_data: Dict[str, Any], filename: str):
+        header, entries = _split_meta(meta_data)
+        with open(filename, 'wb') as f:
+            f.write(self._dumps(header) + b'\n')
+            for kind, entry in entries:
+                f.write(self._dumps([kind, entry]) + b'\n')
+
+    def _iter_lines(self, data: Union[str, bytes]) -> Iterator:
+        for line in data.splitlines():
+            if line.strip():
+                yield self._loads(line)
+
+    def loads(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        lines = self._iter_lines(data)
+        header = next(lines)
+        return _join_meta(header, lines)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} codec: {self.codec!r}>'
+
+
+class MsgpackMetaFormat(MetaFormat):
+    """
+    Overview:
+        Binary format with msgpack, the header and the entries are packed one after another \
+        like :class:`JsonLinesMetaFormat`.
+    """
+    __suffix__ = '.msgpack'
+    __binary__ = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ModuleNotFoundError('Package msgpack is required for the msgpack meta format, '
+                                      'please install it with `pip install hfmirror[meta]`.')
+
+    def dump(self, meta_data: Dict[str, Any], filename: str):
+        header, entries = _split_meta(meta_data)
+        packer = msgpack.Packer(use_bin_type=True)
+        with open(filename, 'wb') as f:
+            f.write(packer.pack(header))
+            for kind, entry in entries:
+                f.write(packer.pack([kind, entry]))
+
+    def loads(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(data)
+        header = next(unpacker)
+        return _join_meta(header, unpacker)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}>'
+
+
+MetaFormatType = Union[str, MetaFormat]
+
+_META_FORMATS = {
+    'json': JsonMetaFormat,
+    'jsonl': JsonLinesMetaFormat,
+    'msgpack': MsgpackMetaFormat,
+}
+
+
+def to_meta_format(meta_format: MetaFormatType) -> MetaFormat:
+    if isinstance(meta_format, MetaFormat):
+        return meta_format
+    elif isinstance(meta_format, str) and meta_format in _META_FORMATS:
+        return _META_FORMATS[meta_format]()
+    else:
+        raise TypeError(f'Unknown meta format - {meta_format!r}.')
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Optional, Any, Iterable, Iterator, ContextManager, AsyncContextManager
+
+from .marks import MarkRefreshStats
+from ..resource import SyncItem
+
+PHASES = ['crawl', 'tree', 'meta_read', 'mark', 'download', 'staging', 'commit', 'cleanup']
+
+
+class PhaseStats:
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'seconds': self.seconds, 'count': self.count}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} seconds: {self.seconds!r}, count: {self.count!r}>'
+
+
+class SyncReport:
+    """
+    Overview:
+        Performance report of a sync, with the time costs of its phases and the counters.
+
+        The phases are ``crawl`` (grabbing items from the resource), ``tree`` (building the sync tree), \
+        ``meta_read``, ``mark``, ``download``, ``staging``, ``commit`` and ``cleanup``. The seconds of \
+        a phase are summed up over all its calls, so the phases done in several threads concurrently \
+        (e.g. ``download`` with ``workers``) may cost more seconds than the whole sync.
+
+        The counters are ``bytes_in`` (size of the loaded files), ``bytes_out`` (size of the committed files), \
+        ``files_loaded``, ``commits`` and ``operations``, with ``mark_requests`` (e.g. ``HEAD`` requests), \
+        ``not_changed`` (``304`` responses and other :class:`ResourceNotChange` hits) and \
+        ``saved_requests`` from the statistics of mark refreshing. When deduplication is enabled, \
+        ``files_deduplicated`` and ``bytes_deduplicated`` are counted for the items not loaded again.
+    """
+
+    def __init__(self, mark_stats: Optional[MarkRefreshStats] = None):
+        self.mark_stats = mark_stats if mark_stats is not None else MarkRefreshStats()
+        self.phases: Dict[str, PhaseStats] = {name: PhaseStats() for name in PHASES}
+        self.counters: Dict[str, int] = {
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'files_loaded': 0,
+            'commits': 0,
+            'operations': 0,
+        }
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()  # phases may be recorded by the loading and committing threads
+
+    def add_phase(self, name: str, seconds: float, count: int = 1):
+        with self._lock:
+            if name not in self.phases:
+                self.phases[name] = PhaseStats()
+            self.phases[name].seconds += seconds
+            self.phases[name].count += count
+
+    @contextmanager
+    def phase(self, name: str) -> ContextManager[None]:
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.time() - start_time)
+
+    def iter_phase(self, name: str, iterable: Iterable) -> Iterator:
+        # the time cost of getting each element is recorded to the phase
+        iterator = iter(iterable)
+        while True:
+            start_time = time.time()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                self.add_phase(name, time.time() - start_time, count=0)
+                return
+            self.add_phase(name, time.time() - start_time)
+            yield value
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'seconds': self.seconds,
+                'finished': self.finished_at is not None,
+                'phases': {name: stats.to_json() for name, stats in self.phases.items()},
+                'counters': {
+                    **self.counters,
+                    'mark_requests': self.mark_stats.requests,
+                    'not_changed': self.mark_stats.not_changed,
+                    'saved_requests': self.mark_stats.saved_requests,
+                },
+            }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} seconds: {self.seconds:.3f}, ' \
+               f'files_loaded: {self.counters["files_loaded"]!r}, bytes_in: {self.counters["bytes_in"]!r}, ' \
+               f'commits: {self.counters["commits"]!r}, bytes_out: {self.counters["bytes_out"]!r}>'
+
+
+class _TimedItem:
+    # loader recording the time costs and sizes of the loaded files, the same as the item for the schedulers
+    def __init__(self, item: SyncItem, report: SyncReport):
+        self.item = item
+        self.report = report
+        self.__owned_file__ = item.__owned_file__
+
+    def _record(self, start_time: float, filename: str):
+        self.report.add_phase('download', time.time() - start_time)
+        self.report.count('files_loaded')
+        self.report.count('bytes_in', os.path.getsize(filename))
+
+    @contextmanager
+    def load_file(self) -> ContextManager[str]:
+        start_time = time.time()
+        with self.item.load_file() as filename:
+            self._record(start_time, filename)
+            yield filename
+
+    @asynccontextmanager
+    async def aload_file(self, session=None) -> AsyncContextManager[str]:
+        start_time = time.time()
+        async with self.item.aload_file(session) as filename:
+            self._record(start_time, filename)
+            yield filename
@@ -0,0 +1,195 @@
+import json
+import time
+from hashlib import sha256
+from typing import List, Tuple, Dict, Set, Any, Optional, Iterable
+
+from .batch import BatchPolicy
+from ..resource import SyncTree, SyncItem
+
+
+def _mark_size(mark: Optional[Dict[str, Any]]) -> Optional[int]:
+    if isinstance(mark, dict):
+        return mark.get('content_length')
+    else:
+        return None
+
+
+class DirectoryPlan:
+    def __init__(self, segments: List[str], tree: SyncTree,
+                 items: List[Tuple[str, SyncItem]], folders: List[Tuple[str, SyncTree]],
+                 old_files: Dict[str, dict], old_item_names: Set[str], old_meta: Optional[dict] = None,
+                 legacy_meta: bool = False):
+        self.segments = segments
+        self.tree = tree
+        self.items = items
+        self.folders = folders
+        self.old_files = old_files
+        self.old_item_names = old_item_names
+        self.old_meta = old_meta
+        self.legacy_meta = legacy_meta  # the old meta is read from the legacy meta file, to be replaced
+        # need to load or not, and the refreshed mark, for each item
+        self.marks: List[Tuple[bool, dict]] = []
+
+    @property
+    def path(self) -> str:
+        return '/'.join(self.segments)
+
+    @property
+    def added(self) -> List[str]:
+        return [key for (key, _), (need_load, _) in zip(self.items, self.marks)
+                if need_load and key not in self.old_files]
+
+    @property
+    def changed(self) -> List[str]:
+        return [key for (key, _), (need_load, _) in zip(self.items, self.marks)
+                if need_load and key in self.old_files]
+
+    @property
+    def unchanged(self) -> List[str]:
+        return [key for (key, _), (need_load, _) in zip(self.items, self.marks) if not need_load]
+
+    @property
+    def deleted(self) -> List[str]:
+        new_item_names = {key for key, _ in self.items} | {key for key, _ in self.folders}
+        return sorted(self.old_item_names - new_item_names)
+
+    @property
+    def load_sizes(self) -> List[Optional[int]]:
+        return [_mark_size(mark) for need_load, mark in self.marks if need_load]
+
+    @property
+    def download_size(self) -> int:
+        return sum(size for size in self.load_sizes if size is not None)
+
+    @property
+    def unknown_sizes(self) -> int:
+        return len([size for size in self.load_sizes if size is None])
+
+    @property
+    def operations(self) -> int:
+        # loaded files, deleted items and the meta file, with the legacy one to be deleted
+        return len(self.load_sizes) + len(self.deleted) + (2 if self.legacy_meta else 1)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'files': len(self.items),
+            'folders': len(self.folders),
+            'added': self.added,
+            'changed': self.changed,
+            'unchanged': len(self.unchanged),
+            'deleted': self.deleted,
+            'download_size': self.download_size,
+            'unknown_sizes': self.unknown_sizes,
+            'operations': self.operations,
+        }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} path: {self.path!r}, added: {len(self.added)!r}, ' \
+               f'changed: {len(self.changed)!r}, deleted: {len(self.deleted)!r}>'
+
+
+def _estimate_commits(directories: List[DirectoryPlan], policy: BatchPolicy) -> int:
+    commits = 0
+    if policy.immediate:
+        return len(directories)
+
+    operations, size = 0, 0
+    for directory in directories:
+        load_sizes = directory.load_sizes
+        sizes = [size_ or 0 for size_ in load_sizes] + [0] * (directory.operations - len(load_sizes))
+        for new_size in sizes:
+            if policy.before_add(operations, size, new_size) is not None:
+                commits += 1
+                operations, size = 0, 0
+            operations += 1
+            size += new_size
+
+        if policy.after_directory(operations, size) is not None:
+            commits += 1
+            operations, size = 0, 0
+
+    if operations > 0:
+        commits += 1
+    return commits
+
+
+class SyncPlan:
+    """
+    Overview:
+        Plan of a sync, created by :meth:`hfmirror.sync.SyncTask.plan` without loading any files.
+
+        The sizes are estimated with the ``content_length`` in the marks, and the items without it \
+        are counted in ``unknown_sizes``. The uploaded size is estimated as the downloaded size, \
+        the meta files are not counted in.
+    """
+
+    def __init__(self, directories: List[DirectoryPlan], policy: BatchPolicy,
+                 stables: Optional[Dict[Tuple[str, ...], float]] = None,
+                 digests: Optional[Dict[Tuple[str, ...], str]] = None):
+        # post-order, the same as the order of syncing
+        self.directories = directories
+        # stable_until and digests of the subtrees found while planning, mapped from the segments of directories
+        self.stables = dict(stables or {})
+        self.digests = dict(digests or {})
+        self.commits = _estimate_commits(directories, policy)
+
+    @property
+    def total_files(self) -> int:
+        return sum(len(directory.items) for directory in self.directories)
+
+    def to_json(self) -> Dict[str, Any]:
+        directories = [directory.to_json() for directory in self.directories]
+        download_size = sum(directory['download_size'] for directory in directories)
+        return {
+            'directories': directories,
+            'total': {
+                'directories': len(directories),
+                'files': self.total_files,
+                'added': sum(len(directory['added']) for directory in directories),
+                'changed': sum(len(directory['changed']) for directory in directories),
+                'unchanged': sum(directory['unchanged'] for directory in directories),
+                'deleted': sum(len(directory['deleted']) for directory in directories),
+                'download_size': download_size,
+                'upload_size': download_size,
+                'unknown_sizes': sum(directory['unknown_sizes'] for directory in directories),
+                'operations': sum(directory['operations'] for directory in directories),
+                'commits': self.commits,
+            },
+        }
+
+    def __repr__(self):
+        total = self.to_json()['total']
+        return f'<{self.__class__.__name__} directories: {total["directories"]!r}, ' \
+               f'added: {total["added"]!r}, changed: {total["changed"]!r}, deleted: {total["deleted"]!r}, ' \
+               f'download_size: {total["download_size"]!r}, commits: {total["commits"]!r}>'
+
+
+def subtree_digest(metadata: dict, files: List[Tuple[str, SyncItem]], folders: List[Tuple[str, str]]) -> str:
+    """
+    Overview:
+        Digest of a directory, calculated with the names, types, values and metadata of its files, \
+        and the digests of its sub-folders, so that it changes when anything in the subtree changes.
+        The marks are not included, because they are not known until refreshed, their stability is \
+        recorded as ``stable_until`` beside the digest instead.
+    """
+    data = {
+        'metadata': metadata,
+        'files': [[name, item.__type__, item._value, item.metadata] for name, item in files],
+        'folders': [[name, digest] for name, digest in folders],
+    }
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False, default=repr)
+    return sha256(text.encode('utf-8')).hexdigest()
+
+
+def merge_stable_until(values: Iterable[Optional[float]]) -> Optional[float]:
+    # 0 means not stable, None means stable forever
+    retval = None
+    for value in values:
+        if value is not None:
+            retval = value if retval is None else min(retval, value)
+    return retval
+
+
+def is_stable(stable_until: Optional[float]) -> bool:
+    return stable_until is None or time.time() < stable_until
@@ -0,0 +1,175 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import ExitStack, AsyncExitStack
+from typing import List, Callable, Deque, Tuple, Optional, ContextManager, AsyncContextManager, Awaitable
+
+from hbutils.reflection import nested_with
+
+from ..resource import SyncItem
+
+
+def _enter_load_file(item: SyncItem) -> Tuple[ContextManager[str], str]:
+    cm = item.load_file()
+    return cm, cm.__enter__()
+
+
+def _exit_future(future: Future):
+    if future.cancel():
+        return
+
+    try:
+        cm, _ = future.result()
+    except BaseException:
+        pass
+    else:
+        cm.__exit__(None, None, None)
+
+
+class LoadScheduler:
+    """
+    Overview:
+        Scheduler for loading files of sync items.
+
+        When ``workers`` is ``0``, the files are loaded immediately and serially in :meth:`submit`. \
+        Otherwise, the files are loaded in a thread pool across all the submitted jobs, \
+        and the callbacks are still called on the caller's thread in the order of submission, \
+        so the result is deterministic even though the downloads complete out of order.
+
+    :param workers: Max number of concurrent loading threads, ``0`` means serial loading.
+    :param window: Max number of files loaded or being loaded but not consumed yet, \
+        default is ``workers * 4``. When this limit is reached, :meth:`submit` will block \
+        until the earliest jobs are consumed.
+    """
+
+    def __init__(self, workers: int = 0, window: Optional[int] = None):
+        self.workers = workers
+        self.window = max(window or self.workers * 4, 1)
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._jobs: Deque[Tuple[List[Future], Callable[[List[str]], None]]] = deque()
+        self._in_flight = 0
+
+    def submit(self, items: List[SyncItem], callback: Callable[[List[str]], None]):
+        if self._executor is None:
+            with nested_with(*[item.load_file() for item in items]) as file_paths:
+                callback(list(file_paths))
+        else:
+            futures = [self._executor.submit(_enter_load_file, item) for item in items]
+            self._jobs.append((futures, callback))
+            self._in_flight += len(futures)
+            while len(self._jobs) > 1 and self._in_flight > self.window:
+                self._consume()
+
+    def _consume(self):
+        futures, callback = self._jobs.popleft()
+        self._in_flight -= len(futures)
+        with ExitStack() as stack:
+            for future in futures:
+                stack.callback(_exit_future, future)
+
+            callback([future.result()[1] for future in futures])
+
+    def drain(self):
+        while self._jobs:
+            self._consume()
+
+    def close(self):
+        while self._jobs:
+            futures, _ = self._jobs.popleft()
+            self._in_flight -= len(futures)
+            for future in futures:
+                _exit_future(future)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.drain()
+        finally:
+            self.close()
+
+
+async def _aenter_load_file(item: SyncItem, session, semaphore: asyncio.Semaphore) \
+        -> Tuple[AsyncContextManager[str], str]:
+    async with semaphore:
+        cm = item.aload_file(session)
+        return cm, await cm.__aenter__()
+
+
+async def _aexit_task(task: asyncio.Future):
+    if not task.done():
+        task.cancel()
+
+    try:
+        cm, _ = await task
+    except BaseException:
+        pass
+    else:
+        await cm.__aexit__(None, None, None)
+
+
+class AsyncLoadScheduler:
+    """
+    Overview:
+        Async version of :class:`LoadScheduler`, the files are loaded with :meth:`SyncItem.aload_file` \
+        on the running event loop, and the callbacks are awaited in the order of submission.
+
+    :param concurrency: Max number of files being loaded at the same time.
+    :param window: Max number of files loaded or being loaded but not consumed yet, \
+        default is ``concurrency * 4``.
+    :param session: Aiohttp session passed to the items.
+    """
+
+    def __init__(self, concurrency: int = 16, window: Optional[int] = None, session=None):
+        self.concurrency = concurrency
+        self.window = max(window or self.concurrency * 4, 1)
+        self.session = session
+        self._semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self._jobs: Deque[Tuple[List[asyncio.Future], Callable[[List[str]], Awaitable[None]]]] = deque()
+        self._in_flight = 0
+
+    async def submit(self, items: List[SyncItem], callback: Callable[[List[str]], Awaitable[None]]):
+        tasks = [asyncio.ensure_future(_aenter_load_file(item, self.session, self._semaphore)) for item in items]
+        self._jobs.append((tasks, callback))
+        self._in_flight += len(tasks)
+        while len(self._jobs) > 1 and self._in_flight > self.window:
+            await self._consume()
+
+    async def _consume(self):
+        tasks, callback = self._jobs.popleft()
+        self._in_flight -= len(tasks)
+        async with AsyncExitStack() as stack:
+            for task in tasks:
+                stack.push_async_callback(_aexit_task, task)
+
+            file_paths = []
+            for task in tasks:
+                _, file_path = await task
+                file_paths.append(file_path)
+            await callback(file_paths)
+
+    async def drain(self):
+        while self._jobs:
+            await self._consume()
+
+    async def aclose(self):
+        while self._jobs:
+            tasks, _ = self._jobs.popleft()
+            self._in_flight -= len(tasks)
+            for task in tasks:
+                await _aexit_task(task)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                await self.drain()
+        finally:
+            await self.aclose()
@@ -0,0 +1,92 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from typing import Dict, Optional, Callable, List, Any
+
+
+class ShardManifest:
+    """
+    Overview:
+        Partition of the top-level folders of a sync tree into ``shards`` disjoint shards.
+
+        The folders in ``assignments`` are assigned to the given shards, and the others are assigned \
+        with a stable hash of their names, so the partition is the same in all the processes and nodes. \
+        The files and meta file of the root directory belong to no shard, they are synced by the coordinator \
+        after all the shards are synced.
+
+        Save the manifest with :meth:`save` and share it between the nodes, when the folders are \
+        assigned explicitly.
+
+    :param shards: Number of shards.
+    :param assignments: Explicit shards of the top-level folders.
+
+    Examples::
+        >>> manifest = ShardManifest(4)
+        >>> # on each node, or in each process, sync the shard 0, 1, 2 and 3
+        >>> SyncTask(resource, storage, sharding=manifest, shard=0).sync()
+        >>> # after all the shards are finished, write the root-level files and meta file
+        >>> SyncTask(resource, storage, sharding=manifest).sync()
+    """
+
+    def __init__(self, shards: int, assignments: Optional[Dict[str, int]] = None):
+        if shards <= 0:
+            raise ValueError(f'Number of shards should be positive, but {shards!r} found.')
+        self.shards = shards
+        self.assignments = dict(assignments or {})
+        for name, shard in self.assignments.items():
+            if not 0 <= shard < shards:
+                raise ValueError(f'Shard of folder {name!r} should be in [0, {shards}), but {shard!r} found.')
+
+    def shard_of(self, name: str) -> int:
+        if name in self.assignments:
+            return self.assignments[name]
+        else:
+            return int(sha1(name.encode('utf-8')).hexdigest(), 16) % self.shards
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'shards': self.shards,
+            'assignments': self.assignments,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'ShardManifest':
+        return cls(data['shards'], data.get('assignments'))
+
+    def save(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, indent=4, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, filename: str) -> 'ShardManifest':
+        with open(filename, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} shards: {self.shards!r}, assignments: {len(self.assignments)!r}>'
+
+
+def _sync_shard(factory: Callable, manifest: ShardManifest, shard: Optional[int]):
+    task = factory()
+    task.sharding, task.shard = manifest, shard
+    task.sync()
+
+
+def sync_shards(factory: Callable, manifest: ShardManifest, processes: Optional[int] = None):
+    """
+    Overview:
+        Sync all the shards in separated processes, and then run the coordinator in this process.
+
+    :param factory: Picklable function (e.g. a module-level function) creating the :class:`SyncTask` \
+        to be sharded, it is called in each worker process.
+    :param manifest: Shard manifest.
+    :param processes: Max number of worker processes, default is the number of shards.
+    """
+    with ProcessPoolExecutor(max_workers=processes or manifest.shards) as executor:
+        futures = [executor.submit(_sync_shard, factory, manifest, shard) for shard in range(manifest.shards)]
+        errors: List[BaseException] = [future.exception() for future in futures]
+
+    for error in errors:
+        if error is not None:
+            raise error
+    _sync_shard(factory, manifest, None)
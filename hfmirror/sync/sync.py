@@ -1,17 +1,29 @@
 import json
 import os.path
+import threading
+import time
 from itertools import chain
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Set, Optional, Callable, Union
 
-from hbutils.reflection import nested_with
 from hbutils.string import plural_word
 from hbutils.system.filesystem.tempfile import TemporaryDirectory
 from tqdm import tqdm as _TqdmType
 from tqdm.auto import tqdm
 
-from ..resource import SyncResource, SyncTree, ResourceNotChange
+from .batch import BatchType, BatchPolicy, FlushDecision, to_batch_policy
+from .committer import BackgroundCommitter
+from .dedup import DedupCache
+from .journal import SyncJournal
+from .lanes import SizeLanes, LargeFileLane
+from .metafile import MetaFormatType, to_meta_format
+from .marks import refresh_marks, MarkRefreshStats
+from .metrics import SyncReport, _TimedItem
+from .plan import DirectoryPlan, SyncPlan, subtree_digest, merge_stable_until, is_stable
+from .scheduler import LoadScheduler
+from .shard import ShardManifest
+from ..resource import SyncResource, SyncTree, SyncItem, MetadataItem, CompleteItem, LocalFileSyncItem
 from ..storage import BaseStorage
-from ..utils import FilePool
+from ..utils import FilePool, cached_file_digests
 
 
 def _count_trees(tree: SyncTree):
@@ -27,61 +39,374 @@ def _count_trees(tree: SyncTree):
     return tree_cnt, file_cnt
 
 
+class _StagedChanges:
+    def __init__(self, journal: Optional[SyncJournal] = None, staging_dir: Optional[str] = None):
+        self.journal = journal
+        self.staging_dir = staging_dir
+        self.file_pool = self._new_file_pool()
+        self.changes: List[Tuple[Optional[str], List[str]]] = []
+        self.size = 0
+
+    def _new_file_pool(self) -> FilePool:
+        if self.journal is not None:  # staged files should be kept for recovering
+            return FilePool(self.journal.staging_directory)
+        else:
+            return FilePool(self.staging_dir, persistent=False)
+
+    def put(self, local_file: Optional[str], remote_segs: List[str], size: int, owned: bool = False) \
+            -> Optional[str]:
+        if local_file is not None:
+            staged_file = self.file_pool.put_file(local_file, owned=owned)
+        else:
+            staged_file = None
+        self.changes.append((staged_file, remote_segs))
+        self.size += size
+        return staged_file
+
+    def clear(self):
+        self.changes.clear()
+        self.size = 0
+        self.file_pool.cleanup()
+
+    def detach(self) -> Tuple[List[Tuple[Optional[str], List[str]]], FilePool]:
+        # hand over the staged changes and their files, and start staging with a new file pool
+        changes, file_pool = self.changes, self.file_pool
+        self.file_pool = self._new_file_pool()
+        self.changes = []
+        self.size = 0
+        return changes, file_pool
+
+    def __len__(self):
+        return len(self.changes)
+
+
+_MetaDataType = Tuple[Union[str, bytes], bool]  # data of the meta file, and whether it is a legacy one
+
+
+class _SyncContext:
+    def __init__(self, tqdms: Optional[Tuple[_TqdmType, _TqdmType]], preserved: Optional[_StagedChanges],
+                 scheduler: Optional[LoadScheduler], old_metas: Optional[Dict[Tuple[str, ...], _MetaDataType]] = None,
+                 lane: Optional[LargeFileLane] = None):
+        self.tqdms = tqdms
+        self.preserved = preserved
+        self.journal = preserved.journal if preserved is not None else None
+        self.scheduler = scheduler
+        self.lane = lane
+        self.dedup: Optional[DedupCache] = None
+        # the loaded files are shared with other storages, so they should not be taken over
+        self.shared_files = False
+        # prefetched meta files, mapped from the segments of directories
+        self.old_metas = old_metas
+        # digests of the subtrees, and their stable_until, mapped from the segments of directories
+        self.digests: Dict[Tuple[str, ...], str] = {}
+        self.stables: Dict[Tuple[str, ...], Optional[float]] = {}
+
+
+def _merge_metas(texts: Optional[Dict[Tuple[str, ...], str]], legacy_texts: Optional[Dict[Tuple[str, ...], str]]) \
+        -> Optional[Dict[Tuple[str, ...], _MetaDataType]]:
+    if texts is None or legacy_texts is None:
+        return None  # not supported by the storage
+    metas = {segments: (text, True) for segments, text in legacy_texts.items()}
+    metas.update({segments: (text, False) for segments, text in texts.items()})
+    return metas
+
+
+class _SyncedTree(SyncTree):
+    # placeholder of the directory which has already been synced in stream mode
+    def __init__(self, metadata: dict, digest: str, stable_until: Optional[float]):
+        SyncTree.__init__(self)
+        self.metadata = metadata
+        self.digest = digest
+        self.stable_until = stable_until
+
+    def _add_item_with_segment(self, item: SyncItem, segments: List[str]):
+        raise ValueError(f'Directory of item {item!r} has already been completed and synced.')
+
+    def _add_meta_item_with_segment(self, item: MetadataItem, segments: List[str]):
+        raise ValueError(f'Directory of metadata {item!r} has already been completed and synced.')
+
+
 class SyncTask:
     def __init__(self, resource: SyncResource, storage: BaseStorage, meta_filename='.meta.json',
-                 batch: int = 50):
+                 batch: BatchType = 50, workers: int = 0, mark_workers: int = 0, stream: bool = False,
+                 on_flush: Optional[Callable[[FlushDecision], None]] = None, journal: Optional[str] = None,
+                 prefetch_meta: bool = False, pipeline: int = 0, staging_dir: Optional[str] = None,
+                 skip_unchanged: bool = False, lanes: Optional[SizeLanes] = None,
+                 sharding: Optional[ShardManifest] = None, shard: Optional[int] = None,
+                 on_report: Optional[Callable[[SyncReport], None]] = None, meta_format: MetaFormatType = 'json',
+                 dedup: bool = False):
         self.resource = resource
         self.storage = storage
-        self.meta_filename = meta_filename
+
+        # meta_format == 'json', write the indented json meta files named `meta_filename`
+        # meta_format == 'jsonl' or 'msgpack' or a MetaFormat, write the compact meta files named with its suffix
+        #   (e.g. .meta.jsonl), the legacy json meta files are still read, and replaced when their directories synced
+        self.meta_format = to_meta_format(meta_format)
+        self.legacy_meta_filename = meta_filename
+        self.meta_filename = self.meta_format.filename_of(meta_filename)
 
         # batch < 0, do not submit until the end of sync
         # batch == 0, submit immediately every time
         # batch > 0, submit changes when changes over `batch`
+        # batch is a BatchPolicy, submit changes when the policy decides to flush
         self.batch = batch
+        self.batch_policy = to_batch_policy(batch)
+        self.on_flush = on_flush
 
-    def _sync_tree(self, tree: SyncTree, segments: List[str], tqdms: Tuple[_TqdmType, _TqdmType],
-                   preserved: Tuple[FilePool, List]):
-        tree_tqdm, file_tqdm = tqdms
-        tree_tqdm.set_description('/'.join(segments))
-        items, folders = [], []
-        for key in sorted(tree.items.keys()):
-            value = tree.items[key]
-            if isinstance(value, SyncTree):
-                folders.append((key, value))
-            else:
-                items.append((key, value))
+        # workers == 0, load the files one by one
+        # workers > 0, load the files of all the directories concurrently with `workers` threads
+        self.workers = workers
+
+        # mark_workers == 0, refresh the marks one by one
+        # mark_workers > 0, refresh the marks of the whole tree with `mark_workers` threads
+        self.mark_workers = mark_workers
+        self.mark_stats = MarkRefreshStats()
+
+        # report of the last sync, on_report is called with it after each commit and at the end of sync
+        self.report = SyncReport(self.mark_stats)
+        self.on_report = on_report
+
+        # stream == False, build the full tree before syncing
+        # stream == True, sync each directory once the resource yields its complete signal
+        self.stream = stream
+
+        # journal is None, start over when the sync died halfway
+        # journal is a directory, record checkpoints in it, and resume from it in the next sync
+        self.journal = journal
+
+        # prefetch_meta == False, read the meta file when visiting each directory
+        # prefetch_meta == True, read all the meta files at the beginning of sync, when storage supports it
+        self.prefetch_meta = prefetch_meta
 
+        # pipeline == 0, commit the changes inline, loading is paused while committing
+        # pipeline > 0, commit the changes in a background thread, while loading the next batch,
+        #   with at most `pipeline` batches waiting to be committed
+        self.pipeline = pipeline
+        self._committer: Optional[BackgroundCommitter] = None
+
+        # skip_unchanged == False, visit all the directories and refresh all the marks
+        # skip_unchanged == True, skip the subtrees whose digests are not changed and marks are all stable,
+        #   e.g. the subtrees with only text files, or remote files before their expiration
+        self.skip_unchanged = skip_unchanged
+
+        # staging_dir is None, stage the files of batches in the system temporary directory
+        # staging_dir is a directory, stage the files in it, place it on the same filesystem as the loaded files
+        #   so that they can be moved instead of copied (ignored when journal is used)
+        self.staging_dir = staging_dir
+
+        # lanes is None, load all the files in the same way
+        # lanes is a SizeLanes, load the large files in a separated lane with its own workers and batch,
+        #   the small files are loaded smallest first, and committed without waiting for the large ones
+        self.lanes = lanes
+        self._storage_lock = threading.Lock()  # the storage may be committed to from several threads
+
+        # sharding is None, sync the whole tree
+        # sharding is a ShardManifest and shard is an int, only sync the top-level folders of this shard
+        # sharding is a ShardManifest and shard is None, coordinate the finished shards, only sync the files,
+        #   deletions and meta file of the root directory, with the meta files of the top-level folders
+        # the shards never write the same paths, but use separated journals for them when journal is used
+        self.sharding = sharding
+        self.shard = shard
+
+        # dedup == False, load each item separately
+        # dedup == True, load the items with the same url, or the same strong etag and content length,
+        #   only once in each sync, and stage the loaded copy for all of them
+        self.dedup = dedup
+        self._validate()
+
+    def _validate(self):
+        # also checked when syncing, the options may be changed after created (e.g. sharded by sync_shards)
+        if self.sharding is not None and self.stream:
+            raise ValueError('Stream mode is not supported when sharding.')
+
+    def _commit(self, changes: List[Tuple[Optional[str], List[str]]], decision: FlushDecision,
+                journal: Optional[SyncJournal], policy: Optional[BatchPolicy] = None):
+        with self._storage_lock:
+            start_time = time.time()
+            self.storage.batch_change_files(changes)
+            decision.seconds = time.time() - start_time
+        self._after_commit(changes, decision, journal, policy)
+
+    def _after_commit(self, changes: List[Tuple[Optional[str], List[str]]], decision: FlushDecision,
+                      journal: Optional[SyncJournal], policy: Optional[BatchPolicy] = None):
+        if journal is not None:
+            journal.record_commit([
+                remote_segs[:-1] for local_file, remote_segs in changes
+                if local_file is not None and remote_segs[-1] == self.meta_filename
+            ], [remote_segs for _, remote_segs in changes])
+        (policy or self.batch_policy).feedback(decision.operations, decision.size, decision.seconds)
+        self.report.add_phase('commit', decision.seconds)
+        self.report.count('commits')
+        self.report.count('operations', len(changes))
+        self.report.count('bytes_out', decision.size)
+        if self.on_flush is not None:
+            self.on_flush(decision)
+        if self.on_report is not None:
+            self.on_report(self.report)
+
+    def _flush(self, preserved: _StagedChanges, decision: FlushDecision):
+        if self._committer is not None:
+            changes, file_pool = preserved.detach()
+            self._committer.submit(changes, decision, preserved.journal,
+                                   cleanup=lambda: self._cleanup(file_pool.cleanup))
+        else:
+            self._commit(preserved.changes, decision, preserved.journal)
+            self._cleanup(preserved.clear)
+
+    def _cleanup(self, cleanup: Callable[[], None]):
+        with self.report.phase('cleanup'):
+            cleanup()
+
+    @property
+    def _has_legacy_meta(self) -> bool:
+        return self.legacy_meta_filename != self.meta_filename
+
+    def _read_meta_file(self, segments: List[str]) -> Optional[_MetaDataType]:
         meta_file_segments = [*segments, self.meta_filename]
         if self.storage.file_exists(meta_file_segments):
-            old_metadata = json.loads(self.storage.read_text(meta_file_segments))
+            if self.meta_format.__binary__:
+                return self.storage.read_binary(meta_file_segments), False
+            else:
+                return self.storage.read_text(meta_file_segments), False
+
+        legacy_file_segments = [*segments, self.legacy_meta_filename]
+        if self._has_legacy_meta and self.storage.file_exists(legacy_file_segments):
+            return self.storage.read_text(legacy_file_segments), True
+        else:
+            return None
+
+    def _load_meta(self, meta: _MetaDataType) -> dict:
+        data, legacy = meta
+        return json.loads(data) if legacy else self.meta_format.loads(data)
+
+    def _read_old_meta(self, segments: List[str], ctx: _SyncContext) \
+            -> Tuple[Dict[str, dict], Set[str], Optional[dict], bool]:
+        if ctx.old_metas is not None:
+            meta = ctx.old_metas.get(tuple(segments))
+        else:
+            with self.report.phase('meta_read'):
+                meta = self._read_meta_file(segments)
+
+        if meta is not None:
+            old_metadata, legacy = self._load_meta(meta), meta[1]
             old_files = {item['name']: item for item in old_metadata['files']}
             old_item_names = {item['name'] for item in chain(old_metadata['files'], old_metadata['folders'])}
         else:
+            old_metadata, legacy = None, False
             old_files = {}
             old_item_names = set()
 
-        m_folders = []
+        return old_files, old_item_names, old_metadata, legacy
+
+    def _tree_digest(self, tree: SyncTree, segments: List[str], ctx: _SyncContext) -> str:
+        if isinstance(tree, _SyncedTree):
+            return tree.digest
+        if tuple(segments) not in ctx.digests:
+            files, folders = [], []
+            for key in sorted(tree.items.keys()):
+                value = tree.items[key]
+                if isinstance(value, SyncTree):
+                    folders.append((key, self._tree_digest(value, [*segments, key], ctx)))
+                else:
+                    files.append((key, value))
+            ctx.digests[tuple(segments)] = subtree_digest(tree.metadata, files, folders)
+
+        return ctx.digests[tuple(segments)]
+
+    def _skip_unchanged(self, tree: SyncTree, segments: List[str], old_entry: Optional[dict],
+                        ctx: _SyncContext) -> bool:
+        # old_entry is the old meta of the tree, or its entry in the old meta of its parent
+        if self.skip_unchanged and old_entry is not None and 'digest' in old_entry and \
+                is_stable(old_entry.get('stable_until', 0)) and \
+                old_entry['digest'] == self._tree_digest(tree, segments, ctx):
+            ctx.stables[tuple(segments)] = old_entry.get('stable_until', 0)
+            return True
+        else:
+            return False
+
+    def _collect_trees(self, tree: SyncTree, segments: List[str], states: List[DirectoryPlan],
+                       ctx: _SyncContext):
+        items, folders = [], []
+        for key in sorted(tree.items.keys()):
+            value = tree.items[key]
+            if isinstance(value, SyncTree):
+                folders.append((key, value))
+            else:
+                items.append((key, value))
+
+        old_files, old_item_names, old_meta, legacy_meta = self._read_old_meta(segments, ctx)
+        if not legacy_meta and self._skip_unchanged(tree, segments, old_meta, ctx):
+            return  # nothing changed in the whole tree
+
+        old_folders = {item['name']: item for item in old_meta['folders']} if old_meta is not None else {}
         for key, folder in folders:
-            self._sync_tree(folder, [*segments, key], tqdms, preserved)
-            m_folders.append({'name': key, 'metadata': folder.metadata})
+            folder_segments = [*segments, key]
+            if isinstance(folder, _SyncedTree):
+                continue  # already synced
+            elif ctx.journal is not None and ctx.journal.is_finished(folder_segments):
+                ctx.stables[tuple(folder_segments)] = 0  # already synced, but stability unknown
+                continue
+            elif self._skip_unchanged(folder, folder_segments, old_folders.get(key), ctx):
+                continue  # nothing changed in the subtree, its meta will not be read
+            self._collect_trees(folder, folder_segments, states, ctx)
 
-        m_files = []
-        need_load_files = []
-        for key, item in tqdm(items, desc=f"Mark for {'/'.join(segments)}"):
-            old_file_data = old_files.get(key)
-            if old_file_data and old_file_data['type'] == item.__type__:
-                try:
-                    mark = item.refresh_mark(old_file_data['mark'])
-                except ResourceNotChange:
-                    need_load, mark = False, old_file_data['mark']
+        # post-order, so sub-folders will always be synced before their parent
+        states.append(DirectoryPlan(segments, tree, items, folders, old_files, old_item_names, old_meta,
+                                    legacy_meta=legacy_meta))
+
+    def _planned_states(self, plan: SyncPlan, ctx: _SyncContext) -> List[DirectoryPlan]:
+        # the subtrees skipped when planning are not visited again, so their stabilities are taken from the plan
+        ctx.stables.update(plan.stables)
+        ctx.digests.update(plan.digests)
+        states = []
+        for state in plan.directories:
+            if ctx.journal is not None and ctx.journal.is_inside_finished(state.segments):
+                # already synced, the stored meta is used when it is the synced one
+                old_meta = state.old_meta
+                if old_meta is not None and old_meta.get('digest') == \
+                        self._tree_digest(state.tree, state.segments, ctx):
+                    ctx.stables[tuple(state.segments)] = old_meta.get('stable_until', 0)
                 else:
-                    need_load = True
+                    ctx.stables[tuple(state.segments)] = 0  # stability unknown
             else:
-                need_load = True
-                mark = item.refresh_mark(None)
+                states.append(state)
+        return states
+
+    @classmethod
+    def _mark_jobs(cls, states: List[DirectoryPlan]) -> List[Tuple[SyncItem, Optional[dict]]]:
+        return [(item, state.old_files.get(key)) for state in states for key, item in state.items]
 
+    @classmethod
+    def _set_marks(cls, states: List[DirectoryPlan], marks: List[Tuple[bool, dict]]):
+        results = iter(marks)
+        for state in states:
+            state.marks = [next(results) for _ in state.items]
+
+    def _refresh_marks(self, states: List[DirectoryPlan]):
+        with self.report.phase('mark'):
+            marks = refresh_marks(self._mark_jobs(states), self.mark_workers, self.mark_stats)
+        self._set_marks(states, marks)
+
+    def _directory_meta(self, state: DirectoryPlan, ctx: _SyncContext) \
+            -> Tuple[dict, List[Tuple[str, SyncItem, dict]]]:
+        tree_tqdm, file_tqdm = ctx.tqdms
+        tree_tqdm.set_description('/'.join(state.segments))
+        m_folders = []
+        for key, folder in state.folders:
+            folder_segments = [*state.segments, key]
+            m_folders.append({
+                'name': key,
+                'metadata': folder.metadata,
+                'digest': self._tree_digest(folder, folder_segments, ctx),
+                'stable_until': folder.stable_until if isinstance(folder, _SyncedTree)
+                else ctx.stables[tuple(folder_segments)],
+            })
+
+        m_files = []
+        need_load_files = []
+        for (key, item), (need_load, mark) in zip(state.items, state.marks):
             if need_load:
-                need_load_files.append((key, item))
+                need_load_files.append((key, item, mark))
             else:
                 file_tqdm.update()
                 file_tqdm.set_description(plural_word(file_tqdm.n, 'file'))
@@ -93,53 +418,345 @@ class SyncTask:
                 'metadata': item.metadata,
             })
 
-        file_pool, preserved_changes = preserved
-        with TemporaryDirectory() as td:
-            local_metafile = os.path.join(td, self.meta_filename)
-            with open(local_metafile, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'path': '/'.join(segments),
-                    'metadata': tree.metadata,
-                    'files': m_files,
-                    'folders': m_folders,
-                }, f, indent=4, ensure_ascii=False)
-
-            new_item_names = {item['name'] for item in chain(m_files, m_folders)}
-            with nested_with(*[item.load_file() for _, item in need_load_files]) as file_paths:
-                changes = [(local_metafile, [*segments, self.meta_filename])]  # .meta.json
-                for local_file, (key, _) in zip(file_paths, need_load_files):  # items to add
-                    changes.append((local_file, [*segments, key]))
-                for key in sorted(old_item_names - new_item_names):  # items to delete
-                    changes.append((None, [*segments, key]))
-
-                if self.batch == 0:
-                    self.storage.batch_change_files(changes)
+        stable_until = merge_stable_until(chain(
+            (item.stable_until(mark) for (_, item), (_, mark) in zip(state.items, state.marks)),
+            (folder['stable_until'] for folder in m_folders),
+        ))
+        ctx.stables[tuple(state.segments)] = stable_until
+
+        meta_data = {
+            'path': '/'.join(state.segments),
+            'metadata': state.tree.metadata,
+            'digest': self._tree_digest(state.tree, state.segments, ctx),
+            'stable_until': stable_until,
+            'files': m_files,
+            'folders': m_folders,
+        }
+        return meta_data, need_load_files
+
+    def _directory_loaders(self, state: DirectoryPlan, need_load_files: List[Tuple[str, SyncItem, dict]],
+                           ctx: _SyncContext) -> List[SyncItem]:
+        loaders = []
+        for key, item, mark in need_load_files:
+            staged_file = ctx.journal.find_staged([*state.segments, key], item.__type__, mark) \
+                if ctx.journal is not None else None
+            if staged_file is not None:  # staged in the former sync, but not committed
+                loaders.append(_TimedItem(LocalFileSyncItem(staged_file, item.metadata, item.segments), self.report))
+            elif ctx.dedup is not None:
+                loaders.append(ctx.dedup.loader(item, _TimedItem(item, self.report)))
+            else:
+                loaders.append(_TimedItem(item, self.report))
+        return loaders
+
+    def _directory_changes(self, state: DirectoryPlan, meta_data: dict,
+                           need_load_files: List[Tuple[str, SyncItem, dict]], file_paths: List[str], td: str) \
+            -> List[Tuple[Optional[str], List[str]]]:
+        segments = state.segments
+        changes = []
+        entries = self._file_entries(meta_data)
+        for local_file, (key, item, _) in zip(file_paths, need_load_files):  # items to add
+            self._record_digests(entries, key, item, local_file)
+            changes.append((local_file, [*segments, key]))
+        for key in state.deleted:  # items to delete
+            changes.append((None, [*segments, key]))
+        if not changes and state.old_meta is not None and not state.legacy_meta and \
+                json.loads(json.dumps(meta_data, ensure_ascii=False)) == state.old_meta:
+            return []  # nothing changed, and the meta file is the same
+
+        # .meta.json, put it at last, so it will never be committed before the files
+        changes.extend(self._meta_changes(state, meta_data, td))
+        return changes
+
+    @classmethod
+    def _file_entries(cls, meta_data: dict) -> Dict[str, dict]:
+        return {file['name']: file for file in meta_data['files']}
+
+    @classmethod
+    def _record_digests(cls, entries: Dict[str, dict], key: str, item: SyncItem, local_file: str):
+        # the digests computed when loading (e.g. downloaded) are saved in the mark of the meta file,
+        # the mark of the item is replaced instead of changed, it is still used by the journal
+        if not item.__digest_mark__:
+            return
+        digests = cached_file_digests(local_file)
+        entry = entries.get(key)
+        if digests and entry is not None and isinstance(entry['mark'], dict):
+            entry['mark'] = {**entry['mark'], **digests}
+
+    def _meta_changes(self, state: DirectoryPlan, meta_data: dict, td: str) \
+            -> List[Tuple[Optional[str], List[str]]]:
+        changes = []
+        if state.legacy_meta:  # migrated, the legacy meta file is deleted in the same commit as the new one
+            changes.append((None, [*state.segments, self.legacy_meta_filename]))
+        changes.append((self._write_meta(meta_data, td), [*state.segments, self.meta_filename]))
+        return changes
+
+    def _write_meta(self, meta_data: dict, td: str) -> str:
+        local_metafile = os.path.join(td, self.meta_filename)
+        self.meta_format.dump(meta_data, local_metafile)
+        return local_metafile
+
+    def _stage_change(self, i: int, local_file: Optional[str], remote_segs: List[str], size: int,
+                      need_load_files: List[Tuple[str, SyncItem, dict]], ctx: _SyncContext):
+        # the loaded files may be taken over when they are temporary, and so is the meta file
+        if i < len(need_load_files):
+            owned = need_load_files[i][1].__owned_file__ and not ctx.shared_files
+        else:
+            owned = True
+        with self.report.phase('staging'):
+            staged_file = ctx.preserved.put(local_file, remote_segs, size, owned)
+            if ctx.journal is not None and i < len(need_load_files):
+                _, item, mark = need_load_files[i]
+                ctx.journal.record_stage(remote_segs, staged_file, item.__type__, mark)
+
+    def _stage_changes(self, changes: List[Tuple[Optional[str], List[str]]],
+                       need_load_files: List[Tuple[str, SyncItem, dict]], ctx: _SyncContext):
+        preserved = ctx.preserved
+        if self.batch_policy.immediate:
+            if not changes:
+                return  # nothing to commit
+            sizes = [os.path.getsize(file) for file, _ in changes if file is not None]
+            decision = FlushDecision('immediate', len(changes), sum(sizes))
+            if self._committer is not None:  # the files should be kept until committed in background
+                for i, (local_file, remote_segs) in enumerate(changes):
+                    size = os.path.getsize(local_file) if local_file is not None else 0
+                    self._stage_change(i, local_file, remote_segs, size, need_load_files, ctx)
+                self._flush(preserved, decision)
+            else:
+                self._commit(changes, decision, ctx.journal)
+        else:
+            for i, (local_file, remote_segs) in enumerate(changes):
+                size = os.path.getsize(local_file) if local_file is not None else 0
+                decision = self.batch_policy.before_add(len(preserved), preserved.size, size)
+                if decision is not None:
+                    self._flush(preserved, decision)
+                self._stage_change(i, local_file, remote_segs, size, need_load_files, ctx)
+
+            decision = self.batch_policy.after_directory(len(preserved), preserved.size)
+            if decision is not None:
+                self._flush(preserved, decision)
+
+    @classmethod
+    def _update_file_tqdm(cls, n: int, ctx: _SyncContext):
+        _, file_tqdm = ctx.tqdms
+        file_tqdm.update(n)
+        file_tqdm.set_description(plural_word(file_tqdm.n, 'file'))
+
+    def _sync_directory(self, state: DirectoryPlan, ctx: _SyncContext):
+        meta_data, need_load_files = self._directory_meta(state, ctx)
+        if ctx.lane is not None:
+            self._sync_directory_with_lanes(state, meta_data, need_load_files, ctx)
+            return
+
+        def _apply(file_paths: List[str]):
+            with TemporaryDirectory() as td:
+                changes = self._directory_changes(state, meta_data, need_load_files, file_paths, td)
+                self._stage_changes(changes, need_load_files, ctx)
+            self._update_file_tqdm(len(need_load_files), ctx)
+
+        ctx.scheduler.submit(self._directory_loaders(state, need_load_files, ctx), _apply)
+        ctx.tqdms[0].update()
+
+    def _sync_directory_with_lanes(self, state: DirectoryPlan, meta_data: dict,
+                                   need_load_files: List[Tuple[str, SyncItem, dict]], ctx: _SyncContext):
+        lane = ctx.lane
+        small_files, large_files = self.lanes.split(need_load_files)
+        large_loaders = self._directory_loaders(state, large_files, ctx)
+        entries, items = self._file_entries(meta_data), {key: item for key, item, _ in large_files}
+        lane.submit(state.segments, [(key, loader) for (key, _, _), loader in zip(large_files, large_loaders)],
+                    on_loaded=lambda key, local_file: self._record_digests(entries, key, items[key], local_file))
+
+        def _release():
+            with TemporaryDirectory() as td_:
+                self._stage_changes(self._meta_changes(state, meta_data, td_), [], ctx)
+
+        def _apply(file_paths: List[str]):
+            with TemporaryDirectory() as td:
+                changes = self._directory_changes(state, meta_data, small_files, file_paths, td)
+                if changes and changes[-1][1][-1] == self.meta_filename and lane.is_holding(state.segments):
+                    # the meta file waits for the large files, and the meta files before it
+                    changes = changes[:-2] if state.legacy_meta else changes[:-1]
+                    lane.hold(state.segments, _release)
+                if changes:
+                    self._stage_changes(changes, small_files, ctx)
+            self._update_file_tqdm(len(small_files), ctx)
+            lane.release_ready()
+
+        ctx.scheduler.submit(self._directory_loaders(state, small_files, ctx), _apply)
+        ctx.tqdms[0].update()
+
+    def _plan_tree(self, tree: SyncTree, segments: List[str], ctx: _SyncContext) -> List[DirectoryPlan]:
+        states: List[DirectoryPlan] = []
+        self._collect_trees(tree, segments, states, ctx)
+        self._refresh_marks(states)
+        if ctx.dedup is not None:
+            ctx.dedup.register(states)
+        return states
+
+    def _sync_tree(self, tree: SyncTree, segments: List[str], ctx: _SyncContext):
+        if ctx.journal is not None and ctx.journal.is_finished(segments):
+            return  # already synced
+
+        for state in self._plan_tree(tree, segments, ctx):
+            self._sync_directory(state, ctx)
+
+    def _sync_stream(self, ctx: _SyncContext):
+        tree = SyncTree()
+        meta_items: List[MetadataItem] = []
+
+        def _complete(segments: List[str]):
+            nonlocal tree, meta_items
+            current_metas, rest_metas = [], []
+            for meta_item in meta_items:
+                if meta_item.segments[:len(segments)] == segments:
+                    current_metas.append(meta_item)
+                else:
+                    rest_metas.append(meta_item)
+            meta_items = rest_metas
+            for meta_item in current_metas:
+                tree.add_meta_item(meta_item)
+
+            parent, target = None, tree
+            for segment in segments:
+                if not isinstance(target, SyncTree) or segment not in target.items:
+                    return  # nothing in this directory
+                parent, target = target, target.items[segment]
+            if not isinstance(target, SyncTree) or isinstance(target, _SyncedTree):
+                return  # not a directory, or already synced
+
+            self._sync_tree(target, segments, ctx)
+            synced = (self._tree_digest(target, segments, ctx), ctx.stables.get(tuple(segments), 0))
+            if parent is not None:
+                parent.items[segments[-1]] = _SyncedTree(target.metadata, *synced)
+            else:
+                tree = _SyncedTree(target.metadata, *synced)
+
+        for item in self.report.iter_phase('crawl', self.resource.iter_sync_items()):
+            if isinstance(item, MetadataItem):
+                meta_items.append(item)
+            elif isinstance(item, CompleteItem):
+                _complete(item.segments)
+            else:
+                tree.add_item(item)
+
+        _complete([])
+
+    def _sync_roots(self, tree: SyncTree, ctx: _SyncContext) -> List[Tuple[SyncTree, List[str]]]:
+        if self.sharding is None:
+            return [(tree, [])]
+        elif self.shard is not None:
+            return [
+                (value, [key]) for key, value in sorted(tree.items.items())
+                if isinstance(value, SyncTree) and self.sharding.shard_of(key) == self.shard
+            ]
+        else:
+            for key, value in sorted(tree.items.items()):
+                if isinstance(value, SyncTree):
+                    _, _, folder_meta, _ = self._read_old_meta([key], ctx)
+                    if folder_meta is None:
+                        raise ValueError(f'Folder {key!r} of shard {self.sharding.shard_of(key)!r} '
+                                         f'is not synced yet.')
+                    digest = folder_meta.get('digest') or self._tree_digest(value, [key], ctx)
+                    tree.items[key] = _SyncedTree(value.metadata, digest, folder_meta.get('stable_until', 0))
+            return [(tree, [])]
+
+    def _prefetch_metas(self) -> Optional[Dict[Tuple[str, ...], _MetaDataType]]:
+        # the binary meta files are always read one by one
+        if self.prefetch_meta and not self.meta_format.__binary__:
+            with self.report.phase('meta_read'):
+                return _merge_metas(
+                    self.storage.read_all_texts(self.meta_filename),
+                    self.storage.read_all_texts(self.legacy_meta_filename) if self._has_legacy_meta else {},
+                )
+        else:
+            return None
+
+    def _grab_tree(self) -> SyncTree:
+        start_time = time.time()
+        crawl_seconds = self.report.phases['crawl'].seconds
+        tree = self.resource.sync_tree(self.report.iter_phase('crawl', self.resource.iter_sync_items()))
+        crawl_seconds = self.report.phases['crawl'].seconds - crawl_seconds
+        self.report.add_phase('tree', time.time() - start_time - crawl_seconds)
+        return tree
+
+    def _reset_stats(self):
+        self.mark_stats = MarkRefreshStats()
+        self.report = SyncReport(self.mark_stats)
+
+    def plan(self) -> SyncPlan:
+        self._reset_stats()
+        tree: SyncTree = self._grab_tree()
+        ctx = _SyncContext(None, None, None, self._prefetch_metas())
+        states = []
+        for root, segments in self._sync_roots(tree, ctx):
+            states.extend(self._plan_tree(root, segments, ctx))
+        return SyncPlan(states, self.batch_policy, ctx.stables, ctx.digests)
+
+    def sync(self, plan: Optional[SyncPlan] = None) -> SyncReport:
+        self._validate()
+        if plan is None:  # or continue with the statistics of planning
+            self._reset_stats()
+        journal = SyncJournal(self.journal) if self.journal is not None else None
+        preserved = _StagedChanges(journal, self.staging_dir)
+        if self.pipeline > 0:
+            self._committer = BackgroundCommitter(self._commit, self.pipeline)
+        lane = None
+        dedup = DedupCache(self.report, self.staging_dir) if self.dedup else None
+        try:
+            if plan is not None:
+                tqdms = (tqdm(total=len(plan.directories)), tqdm(total=plan.total_files))
+            elif self.stream:
+                tqdms = (tqdm(), tqdm())
+            else:
+                tree: SyncTree = self._grab_tree()
+                old_metas = self._prefetch_metas()
+                roots = self._sync_roots(tree, _SyncContext(None, None, None, old_metas))
+                counts = [_count_trees(root) for root, _ in roots]
+                tqdms = (tqdm(total=sum(c for c, _ in counts)), tqdm(total=sum(c for _, c in counts)))
+
+            if self.lanes is not None:
+                lane = LargeFileLane(
+                    self.lanes, lambda changes, decision: self._commit(changes, decision, journal, lane.policy),
+                    self.staging_dir, on_committed=lambda n: self._update_file_tqdm(n, ctx),
+                )
+
+            with LoadScheduler(self.workers) as scheduler:
+                if plan is not None:
+                    ctx = _SyncContext(tqdms, preserved, scheduler, lane=lane)
+                    ctx.dedup = dedup
+                    if dedup is not None:
+                        dedup.register(plan.directories)
+                    for state in self._planned_states(plan, ctx):
+                        self._sync_directory(state, ctx)
+                elif self.stream:
+                    ctx = _SyncContext(tqdms, preserved, scheduler, self._prefetch_metas(), lane)
+                    ctx.dedup = dedup
+                    self._sync_stream(ctx)
                 else:
-                    for local_file, remote_segs in changes:
-                        if local_file is not None:
-                            preserved_changes.append((file_pool.put_file(local_file), remote_segs))
-                        else:
-                            preserved_changes.append((None, remote_segs))
-
-                    if 0 < self.batch <= len(preserved_changes):
-                        self.storage.batch_change_files(preserved_changes)
-                        preserved_changes.clear()
-                        file_pool.cleanup()
-
-            file_tqdm.update(len(need_load_files))
-            file_tqdm.set_description(plural_word(file_tqdm.n, 'file'))
-
-        tree_tqdm.update()
-
-    def sync(self):
-        tree: SyncTree = self.resource.sync_tree()
-        total_trees, total_files = _count_trees(tree)
-
-        tree_tqdm = tqdm(total=total_trees)
-        file_tqdm = tqdm(total=total_files)
-        file_pool, preserved_changes = FilePool(), []
-        self._sync_tree(tree, [], (tree_tqdm, file_tqdm), (file_pool, preserved_changes))
-        if preserved_changes:
-            self.storage.batch_change_files(preserved_changes)
-            preserved_changes.clear()
-            file_pool.cleanup()
+                    ctx = _SyncContext(tqdms, preserved, scheduler, old_metas, lane)
+                    ctx.dedup = dedup
+                    for root, segments in roots:
+                        self._sync_tree(root, segments, ctx)
+
+            if lane is not None:
+                lane.finish()
+            if preserved:
+                self._flush(preserved, FlushDecision('final', len(preserved), preserved.size))
+            if self._committer is not None:
+                self._committer.join()
+        finally:
+            if lane is not None:
+                lane.close()
+            if dedup is not None:
+                dedup.close()
+            if self._committer is not None:
+                self._committer.close()
+                self._committer = None
+            if journal is not None:
+                journal.close()
+
+        if journal is not None:
+            self._cleanup(journal.finish)
+        self.report.finish()
+        if self.on_report is not None:
+            self.on_report(self.report)
+        return self.report
@@ -1,6 +1,11 @@
-from .download import download_file
-from .filepool import FilePool
-from .hash import hash_anything
+from .aio import to_thread, thread_context
+from .asession import get_aiohttp_session, optional_aiohttp_session, asrequest
+from .download import download_file, adownload_file
+from .filepool import FilePool, reflink_file, clone_file
+from .hash import hash_anything, StreamDigest, file_digest, cached_file_digests, register_file_digests, \
+    release_file_digests
+from .ratelimit import RateLimiter, HostLimiter, TokenBucket, AdaptiveConcurrency
+from .retry import RetryPolicy, RetryAttempt
 from .segments import to_segments, TargetPathType
-from .session import get_requests_session, srequest
+from .session import get_requests_session, get_shared_session, close_shared_sessions, srequest
 from .text import text_concat, cycle, text_parallel
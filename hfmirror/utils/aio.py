@@ -0,0 +1,33 @@
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Callable, TypeVar, ContextManager, AsyncContextManager
+
+_T = TypeVar('_T')
+
+
+async def to_thread(func: Callable[..., _T], *args, **kwargs) -> _T:
+    """
+    Overview:
+        Run blocking ``func`` in the default executor of the running event loop.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+
+@asynccontextmanager
+async def thread_context(cm: ContextManager[_T]) -> AsyncContextManager[_T]:
+    """
+    Overview:
+        Adapt a blocking context manager to an async one, \
+        its ``__enter__`` and ``__exit__`` are called in the default executor.
+    """
+    value = await to_thread(cm.__enter__)
+    try:
+        yield value
+    except BaseException:
+        if not await to_thread(cm.__exit__, *sys.exc_info()):
+            raise
+    else:
+        await to_thread(cm.__exit__, None, None, None)
@@ -0,0 +1,85 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, AsyncContextManager
+
+from .retry import RETRY_STATUSES
+from .session import DEFAULT_TIMEOUT, DEFAULT_USER_AGENT
+
+try:
+    import aiohttp
+except (ImportError, ModuleNotFoundError):  # pragma: no cover
+    aiohttp = None
+
+
+def _check_aiohttp():
+    if aiohttp is None:  # pragma: no cover
+        raise ModuleNotFoundError('Package aiohttp is required for async syncing, '
+                                  'please install it with `pip install hfmirror[async]`.')
+
+
+def get_aiohttp_session(timeout: int = DEFAULT_TIMEOUT, headers: Optional[Dict[str, str]] = None,
+                        limit: int = 100) -> 'aiohttp.ClientSession':
+    """
+    Overview:
+        Create an aiohttp session with the same default headers and timeouts as \
+        :func:`hfmirror.utils.session.get_requests_session`. It should be created inside a running event loop.
+
+    :param timeout: Timeout of connecting and reading, in seconds.
+    :param headers: Extra headers of the session.
+    :param limit: Max number of simultaneous connections of the session.
+    """
+    _check_aiohttp()
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+        connector=aiohttp.TCPConnector(limit=limit),
+        headers={
+            "User-Agent": DEFAULT_USER_AGENT,
+            **dict(headers or {}),
+        },
+    )
+
+
+@asynccontextmanager
+async def optional_aiohttp_session(session: Optional['aiohttp.ClientSession'] = None) \
+        -> AsyncContextManager['aiohttp.ClientSession']:
+    # use the given session, or a temporary one closed after used
+    if session is not None:
+        yield session
+    else:
+        async with get_aiohttp_session() as session:
+            yield session
+
+
+async def asrequest(session: 'aiohttp.ClientSession', method, url, *, max_retries: int = 5,
+                    sleep_time: float = 5.0, raise_for_status: bool = True, **kwargs) -> 'aiohttp.ClientResponse':
+    """
+    Overview:
+        Async version of :func:`hfmirror.utils.session.srequest`. The responses of retryable status \
+        are retried as well, because aiohttp has no retry adapter like requests.
+        The returned response should be released by the caller.
+    """
+    _check_aiohttp()
+    resp = None
+    for i in range(max_retries):
+        try:
+            resp = await session.request(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if i == max_retries - 1:
+                raise
+            await asyncio.sleep(sleep_time)
+        else:
+            if resp.status in RETRY_STATUSES and i < max_retries - 1:
+                resp.release()
+                await asyncio.sleep(sleep_time)
+            else:
+                break
+
+    assert resp is not None
+    if raise_for_status:
+        try:
+            resp.raise_for_status()
+        except aiohttp.ClientResponseError:
+            resp.release()
+            raise
+
+    return resp
@@ -1,27 +1,334 @@
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, List, Tuple, Mapping, Dict, Callable
 
 import requests
+from requests.exceptions import RequestException
 from tqdm.auto import tqdm
 
-from .session import get_requests_session, srequest
+from .asession import aiohttp, optional_aiohttp_session, asrequest
+from .hash import StreamDigest, register_file_digests
+from .retry import RetryPolicy
+from .session import get_shared_session, srequest, _session_retry_policy
 
+DEFAULT_MIN_SEGMENT_SIZE = 8 << 20  # 8 MiB
+PARTIAL_SAVE_INTERVAL = 4 << 20  # save the state of partial downloads every 4 MiB
 
-def download_file(url, filename, expected_size: int = None, desc=None, session=None, **kwargs):
-    session = session or get_requests_session()
-    response = srequest(session, 'GET', url, stream=True, allow_redirects=True, **kwargs)
-    expected_size = expected_size or response.headers.get('Content-Length', None)
-    expected_size = int(expected_size) if expected_size is not None else expected_size
 
+def _range_size(response: requests.Response) -> Optional[int]:
+    # size of the file when the server accepts the range requests of it, otherwise None
+    headers = response.headers
+    if response.status_code != 200 or headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    if headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None  # ranges of the encoded content
+    content_length = headers.get('Content-Length', '')
+    return int(content_length) if content_length.isdigit() else None
+
+
+def _range_validator(headers: Mapping[str, str]) -> Optional[str]:
+    # validator for If-Range, so that the segments are all from the same version of the file
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):  # weak etags can not be used in If-Range
+        return etag
+    else:
+        return headers.get('Last-Modified')
+
+
+def _segment_ranges(size: int, segments: int, min_segment_size: int) -> List[Tuple[int, int]]:
+    count = max(1, min(segments, size // max(min_segment_size, 1)))
+    step = -(-size // count)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _download_segment(session: requests.Session, url: str, filename: str, start: int, end: int,
+                      response: Optional[requests.Response], headers: Dict[str, str], retries: int,
+                      retry_policy: RetryPolicy, progress: Callable[[int, bytes], None], **kwargs):
+    # download bytes [start, end] of the file, the broken streams are resumed from where they stopped
+    offset, tries = start, 0
+    while True:
+        if response is None:
+            response = srequest(session, 'GET', url, stream=True, allow_redirects=True,
+                                headers={**headers, 'Range': f'bytes={offset}-{end}'}, **kwargs)
+            if not _range_served(response, offset):
+                response.close()
+                raise requests.exceptions.HTTPError(f'Range {offset}-{end} of {url!r} not served, '
+                                                    f'the file may be changed.', response=response)
+
+        try:
+            with open(filename, 'r+b') as f:
+                f.seek(offset)
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    chunk = chunk[:end + 1 - offset]  # the first response may be the whole file
+                    f.write(chunk)
+                    f.flush()  # written before counted, so the saved partial state is always behind the file
+                    progress(offset, chunk)
+                    offset += len(chunk)
+                    if offset > end:
+                        break
+            if offset > end:
+                return
+            error = requests.exceptions.ChunkedEncodingError(
+                f'Range {start}-{end} of {url!r} ended at {offset}.')
+        except RequestException as err:
+            error = err
+        finally:
+            response.close()
+            response = None
+
+        tries += 1
+        if tries > retries:
+            raise error
+        time.sleep(retry_policy.backoff_time(tries))
+
+
+def _range_served(response: requests.Response, offset: int) -> bool:
+    return response.status_code == 206 and response.headers.get('Content-Range', '').startswith(f'bytes {offset}-')
+
+
+def _download_ranges(session: requests.Session, response: requests.Response, filename: str,
+                     ranges: List[Tuple[int, int]], validator: Optional[str], retries: int,
+                     retry_policy: Optional[RetryPolicy], progress: Callable[[int, int, bytes], None],
+                     headers: Dict[str, str], **kwargs):
+    # download the ranges of the preallocated file in parallel,
+    # the first range is taken from the response already opened
+    if validator:
+        headers = {**headers, 'If-Range': validator}
+    retry_policy = retry_policy or _session_retry_policy(session) or RetryPolicy()
+    if _session_retry_policy(session) is None:
+        kwargs['retry_policy'] = retry_policy
+
+    if len(ranges) == 1:
+        (start, end), = ranges
+        _download_segment(session, response.url, filename, start, end, response, headers, retries, retry_policy,
+                          partial(progress, 0), **kwargs)
+        return
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(_download_segment, session, response.url, filename, start, end,
+                            response if i == 0 else None, headers, retries, retry_policy,
+                            partial(progress, i), **kwargs)
+            for i, (start, end) in enumerate(ranges)
+        ]
+        for future in futures:
+            future.result()
+
+
+class _PartialDownload:
+    # state of the partial download in ``<filename>.part``, saved in the sidecar file ``<filename>.part.json``
+    # ranges are the [start, offset, end] of the segments, offset is the next byte to receive
+
+    def __init__(self, filename: str, url: str, validator: str, size: int, ranges: List[List[int]]):
+        self.filename = filename
+        self.url = url
+        self.validator = validator
+        self.size = size
+        self.ranges = [list(r) for r in ranges]
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def part_filename(self) -> str:
+        return f'{self.filename}.part'
+
+    @property
+    def state_filename(self) -> str:
+        return f'{self.filename}.part.json'
+
+    @property
+    def received(self) -> int:
+        return sum(offset - start for start, offset, _ in self.ranges)
+
+    def pending(self) -> List[Tuple[int, int, int]]:
+        return [(i, offset, end) for i, (_, offset, end) in enumerate(self.ranges) if offset <= end]
+
+    @classmethod
+    def load(cls, filename: str, url: str) -> Optional['_PartialDownload']:
+        try:
+            with open(f'{filename}.part.json', 'r') as f:
+                data = json.load(f)
+            partial_ = cls(filename, data['url'], data['validator'], data['size'], data['ranges'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        if partial_.url != url or not os.path.exists(partial_.part_filename) or \
+                os.path.getsize(partial_.part_filename) != partial_.size:
+            return None
+        return partial_
+
+    def create(self):
+        with open(self.part_filename, 'wb') as f:  # preallocate the file
+            f.truncate(self.size)
+        self.save()
+
+    def _save(self):
+        tmp_filename = f'{self.state_filename}.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({
+                'url': self.url,
+                'validator': self.validator,
+                'size': self.size,
+                'received': self.received,
+                'ranges': self.ranges,
+            }, f)
+        os.replace(tmp_filename, self.state_filename)
+        self._unsaved = 0
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def advance(self, index: int, n: int):
+        with self._lock:
+            self.ranges[index][1] += n
+            self._unsaved += n
+            if self._unsaved >= PARTIAL_SAVE_INTERVAL:
+                self._save()
+
+    def complete(self):
+        os.replace(self.part_filename, self.filename)
+        os.remove(self.state_filename)
+
+    def discard(self):
+        for filename in (self.part_filename, self.state_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+def _resume_partial(session: requests.Session, url: str, filename: str, retry_policy: Optional[RetryPolicy],
+                    headers: Dict[str, str], **kwargs) \
+        -> Tuple[Optional[_PartialDownload], Optional[requests.Response]]:
+    # continue the partial download of the same url, start over when its validator changed
+    partial_ = _PartialDownload.load(filename, url)
+    if partial_ is None:
+        return None, None
+
+    pending = partial_.pending()
+    if not pending:
+        return partial_, None
+    _, offset, end = pending[0]
+    response = srequest(session, 'GET', url, stream=True, allow_redirects=True, retry_policy=retry_policy,
+                        headers={**headers, 'Range': f'bytes={offset}-{end}', 'If-Range': partial_.validator},
+                        raise_for_status=False, **kwargs)
+    if _range_served(response, offset):
+        return partial_, response
+
+    partial_.discard()
+    if response.status_code == 200:  # the whole file of the new version
+        return None, response
+    else:
+        response.close()
+        return None, None
+
+
+def download_file(url, filename, expected_size: int = None, desc=None, session=None,
+                  retry_policy: Optional[RetryPolicy] = None, segments: int = 1,
+                  min_segment_size: int = DEFAULT_MIN_SEGMENT_SIZE, segment_retries: int = 3,
+                  resume: bool = False, digests: bool = False, **kwargs):
+    """
+    Overview:
+        Download the file from ``url`` to ``filename``.
+
+        When ``segments`` is more than ``1``, and the server advertises ``Accept-Ranges: bytes`` and the size, \
+        the file is preallocated and downloaded in at most ``segments`` parallel range requests, each of them \
+        is at least ``min_segment_size`` bytes, and resumed at most ``segment_retries`` times when the stream \
+        is broken. Otherwise, it is downloaded in a single stream.
+
+        When ``resume`` is ``True``, and the server also gives an ``ETag`` or ``Last-Modified`` of the file \
+        which is at least ``min_segment_size`` bytes, it is downloaded to ``<filename>.part``, with the url, \
+        the validator and the bytes received saved in ``<filename>.part.json``. They are kept when the download \
+        failed, and the next call with the same ``url`` and ``filename`` continues it with ``Range`` and \
+        ``If-Range`` requests, the download starts over only when the file on the server is changed.
+
+        When ``digests`` is ``True``, the ``sha256`` and ``git_sha1`` of the file are computed while downloading \
+        (see :class:`hfmirror.utils.hash.StreamDigest`), and registered with \
+        :func:`hfmirror.utils.hash.register_file_digests`, so the file is not read again to hash it. \
+        The caller owns the downloaded file, and should call :func:`hfmirror.utils.hash.release_file_digests` \
+        when it is removed or handed over.
+
+    :param url: Url of the file.
+    :param filename: Local filename to save.
+    :param expected_size: Expected size of the file, the ``Content-Length`` will be used when not given.
+    :param desc: Description of the progress bar.
+    :param session: Session of requests, the shared session will be used when not given.
+    :param retry_policy: Retry policy used by the shared session when ``session`` is not given, \
+        or to retry the requests of the given session not created by \
+        :func:`hfmirror.utils.session.get_requests_session`.
+    :param segments: Max number of parallel segments, ``1`` means always a single stream.
+    :param min_segment_size: Min size of each segment.
+    :param segment_retries: Max retries of each broken segment.
+    :param resume: Keep the partial download and continue it.
+    :param digests: Compute the digests of the file while downloading.
+    """
+    headers = dict(kwargs.pop('headers', None) or {})
+    session = session or get_shared_session(retry_policy=retry_policy)
     desc = desc or os.path.basename(filename)
     directory = os.path.dirname(filename)
     if directory:
         os.makedirs(directory, exist_ok=True)
 
-    with open(filename, 'wb') as f:
-        with tqdm(total=expected_size, unit='B', unit_scale=True, unit_divisor=1024, desc=desc) as pbar:
-            for chunk in response.iter_content(chunk_size=1024):
-                f.write(chunk)
+    partial_, response = None, None
+    if resume:
+        partial_, response = _resume_partial(session, url, filename, retry_policy, headers, **kwargs)
+    if partial_ is None:
+        if response is None:
+            response = srequest(session, 'GET', url, stream=True, allow_redirects=True,
+                                retry_policy=retry_policy, headers=headers, **kwargs)
+        range_size = _range_size(response) if segments > 1 or resume else None
+        validator = _range_validator(response.headers)
+        if resume and range_size is not None and range_size >= min_segment_size and validator:
+            ranges = _segment_ranges(range_size, segments, min_segment_size)
+            partial_ = _PartialDownload(filename, url, validator, range_size,
+                                        [[start, start, end] for start, end in ranges])
+            partial_.create()
+    else:
+        range_size, validator = partial_.size, partial_.validator
+
+    expected_size = expected_size or (response.headers.get('Content-Length', None) if partial_ is None
+                                      else partial_.size)
+    expected_size = int(expected_size) if expected_size is not None else expected_size
+
+    pending = partial_.pending() if partial_ is not None else []
+    digest = StreamDigest(range_size if range_size is not None else expected_size) if digests else None
+    with tqdm(total=expected_size, initial=partial_.received if partial_ is not None else 0,
+              unit='B', unit_scale=True, unit_divisor=1024, desc=desc) as pbar:
+        lock = threading.Lock()
+
+        def _progress(index: int, offset: int, chunk: bytes):
+            with lock:
                 pbar.update(len(chunk))
+            if digest is not None:
+                digest.update(offset, chunk)
+            if partial_ is not None:
+                partial_.advance(pending[index][0], len(chunk))
+
+        if partial_ is not None:
+            try:
+                if pending:
+                    _download_ranges(session, response, partial_.part_filename,
+                                     [(offset, end) for _, offset, end in pending], validator,
+                                     segment_retries, retry_policy, _progress, headers, **kwargs)
+            finally:
+                partial_.save()
+            partial_.complete()
+        elif range_size is not None and segments > 1 and range_size >= 2 * min_segment_size:
+            with open(filename, 'wb') as f:  # preallocate the file
+                f.truncate(range_size)
+            _download_ranges(session, response, filename,
+                             _segment_ranges(range_size, segments, min_segment_size), validator,
+                             segment_retries, retry_policy, _progress, headers, **kwargs)
+        else:
+            with open(filename, 'wb') as f:
+                offset = 0
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+                    _progress(0, offset, chunk)
+                    offset += len(chunk)
 
     actual_size = os.path.getsize(filename)
     if expected_size is not None and actual_size != expected_size:
@@ -29,4 +336,45 @@ def download_file(url, filename, expected_size: int = None, desc=None, session=N
         raise requests.exceptions.HTTPError(f"Downloaded file is not of expected size, "
                                             f"{expected_size} expected but {actual_size} found.")
 
+    if digest is not None:
+        register_file_digests(filename, digest.finish(filename))
+    return filename
+
+
+async def adownload_file(url, filename, expected_size: int = None, desc=None, session=None,
+                         digests: bool = False, **kwargs):
+    """
+    Overview:
+        Async version of :func:`download_file`, with an aiohttp session.
+    """
+    async with optional_aiohttp_session(session) as session:
+        response = await asrequest(session, 'GET', url, allow_redirects=True, **kwargs)
+        async with response:
+            expected_size = expected_size or response.headers.get('Content-Length', None)
+            expected_size = int(expected_size) if expected_size is not None else expected_size
+
+            desc = desc or os.path.basename(filename)
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            digest = StreamDigest(expected_size) if digests else None
+            with open(filename, 'wb') as f:
+                with tqdm(total=expected_size, unit='B', unit_scale=True, unit_divisor=1024, desc=desc) as pbar:
+                    offset = 0
+                    async for chunk in response.content.iter_chunked(1 << 16):
+                        f.write(chunk)
+                        pbar.update(len(chunk))
+                        if digest is not None:
+                            digest.update(offset, chunk)
+                        offset += len(chunk)
+
+    actual_size = os.path.getsize(filename)
+    if expected_size is not None and actual_size != expected_size:
+        os.remove(filename)
+        raise aiohttp.ClientPayloadError(f"Downloaded file is not of expected size, "
+                                         f"{expected_size} expected but {actual_size} found.")
+
+    if digest is not None:  # all the chunks are hashed in order, the file is not read again
+        register_file_digests(filename, digest.finish(filename))
     return filename
@@ -1,31 +1,140 @@
 import os
+import shutil
+import sys
+import tempfile
+from typing import Optional, Dict, List
 
 from hbutils.random import random_sha1_with_timestamp
 from hbutils.system import TemporaryDirectory, copy
 
+from .hash import cached_file_digests, register_file_digests, release_file_digests
+
+try:
+    import fcntl
+except (ImportError, ModuleNotFoundError):  # pragma: no cover
+    fcntl = None
+
+_FICLONE = 0x40049409  # ioctl request of reflink on linux, see ioctl_ficlone(2)
+
+
+def reflink_file(src: str, dst: str) -> bool:
+    """
+    Overview:
+        Clone ``src`` to ``dst`` with reflink (copy-on-write, ``FICLONE``), the data blocks are shared \
+        until one of them is modified. Only supported on linux filesystems like btrfs and xfs.
+
+    :return: Cloned or not, ``dst`` will not be left when failed.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):  # pragma: no cover
+        return False
+
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+    else:
+        return True
+
+
+def clone_file(src: str, dst: str) -> str:
+    # copy file with reflink when possible, return the method used
+    if reflink_file(src, dst):
+        return 'reflink'
+    else:
+        copy(src, dst)
+        return 'copy'
+
+
+class _PersistentDirectory:
+    # like TemporaryDirectory, but will not be removed until cleanup is called
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.name = tempfile.mkdtemp(dir=directory)
+
+    def cleanup(self):
+        shutil.rmtree(self.name, ignore_errors=True)
+
 
 class FilePool:
-    def __init__(self):
-        self.tmpdir = TemporaryDirectory()
+    def __init__(self, directory: Optional[str] = None, hardlink: bool = False, persistent: bool = True):
+        # when directory is given, the staged files are placed inside it,
+        # and they will not be removed until cleanup, even when the process crashes (when persistent),
+        # place it on the same filesystem as the loaded files or the storage to avoid copying
+        self.directory = directory
+        self.persistent = persistent
+
+        # hardlink == False, the files not owned by the pool are cloned with reflink, or copied
+        # hardlink == True, the files not owned by the pool are hard-linked when possible,
+        #   only use it when the source files will not be modified in place before committed
+        self.hardlink = hardlink
+
+        self.tmpdir = self._new_tmpdir()
         self.count = 0
+        self.transfers: Dict[str, int] = {}  # number of files put with each method
+        self._digest_files: List[str] = []  # files with registered digests, released in cleanup
+
+    def _new_tmpdir(self):
+        if self.directory is not None and self.persistent:
+            return _PersistentDirectory(self.directory)
+        else:
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+            return TemporaryDirectory(dir=self.directory)
 
     def __del__(self):
-        self.tmpdir.cleanup()
+        self._release_digests()
+        if not (self.directory is not None and self.persistent):
+            self.tmpdir.cleanup()
         self.count = 0
 
-    def put_file(self, path) -> str:
+    def _release_digests(self):
+        for filename in self._digest_files:
+            release_file_digests(filename)
+        self._digest_files = []
+
+    def _transfer(self, path: str, dst_filename: str, owned: bool) -> str:
+        if owned:
+            try:
+                os.rename(path, dst_filename)
+            except OSError:  # on different filesystems
+                pass
+            else:
+                return 'rename'
+
+        if self.hardlink:
+            try:
+                os.link(path, dst_filename)
+            except OSError:
+                pass
+            else:
+                return 'hardlink'
+
+        return clone_file(path, dst_filename)
+
+    def put_file(self, path, owned: bool = False) -> str:
+        # owned == True, the file is a temporary one and can be taken over,
+        #   it may be moved away and should not be used any more
         tmppath = os.path.join(self.tmpdir.name, random_sha1_with_timestamp())
         os.makedirs(tmppath)
 
         dst_filename = os.path.join(tmppath, os.path.basename(os.path.abspath(path)))
-        copy(path, dst_filename)
+        # the registered digests are carried to the staged file, and kept until cleanup
+        digests = release_file_digests(path) if owned else cached_file_digests(path)
+        method = self._transfer(path, dst_filename, owned)
+        self.transfers[method] = self.transfers.get(method, 0) + 1
+        register_file_digests(dst_filename, digests)
+        self._digest_files.append(dst_filename)
 
         self.count += 1
         return dst_filename
 
     def cleanup(self):
+        self._release_digests()
         self.tmpdir.cleanup()
-        self.tmpdir = TemporaryDirectory()
+        self.tmpdir = self._new_tmpdir()
         self.count = 0
 
     def __len__(self):
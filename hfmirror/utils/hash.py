@@ -1,4 +1,8 @@
+import os
+import threading
 from collections.abc import Mapping, Sequence
+from hashlib import sha256, sha1
+from typing import Optional, Dict
 
 
 def _object_hashable(obj):
@@ -20,3 +24,130 @@ def _object_hashable(obj):
 
 def hash_anything(obj):
     return hash(_object_hashable(obj))
+
+
+DIGEST_ALGORITHMS = ('sha256', 'git_sha1')
+
+
+def _new_hash(algorithm: str, size: int):
+    if algorithm == 'sha256':
+        return sha256()
+    elif algorithm == 'git_sha1':  # oid of git blob, used by the non-lfs files on huggingface
+        sha = sha1()
+        sha.update(f'blob {size}\0'.encode('utf-8'))
+        return sha
+    else:
+        raise ValueError(f'Unknown digest algorithm - {algorithm!r}.')
+
+
+class StreamDigest:
+    """
+    Overview:
+        Digests (``sha256`` and ``git_sha1``) of a file computed while it is written, so that the file \
+        is not read again. ``git_sha1`` is only computed when the size is correctly known before writing.
+
+        The chunks can be given out of order (e.g. the parallel segments of a download), only the ones \
+        following the hashed part are hashed in place, and the rest of the file is read back in :meth:`finish`.
+
+    :param size: Size of the file, ``None`` means unknown.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size
+        self._hashes = {'sha256': sha256()}
+        if size is not None:
+            self._hashes['git_sha1'] = _new_hash('git_sha1', size)
+        self.position = 0  # bytes hashed
+        self._lock = threading.Lock()
+
+    def update(self, offset: int, data: bytes):
+        with self._lock:
+            if offset == self.position:
+                for sha in self._hashes.values():
+                    sha.update(data)
+                self.position += len(data)
+
+    def finish(self, filename: str, chunk_for_hash: int = 1 << 20) -> Dict[str, str]:
+        with self._lock:
+            if self.size is not None and os.path.getsize(filename) != self.size:
+                self._hashes.pop('git_sha1', None)  # the size is not the one expected, e.g. encoded content
+            with open(filename, 'rb') as f:
+                f.seek(self.position)
+                while True:
+                    data = f.read(chunk_for_hash)
+                    if not data:
+                        break
+                    for sha in self._hashes.values():
+                        sha.update(data)
+                    self.position += len(data)
+
+            return {algorithm: sha.hexdigest() for algorithm, sha in self._hashes.items()}
+
+
+_FILE_DIGESTS: Dict[str, Dict[str, str]] = {}
+_FILE_DIGESTS_LOCK = threading.Lock()
+
+
+def register_file_digests(filename: str, digests: Mapping):
+    """
+    Overview:
+        Save the digests of a file in this process, e.g. computed by :class:`StreamDigest` when downloading, \
+        so that they can be reused by the storages and marks with :func:`file_digest`.
+
+        The digests are kept for the path of the file until :func:`release_file_digests` is called, \
+        so only the owner of the file (e.g. the loader of a temporary file, \
+        or :class:`hfmirror.utils.FilePool`) should register them, and it should not change the file \
+        before releasing it.
+    """
+    key = os.path.abspath(filename)
+    with _FILE_DIGESTS_LOCK:
+        _FILE_DIGESTS[key] = {**_FILE_DIGESTS.get(key, {}), **digests}
+
+
+def release_file_digests(filename: str) -> Dict[str, str]:
+    """
+    Overview:
+        Forget the registered digests of a file, and return them (empty when not registered).
+    """
+    with _FILE_DIGESTS_LOCK:
+        return _FILE_DIGESTS.pop(os.path.abspath(filename), {})
+
+
+def cached_file_digests(filename: str) -> Dict[str, str]:
+    """
+    Overview:
+        Registered digests of a file, empty when not registered.
+    """
+    with _FILE_DIGESTS_LOCK:
+        return dict(_FILE_DIGESTS.get(os.path.abspath(filename), {}))
+
+
+def file_digest(filename: str, algorithm: str = 'sha256', chunk_for_hash: int = 1 << 20) -> str:
+    """
+    Overview:
+        Digest of a file, the registered one is used when exists, otherwise it is calculated \
+        (and saved when the file is registered).
+
+    :param filename: Filename.
+    :param algorithm: ``sha256``, or ``git_sha1`` (the oid of git blob).
+    :param chunk_for_hash: Chunk size for hashing calculation.
+    """
+    digest = cached_file_digests(filename).get(algorithm)
+    if digest is not None:
+        return digest
+
+    sha = _new_hash(algorithm, os.path.getsize(filename))
+    with open(filename, 'rb') as f:
+        # make sure the big files will not cause OOM
+        while True:
+            data = f.read(chunk_for_hash)
+            if not data:
+                break
+            sha.update(data)
+
+    digest = sha.hexdigest()
+    key = os.path.abspath(filename)
+    with _FILE_DIGESTS_LOCK:
+        if key in _FILE_DIGESTS:  # only kept for the registered files, which are not changed until released
+            _FILE_DIGESTS[key][algorithm] = digest
+    return digest
@@ -0,0 +1,241 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, ContextManager
+from urllib.parse import urlsplit
+
+from .retry import retry_after_seconds
+
+THROTTLE_STATUSES = [429, 503]
+
+
+class TokenBucket:
+    """
+    Overview:
+        Token bucket limiting the rate of requests, ``rate`` tokens are added per second, \
+        and at most ``burst`` tokens can be saved. Thread-safe.
+
+    :param rate: Tokens added per second.
+    :param burst: Max number of tokens in the bucket, default is ``max(rate, 1)``.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f'Rate should be positive, but {rate!r} found.')
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # take a token, the tokens may be owed, return the seconds to wait before using it
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} rate: {self.rate!r}, burst: {self.burst!r}>'
+
+
+class AdaptiveConcurrency:
+    """
+    Overview:
+        AIMD (additive increase, multiplicative decrease) limit of concurrent requests. The limit is \
+        multiplied with ``decrease`` when throttled (at most once in ``cooldown`` seconds, because the requests \
+        in flight are throttled together), and increased with ``increase / limit`` for each healthy response, \
+        so it grows about ``increase`` in each round of requests.
+
+    :param initial: Initial limit.
+    :param minimum: Min limit.
+    :param maximum: Max limit.
+    :param increase: Additive increase of each round.
+    :param decrease: Multiplicative decrease when throttled.
+    :param cooldown: Min seconds between two decreases.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 64,
+                 increase: float = 1.0, decrease: float = 0.5, cooldown: float = 1.0):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        with self._condition:
+            old_limit = int(self.limit)
+            self.limit = min(float(self.maximum), self.limit + self.increase / self.limit)
+            if int(self.limit) > old_limit:
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = time.monotonic()
+            if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+                self._last_decrease = now
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} limit: {self.limit:.2f}, in_flight: {self.in_flight!r}>'
+
+
+class HostLimiter:
+    """
+    Overview:
+        Limiter of the requests to one host, with an optional :class:`TokenBucket` and \
+        an optional :class:`AdaptiveConcurrency`.
+
+        When throttled (``429`` or ``503``), all the requests to the host are paused for the seconds in \
+        ``Retry-After``, or an exponential backoff when it is not given.
+    """
+
+    def __init__(self, bucket: Optional[TokenBucket] = None, concurrency: Optional[AdaptiveConcurrency] = None,
+                 max_backoff: float = 60.0):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.throttled = 0
+        self._throttled_in_row = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_pause(self):
+        while True:
+            wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+    def acquire(self):
+        self._wait_pause()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        if self.bucket is not None:
+            self.bucket.acquire()
+        with self._lock:
+            self.requests += 1
+
+    def release(self):
+        if self.concurrency is not None:
+            self.concurrency.release()
+
+    def feedback(self, status_code: int, retry_after: Optional[str] = None):
+        if status_code in THROTTLE_STATUSES:
+            with self._lock:
+                self.throttled += 1
+                self._throttled_in_row += 1
+                pause = retry_after_seconds(retry_after)
+                if pause is None:
+                    pause = min(self.max_backoff, 2.0 ** (self._throttled_in_row - 1))
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            if self.concurrency is not None:
+                self.concurrency.on_throttle()
+        elif status_code < 500:
+            with self._lock:
+                self._throttled_in_row = 0
+            if self.concurrency is not None:
+                self.concurrency.on_success()
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            'rate': self.bucket.rate if self.bucket is not None else None,
+            'concurrency': int(self.concurrency.limit) if self.concurrency is not None else None,
+            'in_flight': self.concurrency.in_flight if self.concurrency is not None else None,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'paused_for': self.paused_for,
+        }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} requests: {self.requests!r}, throttled: {self.throttled!r}>'
+
+
+class RateLimiter:
+    """
+    Overview:
+        Per-host limiter of the requests, used by :func:`hfmirror.utils.get_requests_session`. \
+        Each host has its own :class:`HostLimiter`, created when it is requested for the first time.
+
+    :param rate: Max requests per second of each host, ``None`` means not limited.
+    :param burst: Burst of the token buckets, see :class:`TokenBucket`.
+    :param concurrency: Initial concurrency of each host with AIMD control, ``None`` means not limited.
+    :param max_concurrency: Max concurrency of each host with AIMD control.
+    :param host_rates: Rates of the specified hosts, e.g. ``{'api.github.com': 1.0}``.
+
+    Examples::
+        >>> limiter = RateLimiter(rate=5, concurrency=4)
+        >>> session = get_requests_session(rate_limiter=limiter)
+        >>> limiter.state()  # current state of all the hosts, for the metrics
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 concurrency: Optional[int] = None, max_concurrency: int = 64,
+                 host_rates: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.host_rates = dict(host_rates or {})
+        self._hosts: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def host(self, host: str) -> HostLimiter:
+        with self._lock:
+            if host not in self._hosts:
+                rate = self.host_rates.get(host, self.rate)
+                self._hosts[host] = HostLimiter(
+                    TokenBucket(rate, self.burst) if rate is not None else None,
+                    AdaptiveConcurrency(self.concurrency, maximum=self.max_concurrency)
+                    if self.concurrency is not None else None,
+                )
+            return self._hosts[host]
+
+    def host_of(self, url: str) -> HostLimiter:
+        return self.host(urlsplit(url).netloc)
+
+    @contextmanager
+    def limit(self, url: str) -> ContextManager[HostLimiter]:
+        host = self.host_of(url)
+        host.acquire()
+        try:
+            yield host
+        finally:
+            host.release()
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {name: host.state() for name, host in sorted(hosts.items())}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} rate: {self.rate!r}, concurrency: {self.concurrency!r}, ' \
+               f'hosts: {len(self._hosts)!r}>'
@@ -0,0 +1,208 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Callable, Iterable, Dict, Any, Union, Tuple
+
+import requests
+from requests.exceptions import RequestException
+
+RETRY_STATUSES = [413, 429, 500, 501, 502, 503, 504, 505, 506, 507, 509, 510, 511]
+RETRY_METHODS = ["HEAD", "GET", "POST", "PUT", "DELETE", "OPTIONS", "TRACE"]
+
+_TimeoutType = Union[None, float, Tuple[Optional[float], Optional[float]]]
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After is seconds or a http date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RetryAttempt:
+    """
+    Overview:
+        Telemetry of one attempt of a request, passed to the ``on_attempt`` of :class:`RetryPolicy`.
+
+        ``status`` is ``None`` when the attempt raised ``error``, and ``wait`` is the seconds to wait \
+        before the next attempt, ``None`` means no more attempts.
+    """
+
+    def __init__(self, method: str, url: str, attempt: int, status: Optional[int],
+                 error: Optional[BaseException], seconds: float, wait: Optional[float]):
+        self.method = method
+        self.url = url
+        self.attempt = attempt
+        self.status = status
+        self.error = error
+        self.seconds = seconds
+        self.wait = wait
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'method': self.method,
+            'url': self.url,
+            'attempt': self.attempt,
+            'status': self.status,
+            'error': repr(self.error) if self.error is not None else None,
+            'seconds': self.seconds,
+            'wait': self.wait,
+        }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.method} {self.url!r}, attempt: {self.attempt!r}, ' \
+               f'status: {self.status!r}, error: {self.error!r}, wait: {self.wait!r}>'
+
+
+def _limit_timeout(timeout: _TimeoutType, remaining: float) -> _TimeoutType:
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    else:
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+class RetryPolicy:
+    """
+    Overview:
+        Retry policy of the requests, used by the sessions created by :func:`hfmirror.utils.get_requests_session` \
+        (including the sessions of huggingface hub), so that each request is retried in only one place.
+
+        The failed attempts (exceptions of requests, or responses of the retryable ``statuses``) are retried \
+        after an exponential backoff ``backoff * multiplier ** (attempt - 1)`` (at most ``max_backoff``), \
+        with a random part of ``jitter`` cut off, or the seconds in ``Retry-After`` when given. \
+        When ``deadline`` is given, no attempts are started after it, and the timeouts of the attempts \
+        are shortened to it.
+
+    :param max_attempts: Max number of attempts of each request, including the first one.
+    :param backoff: Backoff of the first retry, in seconds.
+    :param multiplier: Multiplier of the backoff of each retry, ``1`` means constant backoff.
+    :param max_backoff: Max backoff, in seconds.
+    :param jitter: Max ratio of the backoff randomly cut off, ``0`` means no jitter.
+    :param deadline: Total deadline of each request with all its attempts, in seconds.
+    :param statuses: Status codes to retry.
+    :param methods: Methods to retry.
+    :param respect_retry_after: Wait as ``Retry-After`` header of the responses.
+    :param on_attempt: Callback of the :class:`RetryAttempt` of each attempt.
+
+    Examples::
+        >>> policy = RetryPolicy(max_attempts=4, deadline=120, on_attempt=lambda a: print(a))
+        >>> session = get_requests_session(retry_policy=policy)
+        >>> policy.stats()
+    """
+
+    def __init__(self, max_attempts: int = 6, backoff: float = 1.0, multiplier: float = 2.0,
+                 max_backoff: float = 60.0, jitter: float = 0.5, deadline: Optional[float] = None,
+                 statuses: Iterable[int] = RETRY_STATUSES, methods: Iterable[str] = RETRY_METHODS,
+                 respect_retry_after: bool = True, on_attempt: Optional[Callable[[RetryAttempt], None]] = None):
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.statuses = set(statuses)
+        self.methods = {method.upper() for method in methods}
+        self.respect_retry_after = respect_retry_after
+        self.on_attempt = on_attempt
+
+        self.requests = 0
+        self.attempts = 0
+        self.failures = 0  # requests failed after all the attempts
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def backoff_time(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # seconds to wait after the `attempt`-th attempt failed
+        if retry_after is not None and self.respect_retry_after:
+            return retry_after
+        base = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return base * (1.0 - self.jitter * random.random())
+
+    def _retryable(self, method: str, resp: Optional[requests.Response]) -> bool:
+        return method.upper() in self.methods and (resp is None or resp.status_code in self.statuses)
+
+    def call(self, method: str, url: str, func: Callable[[Optional[float]], requests.Response],
+             pause: Optional[Callable[[requests.Response], Optional[float]]] = None) -> requests.Response:
+        """
+        Overview:
+            Call ``func`` with retries, it is called with the seconds remaining before the deadline \
+            (``None`` when no deadline), and returns a response or raises ``RequestException``.
+            ``pause`` decides the seconds to wait for the failed responses instead of the backoff, \
+            when it returns a value (e.g. the pause of the rate limiter).
+        """
+        start_time = time.monotonic()
+        with self._lock:
+            self.requests += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = self.deadline - (time.monotonic() - start_time) if self.deadline is not None else None
+            attempt_start_time = time.monotonic()
+            resp, error = None, None
+            try:
+                resp = func(remaining)
+            except RequestException as err:
+                error = err
+            seconds = time.monotonic() - attempt_start_time
+
+            wait = None
+            failed = error is not None or resp.status_code in self.statuses
+            if failed and attempt < self.max_attempts and self._retryable(method, resp):
+                if resp is not None and pause is not None:
+                    wait = pause(resp)
+                if wait is None:
+                    wait = self.backoff_time(
+                        attempt, retry_after_seconds(resp.headers.get('Retry-After')) if resp is not None else None)
+                if self.deadline is not None and time.monotonic() + wait - start_time >= self.deadline:
+                    wait = None  # no time for another attempt
+
+            with self._lock:
+                self.attempts += 1
+                if wait is not None:
+                    self.waited += wait
+                elif failed:
+                    self.failures += 1
+            if self.on_attempt is not None:
+                self.on_attempt(RetryAttempt(method, url, attempt, resp.status_code if resp is not None else None,
+                                             error, seconds, wait))
+
+            if wait is None:
+                if error is not None:
+                    raise error
+                return resp
+
+            if resp is not None:
+                resp.close()
+            time.sleep(wait)
+
+    def request(self, session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+        # retry session.request, for the sessions not created by get_requests_session
+        def _request(remaining: Optional[float]) -> requests.Response:
+            if remaining is not None:
+                return session.request(method, url, **{**kwargs, 'timeout': _limit_timeout(
+                    kwargs.get('timeout'), remaining)})
+            else:
+                return session.request(method, url, **kwargs)
+
+        return self.call(method, url, _request)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'attempts': self.attempts,
+                'retries': self.attempts - self.requests,
+                'failures': self.failures,
+                'waited': self.waited,
+            }
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} max_attempts: {self.max_attempts!r}, backoff: {self.backoff!r}, ' \
+               f'deadline: {self.deadline!r}>'
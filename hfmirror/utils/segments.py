@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 from typing import List, Union
 
 TargetPathType = Union[str, List[str]]
@@ -10,6 +11,8 @@ _FORBIDDEN_SEGMENTS = [
     'COM1', 'COM2', 'COM3', 'COM4', 'COM5', 'COM6', 'COM7', 'COM8', 'COM9',
     'LPT1', 'LPT2', 'LPT3', 'LPT4', 'LPT5', 'LPT6', 'LPT7', 'LPT8', 'LPT9',
 ]
+_FORBIDDEN_CHARS_PATTERN = re.compile('[' + re.escape(''.join(sorted(_FORBIDDEN_CHARS))) + ']')
+_FORBIDDEN_SEGMENTS_SET = {segment.lower() for segment in _FORBIDDEN_SEGMENTS}
 
 
 def to_segments(path: TargetPathType) -> List[str]:
@@ -20,14 +23,15 @@ def to_segments(path: TargetPathType) -> List[str]:
     segments = list(filter(bool, segments))
 
     for i, segment in enumerate(segments):
-        for ch in segment:
-            if ch in _FORBIDDEN_CHARS:
-                raise ValueError(f'Segment #{i} contains invalid character - {segment!r}.')
+        if _FORBIDDEN_CHARS_PATTERN.search(segment):
+            raise ValueError(f'Segment #{i} contains invalid character - {segment!r}.')
+        if segment.lower() in _FORBIDDEN_SEGMENTS_SET:
+            raise ValueError(f'Segment #{i} is preserved - {segment!r}.')
 
-        for fseg in _FORBIDDEN_SEGMENTS:
-            if fseg.lower() == segment.lower():
-                raise ValueError(f'Segment #{i} is preserved - {segment!r}.')
+    if '.' in segments or '..' in segments:  # the paths without them are already normalized
+        normed_path = os.path.relpath(os.path.normpath(os.path.join(os.path.sep, *segments)), start=os.path.sep)
+        segments = normed_path.split(os.path.sep)
+        segments = [] if segments == ['.'] else segments
 
-    normed_path = os.path.relpath(os.path.normpath(os.path.join(os.path.sep, *segments)), start=os.path.sep)
-    segments = normed_path.split(os.path.sep)
-    return [] if segments == ['.'] else segments
+    # the same names are shared by lots of paths, e.g. the names of directories
+    return [sys.intern(segment) for segment in segments]
@@ -1,11 +1,32 @@
-import time
-from typing import Optional, Dict
+import os
+import threading
+from typing import Optional, Dict, Tuple, Any
 
 import requests
-from requests.adapters import HTTPAdapter, Retry
-from requests.exceptions import RequestException
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import RateLimiter, HostLimiter, THROTTLE_STATUSES
+from .retry import RetryPolicy, _limit_timeout
 
 DEFAULT_TIMEOUT = 10  # seconds
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 " \
+                     "(KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36"
+DEFAULT_POOL_CONNECTIONS = 16  # hosts with cached pools
+DEFAULT_POOL_MAXSIZE = 32  # connections kept for each host, should cover the concurrent workers
+
+
+class _HostSlot:
+    def __init__(self, host: HostLimiter):
+        self.host = host
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.host.release()
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
@@ -14,46 +35,164 @@ class TimeoutHTTPAdapter(HTTPAdapter):
         if "timeout" in kwargs:
             self.timeout = kwargs["timeout"]
             del kwargs["timeout"]
+        self.rate_limiter: Optional[RateLimiter] = kwargs.pop("rate_limiter", None)
+        self.retry_policy: Optional[RetryPolicy] = kwargs.pop("retry_policy", None)
         super().__init__(*args, **kwargs)
 
+    def _send_once(self, request, remaining: Optional[float], **kwargs):
+        if remaining is not None:
+            kwargs["timeout"] = _limit_timeout(kwargs["timeout"], remaining)
+        if self.rate_limiter is None:
+            return HTTPAdapter.send(self, request, **kwargs)
+
+        host = self.rate_limiter.host_of(request.url)
+        host.acquire()
+        try:
+            resp = HTTPAdapter.send(self, request, **kwargs)
+            host.feedback(resp.status_code, resp.headers.get('Retry-After'))
+        except BaseException:
+            host.release()
+            raise
+
+        # the slot of the host is held until the body is received, not only the headers
+        slot = _HostSlot(host)
+        if kwargs.get("stream") and resp.ok:
+            # released when the body is consumed or the response is closed, both release the connection
+            release_conn = resp.raw.release_conn
+
+            def _release_conn():
+                try:
+                    release_conn()
+                finally:
+                    slot.release()
+
+            resp.raw.release_conn = _release_conn
+        else:
+            # the error responses are read at once even when streamed, they are often raised without closing
+            try:
+                _ = resp.content  # read here instead of in the session, then cached in the response
+            finally:
+                slot.release()
+        return resp
+
+    def _throttle_pause(self, request, resp) -> Optional[float]:
+        # the throttled requests wait for the pause of the host decided by the rate limiter
+        if self.rate_limiter is not None and resp.status_code in THROTTLE_STATUSES:
+            return self.rate_limiter.host_of(request.url).paused_for
+        else:
+            return None
+
     def send(self, request, **kwargs):
         timeout = kwargs.get("timeout")
         if timeout is None:
             kwargs["timeout"] = self.timeout
-        return super().send(request, **kwargs)
+        if self.retry_policy is None:
+            return self._send_once(request, None, **kwargs)
+        else:
+            return self.retry_policy.call(
+                request.method, request.url,
+                lambda remaining: self._send_once(request, remaining, **kwargs),
+                pause=lambda resp: self._throttle_pause(request, resp),
+            )
 
 
 def get_requests_session(max_retries: int = 5, timeout: int = DEFAULT_TIMEOUT,
-                         headers: Optional[Dict[str, str]] = None) -> requests.Session:
+                         headers: Optional[Dict[str, str]] = None,
+                         rate_limiter: Optional[RateLimiter] = None,
+                         retry_policy: Optional[RetryPolicy] = None,
+                         pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                         pool_maxsize: int = DEFAULT_POOL_MAXSIZE) -> requests.Session:
+    # retry_policy is None, retry each request at most `max_retries` times with the default RetryPolicy
+    # retry_policy is a RetryPolicy, retry the requests with it, it can be shared by several sessions
+    # the requests are only retried by the policy, urllib3 and srequest will not retry them again
+    # rate_limiter is a RateLimiter, the requests are limited per host, and the throttled responses (429 and 503)
+    #   pause all the requests to the host, then retried when the pause ends
+    # pool_connections is the number of hosts whose connection pools are cached,
+    #   and pool_maxsize is the number of connections kept for each host
     session = requests.session()
-    retries = Retry(
-        total=max_retries, backoff_factor=1,
-        status_forcelist=[413, 429, 500, 501, 502, 503, 504, 505, 506, 507, 509, 510, 511],
-        allowed_methods=["HEAD", "GET", "POST", "PUT", "DELETE", "OPTIONS", "TRACE"],
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout, rate_limiter=rate_limiter,
+        retry_policy=retry_policy or RetryPolicy(max_attempts=max_retries + 1),
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize,
     )
-    adapter = TimeoutHTTPAdapter(max_retries=retries, timeout=timeout)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     session.headers.update({
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
+        "User-Agent": DEFAULT_USER_AGENT,
         **dict(headers or {}),
     })
 
     return session
 
 
+_SHARED_SESSIONS: Dict[Tuple[Any, ...], requests.Session] = {}
+_SHARED_SESSIONS_LOCK = threading.Lock()
+
+
+def get_shared_session(max_retries: int = 5, timeout: int = DEFAULT_TIMEOUT,
+                       headers: Optional[Dict[str, str]] = None,
+                       rate_limiter: Optional[RateLimiter] = None,
+                       retry_policy: Optional[RetryPolicy] = None,
+                       pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                       pool_maxsize: int = DEFAULT_POOL_MAXSIZE) -> requests.Session:
+    """
+    Overview:
+        Get the session shared in this process, created by :func:`get_requests_session` with the same arguments \
+        when it is requested for the first time. The sessions are keyed by the header set and all the other \
+        arguments (rate limiter and retry policy by identity), so the connections are reused by all the \
+        items, resources and storages with the same config.
+
+        The child processes (e.g. forked by :func:`hfmirror.sync.sync_shards`) create their own sessions, \
+        the connections of the parent process are never reused in them.
+    """
+    key = (
+        os.getpid(), max_retries, timeout, tuple(sorted(dict(headers or {}).items())),
+        rate_limiter, retry_policy, pool_connections, pool_maxsize,
+    )
+    with _SHARED_SESSIONS_LOCK:
+        session = _SHARED_SESSIONS.get(key)
+        if session is None:
+            session = get_requests_session(max_retries, timeout, headers, rate_limiter, retry_policy,
+                                           pool_connections, pool_maxsize)
+            _SHARED_SESSIONS[key] = session
+        return session
+
+
+def close_shared_sessions():
+    """
+    Overview:
+        Close and forget all the shared sessions created by :func:`get_shared_session`.
+    """
+    with _SHARED_SESSIONS_LOCK:
+        sessions = list(_SHARED_SESSIONS.values())
+        _SHARED_SESSIONS.clear()
+    for session in sessions:
+        session.close()
+
+
+def _session_retry_policy(session: requests.Session) -> Optional[RetryPolicy]:
+    adapter = session.get_adapter('https://')
+    return adapter.retry_policy if isinstance(adapter, TimeoutHTTPAdapter) else None
+
+
 def srequest(session: requests.Session, method, url, *, max_retries: int = 5,
-             sleep_time: float = 5.0, raise_for_status: bool = True, **kwargs) -> requests.Response:
-    resp = None
-    for _ in range(max_retries):
-        try:
-            resp = session.request(method, url, **kwargs)
-        except RequestException:
-            time.sleep(sleep_time)
-        else:
-            break
-    assert resp is not None
+             sleep_time: float = 5.0, raise_for_status: bool = True,
+             retry_policy: Optional[RetryPolicy] = None, **kwargs) -> requests.Response:
+    """
+    Overview:
+        Send a request with the session, and raise for the error status.
+
+        The sessions created by :func:`get_requests_session` retry with their own :class:`RetryPolicy`, \
+        so the request is sent only once here. Other sessions are retried with ``retry_policy``, \
+        or ``max_retries`` attempts with ``sleep_time`` seconds between them when it is not given.
+    """
+    if _session_retry_policy(session) is not None:
+        resp = session.request(method, url, **kwargs)
+    else:
+        retry_policy = retry_policy or RetryPolicy(
+            max_attempts=max_retries, backoff=sleep_time, multiplier=1.0, jitter=0.0, statuses=[])
+        resp = retry_policy.request(session, method, url, **kwargs)
+
     if raise_for_status:
         resp.raise_for_status()
 
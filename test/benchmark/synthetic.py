@@ -0,0 +1,172 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from hashlib import sha1
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import List, Tuple, Iterable, Union, Any, Mapping, ContextManager, Dict
+
+from hbutils.system import get_free_port
+
+from hfmirror.resource import SyncResource
+from hfmirror.storage import LocalStorage
+from hfmirror.utils import TargetPathType
+
+DEFAULT_SIZES = [(1 << 10, 0.7), (64 << 10, 0.25), (1 << 20, 0.05)]
+
+
+class SyntheticSite:
+    """
+    Synthetic files in ``directory``, with ``directories`` x ``files`` files, whose sizes are
+    chosen from the weighted ``sizes``. The random seed is fixed, so the site is the same in each run.
+    """
+
+    def __init__(self, directory: str, directories: int = 10, files: int = 20,
+                 sizes: List[Tuple[int, float]] = None, seed: int = 0):
+        self.directory = directory
+        self.directories = directories
+        self.files = files
+        self.sizes = list(sizes or DEFAULT_SIZES)
+        self.random = random.Random(seed)
+        self.version = 0
+
+    @property
+    def paths(self) -> List[str]:
+        return [f'd{i}/f{j}.bin' for i in range(self.directories) for j in range(self.files)]
+
+    def _write(self, path: str):
+        size = self.random.choices([s for s, _ in self.sizes], [w for _, w in self.sizes])[0]
+        filename = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        header = f'{path} {self.version}\n'.encode()
+        with open(filename, 'wb') as f:
+            f.write(header + os.urandom(max(size - len(header), 0)))
+
+    def generate(self):
+        for path in self.paths:
+            self._write(path)
+
+    def change(self, ratio: float = 0.1) -> int:
+        # rewrite a part of the files, return the number of changed files
+        self.version += 1
+        paths = self.random.sample(self.paths, max(int(len(self.paths) * ratio), 1))
+        for path in paths:
+            self._write(path)
+        return len(paths)
+
+    @property
+    def total_size(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.directory, path)) for path in self.paths)
+
+
+class _CountingHandler(SimpleHTTPRequestHandler):
+    # static files with ETag and If-None-Match, and counts of the requests
+    def __init__(self, *args, counter: Dict[str, int], lock: threading.Lock, **kwargs):
+        self.counter = counter
+        self.lock = lock
+        SimpleHTTPRequestHandler.__init__(self, *args, **kwargs)
+
+    def log_message(self, format_, *args):
+        pass
+
+    def send_response(self, code, message=None):
+        with self.lock:
+            key = f'{self.command} {int(code)}'
+            self.counter[key] = self.counter.get(key, 0) + 1
+        SimpleHTTPRequestHandler.send_response(self, code, message)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            etag = '"' + sha1(f'{stat.st_mtime_ns}-{stat.st_size}'.encode()).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return None
+
+            self._etag = etag
+        return SimpleHTTPRequestHandler.send_head(self)
+
+    def end_headers(self):
+        etag = getattr(self, '_etag', None)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self._etag = None
+        SimpleHTTPRequestHandler.end_headers(self)
+
+
+class _SyntheticServer(ThreadingHTTPServer):
+    request_queue_size = 128  # the default 5 is too small for concurrent loading
+    daemon_threads = True
+
+
+@contextmanager
+def start_synthetic_server(directory: str) -> ContextManager[Tuple[str, Dict[str, int]]]:
+    # the url and the counts of the requests, such as {'HEAD 200': 10, 'GET 200': 10, 'HEAD 304': 5}
+    counter, lock = {}, threading.Lock()
+    handler = partial(_CountingHandler, directory=directory, counter=counter, lock=lock)
+    server = _SyntheticServer(('127.0.0.1', get_free_port(strict=False)), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', counter
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class SyntheticResource(SyncResource):
+    def __init__(self, url: str, site: SyntheticSite):
+        SyncResource.__init__(self)
+        self.url = url
+        self.site = site
+
+    def grab(self) -> Iterable[Union[
+        Tuple[str, Any, TargetPathType, Mapping],
+        Tuple[str, Any, TargetPathType],
+    ]]:
+        for i in range(self.site.directories):
+            yield 'metadata', {'index': i}, f'd{i}'
+        for path in self.site.paths:
+            yield 'remote', f'{self.url}/{path}', path
+        yield 'text', f'{self.site.directories} x {self.site.files}', 'README.md'
+
+
+class HubStandInStorage(LocalStorage):
+    """
+    Local stand-in of :class:`hfmirror.storage.HuggingfaceStorage`, which costs ``commit_latency`` seconds
+    for each commit and ``read_latency`` seconds for each read, like the round trips to the hub.
+    """
+
+    def __init__(self, root_directory, commit_latency: float = 0.05, read_latency: float = 0.005):
+        LocalStorage.__init__(self, root_directory)
+        self.commit_latency = commit_latency
+        self.read_latency = read_latency
+        self.commits = 0
+        self.reads = 0
+
+    def file_exists(self, file: List[str]) -> bool:
+        time.sleep(self.read_latency)
+        self.reads += 1
+        return LocalStorage.file_exists(self, file)
+
+    def read_text(self, file: List[str], encoding: str = 'utf-8') -> str:
+        time.sleep(self.read_latency)
+        self.reads += 1
+        return LocalStorage.read_text(self, file, encoding)
+
+    def read_all_texts(self, filename: str, encoding: str = 'utf-8') -> Dict[Tuple[str, ...], str]:
+        time.sleep(self.read_latency)
+        self.reads += 1
+        return LocalStorage.read_all_texts(self, filename, encoding)
+
+    def batch_change_files(self, changes: List[Tuple[Union[str, None], List[str]]]):
+        time.sleep(self.commit_latency)
+        self.commits += 1
+        LocalStorage.batch_change_files(self, changes)
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask
+from .synthetic import SyntheticSite, SyntheticResource, HubStandInStorage, start_synthetic_server
+
+try:
+    import resource as _resource
+except ImportError:  # pragma: no cover
+    _resource = None
+
+
+def _peak_rss() -> int:
+    # peak resident set size of this process in bytes, 0 when not supported
+    if _resource is None:  # pragma: no cover
+        return 0
+    rss = _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+_STORAGES = {
+    'local': LocalStorage,
+    'hub': HubStandInStorage,
+}
+
+
+@pytest.fixture()
+def synthetic_site():
+    with isolated_directory():
+        site = SyntheticSite(os.path.abspath('site'))
+        site.generate()
+        with start_synthetic_server(site.directory) as (url, counter):
+            yield site, url, counter
+
+
+@pytest.mark.benchmark
+class TestSyncBenchmark:
+    @pytest.mark.parametrize('storage_type', list(_STORAGES.keys()))
+    @pytest.mark.parametrize('scenario', ['first', 'noop', 'partial'])
+    @pytest.mark.parametrize(['batch', 'workers'], [(50, 0), (50, 8)])
+    def test_sync(self, benchmark, synthetic_site, storage_type, scenario, batch, workers):
+        site, url, counter = synthetic_site
+        resource = SyntheticResource(url, site)
+        tasks = []
+
+        def _new_task(directory: str) -> SyncTask:
+            return SyncTask(resource, _STORAGES[storage_type](directory),
+                            batch=batch, workers=workers, mark_workers=workers)
+
+        def _setup():
+            shutil.rmtree('repo', ignore_errors=True)
+            with disable_output():
+                if scenario != 'first':
+                    _new_task('repo').sync()
+                if scenario == 'partial':
+                    site.change(0.1)
+            counter.clear()
+            tasks.append(_new_task('repo'))
+            return (), {}
+
+        def _sync():
+            with disable_output():
+                tasks[-1].sync()
+
+        benchmark.pedantic(_sync, setup=_setup, rounds=3, iterations=1)
+
+        report = tasks[-1].report.to_json()
+        seconds = benchmark.stats.stats.mean
+        benchmark.extra_info.update({
+            'files': len(site.paths),
+            'site_size': site.total_size,
+            'bytes_in': report['counters']['bytes_in'],
+            'throughput': report['counters']['bytes_in'] / seconds,
+            'files_per_second': report['counters']['files_loaded'] / seconds,
+            'commits': report['counters']['commits'],
+            'requests': dict(counter),
+            'peak_rss': _peak_rss(),
+            'phases': {name: phase['seconds'] for name, phase in report['phases'].items()},
+        })
+
+        if scenario == 'first':
+            assert report['counters']['files_loaded'] == len(site.paths) + 1
+        elif scenario == 'noop':
+            assert report['counters']['files_loaded'] == 1  # only the text file
+            assert counter.get('GET 200', 0) == 0
+        else:
+            assert 0 < report['counters']['files_loaded'] < len(site.paths) // 2
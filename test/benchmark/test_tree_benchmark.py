@@ -0,0 +1,55 @@
+import tracemalloc
+from typing import Iterable, Union, Tuple, Any, Mapping
+
+import pytest
+
+from hfmirror.resource import SyncResource
+from hfmirror.utils import TargetPathType
+
+
+class WideResource(SyncResource):
+    def __init__(self, directories: int, files: int):
+        SyncResource.__init__(self)
+        self.directories = directories
+        self.files = files
+
+    def grab(self) -> Iterable[Union[
+        Tuple[str, Any, TargetPathType, Mapping],
+        Tuple[str, Any, TargetPathType],
+    ]]:
+        for i in range(self.directories):
+            yield 'metadata', {'index': i}, f'group_{i % 10}/dir_{i}'
+            for j in range(self.files):
+                yield 'local', f'/data/group_{i % 10}/dir_{i}/file_{j}.bin', f'group_{i % 10}/dir_{i}/file_{j}.bin'
+
+
+@pytest.mark.benchmark
+class TestTreeBenchmark:
+    @pytest.mark.parametrize(['directories', 'files'], [(100, 1000), (1000, 200)])
+    def test_sync_tree(self, benchmark, directories, files):
+        resource = WideResource(directories, files)
+        trees = []
+
+        def _build():
+            trees.clear()  # only one tree alive at the same time
+            trees.append(resource.sync_tree())
+
+        benchmark.pedantic(_build, rounds=3, iterations=1)
+
+        trees.clear()
+        tracemalloc.start()
+        try:
+            tree = resource.sync_tree()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        items = directories * files
+        benchmark.extra_info.update({
+            'items': items,
+            'items_per_second': items / benchmark.stats.stats.mean,
+            'memory': current,
+            'peak_memory': peak,
+            'bytes_per_item': current / items,
+        })
+        assert len(tree.items) == 10
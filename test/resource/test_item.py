@@ -1,18 +1,25 @@
+import asyncio
 import os
 import pathlib
 import platform
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from hashlib import sha256
+from hashlib import sha256, sha1
 from typing import ContextManager
 
 import pytest
+import responses
 from hbutils.collection import get_recovery_func, BaseRecovery
 from hbutils.collection.recover import _OriginType, register_recovery
 from hbutils.system import TemporaryDirectory
+from hbutils.testing import disable_output
+from requests.exceptions import ConnectionError
 
 from hfmirror.resource import RemoteSyncItem, ResourceNotChange, TextOutputSyncItem, CustomSyncItem
 from hfmirror.resource.item import register_sync_type, SyncItem, create_sync_item, LocalFileSyncItem
+from hfmirror.utils import get_aiohttp_session, get_requests_session, RetryPolicy
+from ..testing import start_aiohttp_server_to_testfile, TESTFILE_DIR
 
 
 @pytest.fixture()
@@ -84,6 +91,10 @@ class NoneSyncItem(SyncItem):
 class MetadataSyncItem(SyncItem):
     __type__ = 'metadata'
 
+
+class CompleteSyncItem(SyncItem):
+    __type__ = '__complete__'
+
     @contextmanager
     def load_file(self) -> ContextManager[str]:
         with show_sys() as f:
@@ -140,6 +151,80 @@ class TestResourceItem:
         assert repr(item) == '<RemoteSyncItem url: \'https://huggingface.co/datasets/deepghs/' \
                              'game_character_skins/resolve/main/arknights/NM01/乐逍遥.png\'>'
 
+    def test_remote_sync_item_async(self):
+        async def _run():
+            async with start_aiohttp_server_to_testfile() as url:
+                item = RemoteSyncItem(f'{url}/example_text.txt', {}, ['example_text.txt'])
+                mark = await item.arefresh_mark(None)
+                assert mark['url'] == f'{url}/example_text.txt'
+                assert mark['etag']
+                assert mark['content_length'] == 1503
+                with pytest.raises(ResourceNotChange):
+                    await item.arefresh_mark(mark)
+                with pytest.raises(ResourceNotChange):
+                    await item.arefresh_mark({**mark, 'etag': None, 'expires': time.time() + 10000})
+
+                async with get_aiohttp_session() as session:
+                    assert (await item.arefresh_mark({**mark, 'etag': '"changed"'}, session=session)) == mark
+                    async with item.aload_file(session) as file:
+                        assert pathlib.Path(file).read_bytes() == \
+                               pathlib.Path(TESTFILE_DIR, 'example_text.txt').read_bytes()
+                    assert not os.path.exists(file)
+
+        with disable_output():
+            asyncio.run(_run())
+
+    def test_remote_sync_item_stable_until(self):
+        item = RemoteSyncItem('https://example.com/file.txt', {}, ['file.txt'])
+        assert item.stable_until(None) == 0
+        assert item.stable_until({'url': 'https://example.com/file.txt', 'expires': None}) == 0
+        assert item.stable_until({'url': 'https://example.com/file.txt', 'expires': 1000.0}) == 1000.0
+        assert item.stable_until({'url': 'https://example.com/file2.txt', 'expires': 1000.0}) == 0
+
+    @responses.activate
+    def test_remote_sync_item_resume_dir(self, tmp_path):
+        class _ResumableItem(RemoteSyncItem):
+            __resume_dir__ = str(tmp_path)
+
+        responses.add(responses.GET, 'https://example.com/file.txt', body=ConnectionError('broken'))
+        responses.add(responses.GET, 'https://example.com/file.txt', body=b'content')
+        item = _ResumableItem('https://example.com/file.txt', {}, ['file.txt'])
+        item._session = get_requests_session(retry_policy=RetryPolicy(max_attempts=1))
+        with disable_output(), pytest.raises(ConnectionError):
+            with item.load_file():
+                pass
+        directory = os.path.join(str(tmp_path), sha1(b'https://example.com/file.txt\nfile.txt').hexdigest())
+        assert os.path.isdir(directory)  # kept for the next run
+
+        with disable_output():
+            with item.load_file() as file:
+                assert os.path.dirname(file) == directory
+                assert pathlib.Path(file).read_bytes() == b'content'
+        assert not os.path.exists(directory)
+
+    @responses.activate
+    def test_remote_sync_item_resume_dir_shared(self, tmp_path):
+        class _ResumableItem(RemoteSyncItem):
+            __resume_dir__ = str(tmp_path)
+
+        responses.add(responses.GET, 'https://example.com/file.txt', body=b'content')
+        session = get_requests_session()
+        items = [_ResumableItem('https://example.com/file.txt', {}, segments)
+                 for segments in [['a', 'file.txt'], ['b', 'file.txt'], ['a', 'file.txt']]]
+        for item in items:
+            item._session = session
+
+        def _load(item_):
+            with item_.load_file() as file_:
+                time.sleep(0.05)  # the others loading the same target wait for it
+                return os.path.dirname(file_), pathlib.Path(file_).read_bytes()
+
+        with disable_output(), ThreadPoolExecutor(3) as executor:
+            results = list(executor.map(_load, items))
+        assert [content for _, content in results] == [b'content'] * 3
+        assert results[0][0] == results[2][0] != results[1][0]
+        assert os.listdir(str(tmp_path)) == []
+
     def test_text_output_sync_item(self):
         item = TextOutputSyncItem('v0.8.2', {'v': '082'}, ['v0.8.2', 'version_info.json'])
         assert item.content == 'v0.8.2'
@@ -152,6 +237,15 @@ class TestResourceItem:
         with item.load_file() as file:
             assert pathlib.Path(file).read_text() == 'v0.8.2'
 
+        async def _run():
+            assert (await item.arefresh_mark({'a': 1})) == {'a': 1}
+            async with item.aload_file() as file_:
+                assert pathlib.Path(file_).read_text() == 'v0.8.2'
+            return file_
+
+        assert not os.path.exists(asyncio.run(_run()))
+        assert item.stable_until({}) is None
+
         assert repr(item) == '<TextOutputSyncItem content: \'v0.8.2\'>'
 
         assert item == item
@@ -204,6 +298,8 @@ class TestResourceItem:
             register_sync_type(NoneSyncItem)
         with pytest.raises(KeyError):
             register_sync_type(MetadataSyncItem)
+        with pytest.raises(KeyError):
+            register_sync_type(CompleteSyncItem)
         with pytest.raises(KeyError):
             register_sync_type(AlreadyExistSyncItem)
 
@@ -1,7 +1,7 @@
 import pytest
 from hbutils.testing import disable_output
 
-from hfmirror.resource import LocalDirectoryResource
+from hfmirror.resource import LocalDirectoryResource, CompleteItem, LocalFileSyncItem
 from ..testing import TESTFILE_DIR
 
 
@@ -25,3 +25,15 @@ class TestResourceLocal:
         assert set(testfile_directory_tree.items.keys()) == \
                {'.keep', '无痕行者.png', 'example_text.txt', 'subdirectory'}
         assert set(testfile_directory_tree.items['subdirectory'].items.keys()) == {'README.md'}
+
+    def test_local_resource_complete(self, testfile_directory):
+        with disable_output():
+            items = list(testfile_directory.iter_sync_items())
+
+        assert items[-1] == CompleteItem([])
+        assert repr(items[-1]) == "<CompleteItem path: ''>"
+        sub_complete = items.index(CompleteItem(['subdirectory']))
+        sub_readme, = [i for i, item in enumerate(items)
+                       if isinstance(item, LocalFileSyncItem) and item.segments == ['subdirectory', 'README.md']]
+        assert sub_readme < sub_complete
+        assert len([item for item in items if isinstance(item, CompleteItem)]) == 2
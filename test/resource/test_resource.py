@@ -286,3 +286,28 @@ class TestResourceResource:
             assert item.url == 'https://www.baidu.com/1'
             assert item.segments == ['f', '1.html']
             assert item.metadata == {'a': 1, 'b': 2}
+
+    def test_sync_tree_compact(self):
+        class DeepSyncResource(SyncResource):
+            def grab(self) -> Iterable[Union[
+                Tuple[str, Any, TargetPathType, Mapping],
+                Tuple[str, Any, TargetPathType],
+            ]]:
+                deep = '/'.join(f'd{i}' for i in range(3000))  # deeper than the recursion limit
+                yield 'text', 'deep', f'{deep}/1.txt'
+                yield 'metadata', {'deep': True}, deep
+                yield 'text', 'a', 'x/y/1.txt'
+                yield 'text', 'b', 'x/y/2.txt'
+
+        tree = DeepSyncResource().sync_tree()
+        node = tree
+        for i in range(3000):
+            node = node.items[f'd{i}']
+        assert node.metadata == {'deep': True}
+        assert node.items['1.txt'].content == 'deep'
+
+        item1, item2 = tree.items['x'].items['y'].items['1.txt'], tree.items['x'].items['y'].items['2.txt']
+        assert item1.segments == ['x', 'y', '1.txt']
+        assert item1.segments[0] is item2.segments[0]  # interned
+        assert not hasattr(tree, '__dict__')
+        assert not hasattr(item1, '__dict__')
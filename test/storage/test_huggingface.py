@@ -121,6 +121,19 @@ class TestStorageHuggingface:
             assert not hf_storage.file_exists(['2', 'f2.txt'])
             assert not hf_storage.file_exists(['4', 'root', 'f.txt'])
 
+    @isolated_to_testfile()
+    def test_hf_read_all_texts(self, hf_storage):
+        hf_storage.batch_change_files([
+            ('example_text.txt', ['2', 'f.txt']),
+            ('.keep', ['2', '3', 'f.txt']),
+        ])
+        assert hf_storage.read_all_texts('f.txt') == {
+            ('2',): pathlib.Path('example_text.txt').read_text(encoding='utf-8'),
+            ('2', '3'): pathlib.Path('.keep').read_text(encoding='utf-8'),
+        }
+        assert hf_storage.read_all_texts('.keep') == {(): pathlib.Path('.keep').read_text(encoding='utf-8')}
+        assert hf_storage.read_all_texts('not_exist.txt') == {}
+
     def test_hf_warning(self, huggingface_client, huggingface_access_token):
         with pytest.warns(Warning):
             st = HuggingfaceStorage('narugo/gchar', hf_client=huggingface_client, access_token=huggingface_access_token)
@@ -1,3 +1,4 @@
+import asyncio
 import os.path
 import pathlib
 
@@ -110,3 +111,41 @@ class TestStorageLocal:
                pathlib.Path('.keep').read_text(encoding='utf-8')
         assert isolated_storage.read_text(['4', 'root', 'f.txt']) == \
                pathlib.Path('example_text.txt').read_text(encoding='utf-8')
+
+    @isolated_to_testfile()
+    def test_storage_local_async(self, isolated_storage):
+        async def _run():
+            assert not await isolated_storage.afile_exists(['f.txt'])
+            await isolated_storage.abatch_change_files([
+                ('example_text.txt', ['f.txt']),
+                ('.keep', ['2', '.meta.json']),
+            ])
+            assert await isolated_storage.afile_exists(['f.txt'])
+            assert await isolated_storage.aread_text(['f.txt']) == \
+                   pathlib.Path('example_text.txt').read_text(encoding='utf-8')
+            assert await isolated_storage.aread_all_texts('.meta.json') == {
+                ('2',): pathlib.Path('.keep').read_text(encoding='utf-8'),
+            }
+
+        asyncio.run(_run())
+
+    @isolated_to_testfile()
+    def test_storage_local_read_all_texts(self, isolated_storage):
+        assert isolated_storage.read_all_texts('f.txt') == {}
+        isolated_storage.batch_change_files([
+            ('example_text.txt', ['f.txt']),
+            ('.keep', ['2', 'f.txt']),
+            ('.keep', ['2', '3', 'f.txt']),
+            ('example_text.txt', ['2', 'f2.txt']),
+        ])
+        assert isolated_storage.read_all_texts('f.txt') == {
+            (): pathlib.Path('example_text.txt').read_text(encoding='utf-8'),
+            ('2',): pathlib.Path('.keep').read_text(encoding='utf-8'),
+            ('2', '3'): pathlib.Path('.keep').read_text(encoding='utf-8'),
+        }
+
+        storage = LocalStorage(isolated_storage.root_directory, namespace='2')
+        assert storage.read_all_texts('f.txt') == {
+            (): pathlib.Path('.keep').read_text(encoding='utf-8'),
+            ('3',): pathlib.Path('.keep').read_text(encoding='utf-8'),
+        }
@@ -1,12 +1,15 @@
 import os.path
+import pathlib
 import re
-from typing import List, Union, Iterable, Tuple, Any, Mapping
+from contextlib import contextmanager
+from typing import List, Union, Iterable, Tuple, Any, Mapping, ContextManager
 
 import pytest
 from gchar.games.arknights import Character
+from hbutils.system import TemporaryDirectory
 from hbutils.testing import isolated_directory
 
-from hfmirror.resource import SyncResource
+from hfmirror.resource import SyncResource, SyncItem, ResourceNotChange, MetadataItem
 from hfmirror.storage import LocalStorage
 from hfmirror.utils import TargetPathType
 
@@ -52,3 +55,75 @@ def arknights_sync():
 def arknights_sync_large():
     chs = [ch for ch in Character.all(contains_extra=False) if ch.rarity == 3]
     return ArknightsSkinResource(chs)
+
+
+class TestfileResource(SyncResource):
+    def __init__(self, url: str, repeats: int = 3):
+        SyncResource.__init__(self)
+        self.url = url
+        self.repeats = repeats
+
+    def grab(self) -> Iterable[Union[
+        Tuple[str, Any, TargetPathType, Mapping],
+        Tuple[str, Any, TargetPathType],
+    ]]:
+        yield 'metadata', {'source': self.url}, ''
+        for i in range(self.repeats):
+            yield 'remote', f'{self.url}/example_text.txt', f'r{i}/example_text.txt', {'index': i}
+            yield 'remote', f'{self.url}/subdirectory/README.md', f'r{i}/sub/README.md'
+            yield 'text', f'content of {i}', f'r{i}/version.txt'
+            yield 'metadata', {'index': i}, f'r{i}'
+            yield '__complete__', None, f'r{i}'
+        yield 'text', 'root file', 'root.txt'
+
+
+@pytest.fixture()
+def testfile_sync(url_to_testfile):
+    return TestfileResource(url_to_testfile)
+
+
+class BrokenStreamResource(SyncResource):
+    def grab(self) -> Iterable[Union[
+        Tuple[str, Any, TargetPathType, Mapping],
+        Tuple[str, Any, TargetPathType],
+    ]]:
+        yield 'text', 'content', 'a/1.txt'
+        yield '__complete__', None, 'a'
+        yield 'text', 'content', 'a/2.txt'
+
+
+class CountedItem(SyncItem):
+    __type__ = 'counted'
+
+    def __init__(self, value, metadata, segments, counter: dict):
+        SyncItem.__init__(self, value, metadata, segments)
+        self.counter = counter
+
+    @contextmanager
+    def load_file(self) -> ContextManager[str]:
+        self.counter['load'] = self.counter.get('load', 0) + 1
+        with TemporaryDirectory() as td:
+            filename = os.path.join(td, 'file')
+            pathlib.Path(filename).write_text(self._value)
+            yield filename
+
+    def refresh_mark(self, mark):
+        self.counter['mark'] = self.counter.get('mark', 0) + 1
+        if mark and mark['value'] == self._value:
+            raise ResourceNotChange
+        return {'value': self._value}
+
+
+class CountedResource(SyncResource):
+    def __init__(self, counter: dict, directories: int = 4, files: int = 3, version: str = ''):
+        SyncResource.__init__(self)
+        self.counter = counter
+        self.directories = directories
+        self.files = files
+        self.version = version
+
+    def iter_sync_items(self) -> Iterable:
+        for i in range(self.directories):
+            for j in range(self.files):
+                yield CountedItem(f'content {i}-{j}{self.version}', {}, [f'd{i}', f'{j}.txt'], self.counter)
+            yield MetadataItem({'index': i}, [f'd{i}'])
@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import AsyncSyncTask, SyncTask, BudgetBatchPolicy
+from . import conftest
+from .conftest import CountedResource
+from .test_sync import _dir_snapshot, _assert_testfile_synced
+from ..testing import start_aiohttp_server_to_testfile
+
+
+@pytest.mark.unittest
+class TestSyncAio:
+    @pytest.mark.parametrize('batch', [0, 3, -1])
+    def test_async_sync(self, testfile_sync, isolated_storage, batch):
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch).sync()
+        serial_snapshot = _dir_snapshot('.')
+
+        for file in serial_snapshot:
+            os.remove(file)
+        with disable_output():
+            asyncio.run(AsyncSyncTask(testfile_sync, isolated_storage, batch=batch, concurrency=4).sync())
+        _assert_testfile_synced('.')
+        assert _dir_snapshot('.') == serial_snapshot
+
+    def test_async_sync_with_aiohttp_server(self, isolated_storage):
+        async def _sync():
+            async with start_aiohttp_server_to_testfile() as url:
+                resource = conftest.TestfileResource(url)
+                await AsyncSyncTask(resource, isolated_storage, concurrency=4).sync()
+                _assert_testfile_synced('.')
+
+                task = AsyncSyncTask(resource, isolated_storage, concurrency=4, prefetch_meta=True)
+                await task.sync()
+                _assert_testfile_synced('.')
+                return task.mark_stats
+
+        with disable_output():
+            stats = asyncio.run(_sync())
+        assert stats.items == 10
+        assert stats.requests == 6
+        assert stats.not_changed == 6  # remote files are validated with ETag
+        assert stats.changed == 4
+
+    def test_async_plan(self):
+        counter = {}
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('expected')).sync()
+
+                task = AsyncSyncTask(CountedResource(counter), LocalStorage('repo'),
+                                     batch=BudgetBatchPolicy(max_operations=5), concurrency=3)
+                plan = asyncio.run(task.plan())
+                assert plan.to_json()['total']['added'] == 12
+                assert plan.commits == 4
+                asyncio.run(task.sync(plan=plan))
+
+            assert counter == {'mark': 12, 'load': 12}
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+
+    def test_async_journal(self):
+        counter = {}
+        with isolated_directory():
+            with disable_output():
+                asyncio.run(AsyncSyncTask(CountedResource(counter), LocalStorage('repo'),
+                                          batch=4, journal='journal').sync())
+                SyncTask(CountedResource({}), LocalStorage('expected')).sync()
+
+            assert counter == {'mark': 12, 'load': 12}
+            assert not os.path.exists('journal')
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
@@ -0,0 +1,68 @@
+import pytest
+
+from hfmirror.sync.batch import FlushDecision, CountBatchPolicy, BudgetBatchPolicy, AdaptiveBatchPolicy, \
+    to_batch_policy
+
+
+@pytest.mark.unittest
+class TestSyncBatch:
+    def test_count_policy(self):
+        assert CountBatchPolicy(0).immediate
+        assert not CountBatchPolicy(10).immediate
+        assert not CountBatchPolicy(-1).immediate
+
+        policy = CountBatchPolicy(10)
+        assert policy.before_add(100, 100, 100) is None
+        assert policy.after_directory(9, 100) is None
+        assert policy.after_directory(10, 100) == FlushDecision('count', 10, 100)
+        assert CountBatchPolicy(-1).after_directory(100000, 1 << 40) is None
+        assert repr(policy) == '<CountBatchPolicy count: 10>'
+
+    def test_budget_policy(self):
+        with pytest.raises(ValueError):
+            _ = BudgetBatchPolicy()
+
+        policy = BudgetBatchPolicy(max_size=1000, max_operations=5)
+        assert not policy.immediate
+        assert policy.before_add(0, 0, 5000) is None
+        assert policy.before_add(1, 5000, 1) == FlushDecision('size', 1, 5000)
+        assert policy.before_add(2, 500, 500) is None
+        assert policy.before_add(2, 500, 501) == FlushDecision('size', 2, 500)
+        assert policy.before_add(5, 10, 0) == FlushDecision('operations', 5, 10)
+        assert policy.after_directory(4, 999) is None
+        assert policy.after_directory(4, 1000) == FlushDecision('size', 4, 1000)
+        assert policy.after_directory(5, 10) == FlushDecision('operations', 5, 10)
+        assert repr(policy) == '<BudgetBatchPolicy max_size: 1000, max_operations: 5>'
+
+        assert BudgetBatchPolicy(max_operations=2).before_add(1, 1 << 40, 1 << 40) is None
+
+    def test_adaptive_policy(self):
+        policy = AdaptiveBatchPolicy(
+            target_seconds=10, initial_size=1000, min_size=100, max_size=100000,
+            initial_operations=10, min_operations=2, max_operations=50,
+        )
+        assert (policy.max_size, policy.max_operations) == (1000, 10)
+
+        policy.feedback(10, 1000, 1.0)  # 1000B/s, 10op/s
+        assert (policy.max_size, policy.max_operations) == (10000, 50)
+        policy.feedback(10, 1000, 0.0)
+        assert (policy.max_size, policy.max_operations) == (10000, 50)
+
+        policy.feedback(2, 0, 10.0)  # deletions only, bandwidth is not changed
+        assert policy.max_size == 10000
+        assert policy.max_operations == 50
+
+        policy.feedback(1, 1, 100.0)
+        assert policy.max_size == 5000
+        assert policy.max_operations == 25
+
+        for _ in range(20):
+            policy.feedback(1, 1, 100.0)
+        assert (policy.max_size, policy.max_operations) == (100, 2)
+
+    def test_to_batch_policy(self):
+        policy = BudgetBatchPolicy(max_operations=10)
+        assert to_batch_policy(policy) is policy
+        assert to_batch_policy(10).count == 10
+        with pytest.raises(TypeError):
+            _ = to_batch_policy('10')
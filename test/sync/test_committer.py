@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask
+from hfmirror.sync.committer import BackgroundCommitter
+from .conftest import CountedResource
+from .test_sync import _dir_snapshot
+
+
+class SlowStorage(LocalStorage):
+    def __init__(self, root_directory, counter: dict, delay: float = 0.2):
+        LocalStorage.__init__(self, root_directory)
+        self.counter = counter
+        self.delay = delay
+        self.overlapped = 0  # commits during which some files are loaded
+
+    def batch_change_files(self, changes):
+        loads = self.counter.get('load', 0)
+        time.sleep(self.delay)
+        LocalStorage.batch_change_files(self, changes)
+        if self.counter.get('load', 0) > loads:
+            self.overlapped += 1
+
+
+@pytest.mark.unittest
+class TestSyncCommitter:
+    def test_commit_in_order(self):
+        committed, cleaned = [], []
+        main_thread = threading.current_thread()
+
+        def _commit(x):
+            assert threading.current_thread() is not main_thread
+            time.sleep(0.02)
+            committed.append(x)
+
+        with BackgroundCommitter(_commit, max_pending=2) as committer:
+            for i in range(5):
+                committer.submit(i, cleanup=lambda i_=i: cleaned.append(i_))
+
+        assert committed == [0, 1, 2, 3, 4]
+        assert cleaned == [0, 1, 2, 3, 4]
+
+    def test_error(self):
+        committed, cleaned = [], []
+
+        def _commit(x):
+            if x == 1:
+                raise ConnectionError('commit failed')
+            committed.append(x)
+
+        with pytest.raises(ConnectionError):
+            with BackgroundCommitter(_commit) as committer:
+                for i in range(5):
+                    committer.submit(i, cleanup=lambda i_=i: cleaned.append(i_))
+                    time.sleep(0.05)
+
+        assert committed == [0]
+        assert cleaned == [0]
+
+    @pytest.mark.parametrize('batch', [0, 4, -1])
+    def test_sync_with_pipeline(self, batch):
+        counter = {}
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('expected'), batch=batch).sync()
+
+                storage = SlowStorage('repo', counter)
+                SyncTask(CountedResource(counter), storage, batch=batch).sync()
+                assert storage.overlapped == 0
+
+                storage = SlowStorage('repo_pipeline', counter)
+                SyncTask(CountedResource(counter), storage, batch=batch, pipeline=1).sync()
+                if batch >= 0:
+                    assert storage.overlapped > 0
+
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+            assert _dir_snapshot('repo_pipeline') == _dir_snapshot('expected')
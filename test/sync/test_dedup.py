@@ -0,0 +1,140 @@
+import json
+import os
+import pathlib
+import threading
+from contextlib import contextmanager
+from hashlib import sha256
+from typing import ContextManager, Iterable
+
+import pytest
+from hbutils.system import TemporaryDirectory
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.resource import SyncResource, RemoteSyncItem, ResourceNotChange
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask
+from hfmirror.sync.dedup import dedup_keys
+from hfmirror.utils import register_file_digests, release_file_digests
+
+_CONTENTS = {
+    'https://example.com/a.whl': 'wheel a',
+    'https://example.com/b.whl': 'wheel b',
+    'https://mirror.example.com/b.whl': 'wheel b',
+}
+_ETAGS = {
+    'https://example.com/a.whl': '"a"',
+    'https://example.com/b.whl': '"b"',
+    'https://mirror.example.com/b.whl': '"b"',
+}
+
+
+class FakeRemoteItem(RemoteSyncItem):
+    __type__ = 'fake_remote'
+    __slots__ = ('counter',)
+
+    def __init__(self, url, metadata, segments, counter: dict):
+        RemoteSyncItem.__init__(self, url, metadata, segments)
+        self.counter = counter
+
+    @contextmanager
+    def load_file(self) -> ContextManager[str]:
+        with self.counter['lock']:
+            self.counter[self.url] = self.counter.get(self.url, 0) + 1
+        with TemporaryDirectory() as td:
+            filename = os.path.join(td, os.path.basename(self.url))
+            pathlib.Path(filename).write_text(_CONTENTS[self.url])
+            if self.counter.get('digests'):  # like the downloaded files
+                register_file_digests(filename, {'sha256': sha256(_CONTENTS[self.url].encode()).hexdigest()})
+            try:
+                yield filename
+            finally:
+                release_file_digests(filename)
+
+    def refresh_mark(self, mark):
+        new_mark = {'url': self.url, 'etag': _ETAGS[self.url], 'content_length': len(_CONTENTS[self.url])}
+        if mark == new_mark:
+            raise ResourceNotChange
+        return new_mark
+
+
+class ReleasesResource(SyncResource):
+    def __init__(self, counter: dict, releases: int = 4):
+        SyncResource.__init__(self)
+        self.counter = counter
+        self.releases = releases
+
+    def iter_sync_items(self) -> Iterable:
+        for i in range(self.releases):
+            for url in _CONTENTS:
+                yield FakeRemoteItem(url, {}, [f'v{i}', url.split('/')[2], os.path.basename(url)], self.counter)
+
+
+def _new_counter() -> dict:
+    return {'lock': threading.Lock()}
+
+
+@pytest.mark.unittest
+class TestSyncDedup:
+    def test_dedup_keys(self):
+        item = RemoteSyncItem('https://example.com/a.whl', {}, ['a.whl'])
+        assert dedup_keys(item, None) == [('url', 'remote', 'https://example.com/a.whl')]
+        assert dedup_keys(item, {'etag': 'W/"a"', 'content_length': 7}) == \
+               [('url', 'remote', 'https://example.com/a.whl')]
+        assert dedup_keys(item, {'etag': '"a"', 'content_length': 7}) == [
+            ('url', 'remote', 'https://example.com/a.whl'),
+            ('etag', 'example.com', '"a"', 7),
+        ]
+
+    @pytest.mark.parametrize(['workers', 'batch'], [(0, 5), (4, 5), (4, 0)])
+    def test_sync_dedup(self, workers, batch):
+        with isolated_directory():
+            counter = _new_counter()
+            with disable_output():
+                report = SyncTask(ReleasesResource(counter), LocalStorage('repo'), batch=batch,
+                                  workers=workers, dedup=True).sync()
+
+            # each url is loaded once, the two urls of b have different hosts
+            assert {url: counter[url] for url in _CONTENTS} == {url: 1 for url in _CONTENTS}
+            assert report.counters['files_deduplicated'] == 4 * 3 - 3
+            assert report.counters['bytes_deduplicated'] == 3 * (7 + 7 + 7)
+            for i in range(4):
+                for url, content in _CONTENTS.items():
+                    path = os.path.join('repo', f'v{i}', url.split('/')[2], os.path.basename(url))
+                    assert pathlib.Path(path).read_text() == content
+
+    def test_sync_without_dedup(self):
+        with isolated_directory():
+            counter = _new_counter()
+            with disable_output():
+                report = SyncTask(ReleasesResource(counter), LocalStorage('repo'), batch=5).sync()
+            assert {url: counter[url] for url in _CONTENTS} == {url: 4 for url in _CONTENTS}
+            assert 'files_deduplicated' not in report.counters
+
+    def test_sync_dedup_with_plan(self):
+        with isolated_directory():
+            counter = _new_counter()
+            with disable_output():
+                task = SyncTask(ReleasesResource(counter), LocalStorage('repo'), batch=5, dedup=True)
+                task.sync(task.plan())
+            assert {url: counter[url] for url in _CONTENTS} == {url: 1 for url in _CONTENTS}
+
+            counter = _new_counter()
+            with disable_output():
+                SyncTask(ReleasesResource(counter, releases=6), LocalStorage('repo'), batch=5, dedup=True).sync()
+            assert {url: counter[url] for url in _CONTENTS} == {url: 1 for url in _CONTENTS}
+            assert len(os.listdir('repo')) == 7  # with the meta file
+
+    @pytest.mark.parametrize('workers', [0, 4])
+    def test_sync_dedup_digests(self, workers):
+        with isolated_directory():
+            counter = {**_new_counter(), 'digests': True}
+            with disable_output():
+                SyncTask(ReleasesResource(counter), LocalStorage('repo'), batch=5, workers=workers, dedup=True).sync()
+
+            # the digests of the loaded copy are kept by all the duplicates
+            for i in range(4):
+                for host in ['example.com', 'mirror.example.com']:
+                    meta = json.loads(pathlib.Path('repo', f'v{i}', host, '.meta.json').read_text())
+                    for file in meta['files']:
+                        url = f'https://{host}/{file["name"]}'
+                        assert file['mark']['sha256'] == sha256(_CONTENTS[url].encode()).hexdigest()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import pathlib
+from typing import Iterable
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.resource import SyncResource
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, AsyncSyncTask
+from hfmirror.sync.plan import subtree_digest, merge_stable_until, is_stable
+from .test_sync import _dir_snapshot
+
+
+class CountingStorage(LocalStorage):
+    def __init__(self, root_directory):
+        LocalStorage.__init__(self, root_directory)
+        self.reads = []
+        self.commits = []
+
+    def read_text(self, file, encoding: str = 'utf-8') -> str:
+        self.reads.append('/'.join(file))
+        return LocalStorage.read_text(self, file, encoding)
+
+    def batch_change_files(self, changes):
+        self.commits.append(['/'.join(segments) for _, segments in changes])
+        LocalStorage.batch_change_files(self, changes)
+
+
+class NestedTextResource(SyncResource):
+    def __init__(self, contents: dict, metadata: dict = None):
+        SyncResource.__init__(self)
+        self.contents = contents
+        self.metadata = metadata or {}
+
+    def grab(self) -> Iterable:
+        for path, content in self.contents.items():
+            yield 'text', content, path
+        for path, metadata in self.metadata.items():
+            yield 'metadata', metadata, path
+
+
+_CONTENTS = {
+    'a/x/1.txt': '1',
+    'a/x/2.txt': '2',
+    'a/y/3.txt': '3',
+    'b/4.txt': '4',
+    '5.txt': '5',
+}
+
+
+@pytest.mark.unittest
+class TestSyncDigest:
+    def test_merge_stable_until(self):
+        assert merge_stable_until([]) is None
+        assert merge_stable_until([None, None]) is None
+        assert merge_stable_until([None, 100.0, 50.0]) == 50.0
+        assert merge_stable_until([None, 0, 50.0]) == 0
+        assert is_stable(None)
+        assert not is_stable(0)
+
+    def test_subtree_digest(self):
+        resource = NestedTextResource({'1.txt': '1', '2.txt': '2'})
+        items = [(item.segments[-1], item) for item in resource.iter_sync_items()]
+        digest = subtree_digest({}, items, [('a', '0' * 64)])
+        assert digest == subtree_digest({}, items, [('a', '0' * 64)])
+        assert digest != subtree_digest({}, items, [('a', '1' * 64)])
+        assert digest != subtree_digest({'k': 'v'}, items, [('a', '0' * 64)])
+        assert digest != subtree_digest({}, items[:1], [('a', '0' * 64)])
+
+    @pytest.mark.parametrize('batch', [0, 50])
+    def test_skip_unchanged(self, batch):
+        with isolated_directory():
+            storage = CountingStorage('repo')
+            with disable_output():
+                SyncTask(NestedTextResource(_CONTENTS), storage, batch=batch, skip_unchanged=True).sync()
+            snapshot = _dir_snapshot('repo')
+            root_meta = json.loads(pathlib.Path('repo', '.meta.json').read_text())
+            assert root_meta['stable_until'] is None
+            assert [folder['name'] for folder in root_meta['folders']] == ['a', 'b']
+            assert all(folder['digest'] and folder['stable_until'] is None for folder in root_meta['folders'])
+
+            # no-op re-sync, only the root meta is read
+            storage.reads.clear()
+            storage.commits.clear()
+            task = SyncTask(NestedTextResource(_CONTENTS), storage, batch=batch, skip_unchanged=True)
+            with disable_output():
+                task.sync()
+            assert storage.reads == ['.meta.json']
+            assert storage.commits == []
+            assert task.mark_stats.items == 0
+            assert _dir_snapshot('repo') == snapshot
+
+            # only the changed path is visited
+            storage.reads.clear()
+            storage.commits.clear()
+            task = SyncTask(NestedTextResource({**_CONTENTS, 'a/y/3.txt': '33'}), storage,
+                            batch=batch, skip_unchanged=True)
+            with disable_output():
+                task.sync()
+            assert storage.reads == ['.meta.json', 'a/.meta.json', 'a/y/.meta.json']
+            assert sorted(sum(storage.commits, [])) == \
+                   ['.meta.json', '5.txt', 'a/.meta.json', 'a/y/.meta.json', 'a/y/3.txt']
+            assert task.mark_stats.items == 2
+            assert pathlib.Path('repo', 'a', 'y', '3.txt').read_text() == '33'
+
+            # the same after metadata changed
+            storage.reads.clear()
+            task = SyncTask(NestedTextResource({**_CONTENTS, 'a/y/3.txt': '33'}, {'b': {'x': 1}}), storage,
+                            batch=batch, skip_unchanged=True)
+            with disable_output():
+                task.sync()
+            assert storage.reads == ['.meta.json', 'b/.meta.json']
+            assert json.loads(pathlib.Path('repo', 'b', '.meta.json').read_text())['metadata'] == {'x': 1}
+
+    def test_skip_unchanged_with_plan(self):
+        with isolated_directory():
+            storage = CountingStorage('repo')
+            with disable_output():
+                SyncTask(NestedTextResource(_CONTENTS), storage, skip_unchanged=True).sync()
+                SyncTask(NestedTextResource({**_CONTENTS, 'a/y/3.txt': '33'}), LocalStorage('expected'),
+                         skip_unchanged=True).sync()
+
+                task = SyncTask(NestedTextResource({**_CONTENTS, 'a/y/3.txt': '33'}), storage, skip_unchanged=True)
+                plan = task.plan()
+                assert [d.path for d in plan.directories] == ['a/y', 'a', '']
+                task.sync(plan)
+            assert pathlib.Path('repo', 'a', 'y', '3.txt').read_text() == '33'
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+
+    def test_async_skip_unchanged_with_plan(self):
+        with isolated_directory():
+            storage = CountingStorage('repo')
+            with disable_output():
+                SyncTask(NestedTextResource(_CONTENTS), storage, skip_unchanged=True).sync()
+                SyncTask(NestedTextResource({**_CONTENTS, 'b/4.txt': '44'}), LocalStorage('expected'),
+                         skip_unchanged=True).sync()
+
+                task = AsyncSyncTask(NestedTextResource({**_CONTENTS, 'b/4.txt': '44'}), storage,
+                                     skip_unchanged=True)
+                plan = asyncio.run(task.plan())
+                assert [d.path for d in plan.directories] == ['b', '']
+                asyncio.run(task.sync(plan))
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+
+    def test_skip_unchanged_disabled(self):
+        with isolated_directory():
+            storage = CountingStorage('repo')
+            with disable_output():
+                SyncTask(NestedTextResource(_CONTENTS), storage).sync()
+
+                storage.reads.clear()
+                SyncTask(NestedTextResource(_CONTENTS), storage).sync()
+            assert len(storage.reads) == 5
+            assert os.path.exists(os.path.join('repo', 'a', 'x', '.meta.json'))
@@ -0,0 +1,61 @@
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, FanoutSyncTask
+from .conftest import CountedResource
+from .test_sync import _dir_snapshot
+
+
+@pytest.mark.unittest
+class TestSyncFanout:
+    @pytest.mark.parametrize(['batch', 'workers'], [
+        (0, 0),
+        ([0, 4, -1], 0),
+        (4, 3),
+    ])
+    def test_sync_once(self, batch, workers):
+        counter = {}
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('expected')).sync()
+
+                storages = [LocalStorage('repo1'), LocalStorage('repo2'), LocalStorage('repo3')]
+                FanoutSyncTask(CountedResource(counter), storages, batch=batch, workers=workers).sync()
+
+            assert counter == {'mark': 12, 'load': 12}
+            for name in ['repo1', 'repo2', 'repo3']:
+                assert _dir_snapshot(name) == _dir_snapshot('expected')
+
+    def test_different_states(self):
+        counter, flushes = {}, []
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}, version='v2'), LocalStorage('expected')).sync()
+
+                SyncTask(CountedResource({}), LocalStorage('repo_old')).sync()
+                SyncTask(CountedResource({}, version='v2'), LocalStorage('repo_new')).sync()
+                storages = [LocalStorage('repo_old'), LocalStorage('repo_new'), LocalStorage('repo_empty')]
+                FanoutSyncTask(
+                    CountedResource(counter, version='v2'), storages, batch=[0, 0, -1],
+                    on_flush=lambda storage, decision: flushes.append((storage.root_directory, decision.reason)),
+                ).sync()
+
+            # the marks are refreshed for each different old state, but the files are loaded once
+            assert counter == {'mark': 36, 'load': 12}
+            for name in ['repo_old', 'repo_new', 'repo_empty']:
+                assert _dir_snapshot(name) == _dir_snapshot('expected')
+            assert ('repo_empty', 'final') in flushes
+            assert all(directory != 'repo_new' for directory, _ in flushes)
+
+    def test_plan(self):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('repo1')).sync()
+                plans = FanoutSyncTask(CountedResource({}), [LocalStorage('repo1'), LocalStorage('repo2')]).plan()
+
+            assert [plan.to_json()['total']['added'] for plan in plans] == [0, 12]
+
+    def test_batch_mismatch(self):
+        with pytest.raises(ValueError):
+            FanoutSyncTask(CountedResource({}), [LocalStorage('repo1'), LocalStorage('repo2')], batch=[0])
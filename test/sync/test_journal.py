@@ -0,0 +1,125 @@
+import os
+import pathlib
+
+import pytest
+from hbutils.system import TemporaryDirectory
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask
+from hfmirror.sync.journal import SyncJournal
+from .conftest import CountedResource
+from .test_digest import NestedTextResource, _CONTENTS
+
+
+class FailingStorage(LocalStorage):
+    def __init__(self, root_directory, fail_at: int):
+        LocalStorage.__init__(self, root_directory)
+        self.fail_at = fail_at
+        self.commits = 0
+
+    def batch_change_files(self, changes):
+        self.commits += 1
+        if self.commits == self.fail_at:
+            raise ConnectionError('Network partition')
+        LocalStorage.batch_change_files(self, changes)
+
+
+def _dir_snapshot(directory):
+    retval = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            path = os.path.join(root, file)
+            retval[os.path.relpath(path, directory)] = pathlib.Path(path).read_bytes()
+    return retval
+
+
+@pytest.mark.unittest
+class TestSyncJournal:
+    def test_journal(self):
+        with TemporaryDirectory() as td:
+            staged_file = os.path.join(td, 'staged.txt')
+            pathlib.Path(staged_file).write_text('staged content')
+
+            journal_dir = os.path.join(td, 'journal')
+            journal = SyncJournal(journal_dir)
+            assert not journal.is_finished([])
+            journal.record_stage(['a', 'b.txt'], staged_file, 'remote', {'etag': '123'})
+            journal.record_stage(['a', 'c.txt'], staged_file, 'text', {})
+            journal.record_commit([['a']])
+            journal.record_stage(['b', 'b.txt'], staged_file, 'remote', {'etag': '123'})
+            journal.record_stage(['b', 'c.txt'], staged_file, 'remote', {'etag': '123'})
+            journal.record_commit([], [['b', 'c.txt']])
+            journal.close()
+            with open(journal.journal_file, 'a') as f:
+                f.write('{"type": "comm')  # broken line
+
+            journal = SyncJournal(journal_dir)
+            assert journal.is_finished(['a'])
+            assert not journal.is_finished(['a', 'b'])
+            assert journal.is_inside_finished(['a', 'b'])
+            assert not journal.is_inside_finished(['b', 'a'])
+            assert not journal.is_finished(['b'])
+            assert set(journal.recovered_files.keys()) == {('b', 'b.txt')}
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '123'}) == os.path.abspath(staged_file)
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '1234'}) is None
+            assert journal.find_staged(['b', 'b.txt'], 'wget', {'etag': '123'}) is None
+            assert journal.find_staged(['a', 'b.txt'], 'remote', {'etag': '123'}) is None
+            # the volatile fields are not compared, e.g. the rolling Expires
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '123', 'expires': 1000.0,
+                                                                  'content_type': 'text/plain'}) == \
+                   os.path.abspath(staged_file)
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '123', 'content_length': 14}) is None
+
+            pathlib.Path(staged_file).write_text('staged contenT')
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '123'}) is None
+            os.remove(staged_file)
+            assert journal.find_staged(['b', 'b.txt'], 'remote', {'etag': '123'}) is None
+
+            journal.finish()
+            assert not os.path.exists(journal_dir)
+
+    @pytest.mark.parametrize('pipeline', [0, 1])
+    def test_sync_resume(self, pipeline):
+        with isolated_directory():
+            counter = {}
+            with disable_output():
+                SyncTask(CountedResource(counter), LocalStorage('expected'), batch=4).sync()
+            expected = _dir_snapshot('expected')
+            assert counter == {'load': 12, 'mark': 12}
+
+            counter.clear()
+            storage = FailingStorage('actual', fail_at=2)
+            task = SyncTask(CountedResource(counter), storage, batch=8, journal='journal', pipeline=pipeline)
+            with disable_output(), pytest.raises(ConnectionError):
+                task.sync()
+            assert os.path.exists('journal')
+            assert counter == {'load': 12, 'mark': 12}  # loads are staged before the failed commit
+
+            counter.clear()
+            with disable_output():
+                task.sync()
+            assert _dir_snapshot('actual') == expected
+            assert not os.path.exists('journal')
+            # the directories committed in the first commit are skipped,
+            # the files staged for the failed commit are reused
+            assert counter['mark'] == 6
+            assert counter.get('load', 0) == 0
+
+    def test_sync_resume_with_plan(self):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(NestedTextResource(_CONTENTS), LocalStorage('expected'), batch=0).sync()
+            expected = _dir_snapshot('expected')
+
+            storage = FailingStorage('actual', fail_at=2)
+            task = SyncTask(NestedTextResource(_CONTENTS), storage, batch=0, journal='journal')
+            with disable_output(), pytest.raises(ConnectionError):
+                task.sync(task.plan())
+            assert os.path.exists('journal')
+
+            # a/x is committed before the crash, and skipped when syncing its parent with the plan
+            with disable_output():
+                task.sync(task.plan())
+            assert _dir_snapshot('actual') == expected
+            assert not os.path.exists('journal')
@@ -0,0 +1,120 @@
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import ContextManager, Iterable
+
+import pytest
+from hbutils.system import TemporaryDirectory
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.resource import SyncResource, SyncItem, MetadataItem, ResourceNotChange
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, SizeLanes
+from .test_sync import _dir_snapshot
+
+
+class SizedItem(SyncItem):
+    __type__ = 'sized'
+
+    def __init__(self, value, metadata, segments, delay: float = 0.0):
+        SyncItem.__init__(self, value, metadata, segments)
+        self.delay = delay
+
+    @contextmanager
+    def load_file(self) -> ContextManager[str]:
+        time.sleep(self.delay)
+        with TemporaryDirectory() as td:
+            filename = os.path.join(td, 'file')
+            pathlib.Path(filename).write_text(self._value)
+            yield filename
+
+    def refresh_mark(self, mark):
+        if mark and mark['value'] == self._value:
+            raise ResourceNotChange
+        return {'value': self._value, 'content_length': len(self._value)}
+
+
+class SizedResource(SyncResource):
+    def iter_sync_items(self) -> Iterable:
+        for i in range(3):
+            yield SizedItem('x' * 200, {}, [f'd{i}', 'large.bin'], delay=0.1)
+            for j in range(3):
+                yield SizedItem(f'small {i}-{j}', {}, [f'd{i}', f'{j}.txt'])
+            yield SizedItem('y' * 200, {}, [f'd{i}', 'sub', 'large.bin'], delay=0.05)
+            yield MetadataItem({'index': i}, [f'd{i}'])
+        yield SizedItem('root', {}, ['root.txt'])
+
+
+class RecordingStorage(LocalStorage):
+    def __init__(self, root_directory):
+        LocalStorage.__init__(self, root_directory)
+        self.committed = []
+        self._lock = threading.Lock()
+        self.concurrent = False
+
+    def batch_change_files(self, changes):
+        if not self._lock.acquire(blocking=False):
+            self.concurrent = True
+            self._lock.acquire()
+        try:
+            LocalStorage.batch_change_files(self, changes)
+            self.committed.extend('/'.join(remote_segs) for _, remote_segs in changes)
+        finally:
+            self._lock.release()
+
+
+@pytest.mark.unittest
+class TestSyncLanes:
+    def test_split(self):
+        lanes = SizeLanes(threshold=100)
+        files = [
+            ('a', None, {'content_length': 150}),
+            ('b', None, {'content_length': 50}),
+            ('c', None, {'value': 'text'}),
+            ('d', None, {'content_length': 10}),
+            ('e', None, {'content_length': 100}),
+        ]
+        small, large = lanes.split(files)
+        assert [key for key, _, _ in small] == ['c', 'd', 'b']
+        assert [key for key, _, _ in large] == ['a', 'e']
+        assert not lanes.is_large(None)
+
+    @pytest.mark.parametrize(['batch', 'workers', 'large_batch'], [
+        (0, 0, 0),
+        (4, 2, 0),
+        (-1, 0, 2),
+        (3, 3, -1),
+    ])
+    def test_sync_with_lanes(self, batch, workers, large_batch):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(SizedResource(), LocalStorage('expected'), batch=batch).sync()
+
+                storage = RecordingStorage('repo')
+                lanes = SizeLanes(threshold=100, large_workers=2, large_batch=large_batch)
+                SyncTask(SizedResource(), storage, batch=batch, workers=workers, lanes=lanes).sync()
+
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+            assert not storage.concurrent
+
+            committed = storage.committed
+            metas = [path for path in committed if path.endswith('.meta.json')]
+            assert len(metas) == 7
+            for meta in metas:
+                directory = meta[:-len('.meta.json')]
+                # the meta file is committed after all the files and meta files inside its directory
+                assert all(committed.index(path) < committed.index(meta)
+                           for path in committed if path.startswith(directory) and path != meta)
+
+    def test_small_files_first(self):
+        with isolated_directory():
+            with disable_output():
+                storage = RecordingStorage('repo')
+                lanes = SizeLanes(threshold=100, large_workers=1)
+                SyncTask(SizedResource(), storage, batch=0, lanes=lanes).sync()
+
+            committed = storage.committed
+            # the small files are not stalled by the slow large files
+            assert committed.index('d2/2.txt') < committed.index('d0/large.bin')
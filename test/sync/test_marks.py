@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+from hbutils.testing import disable_output
+
+from hfmirror.resource import RemoteSyncItem, TextOutputSyncItem
+from hfmirror.sync.marks import refresh_marks, MarkRefreshStats
+
+
+class _CountedItem(TextOutputSyncItem):
+    __type__ = 'counted'
+    __slots__ = ('counter',)
+
+    def __init__(self, value, metadata, segments, counter: dict):
+        TextOutputSyncItem.__init__(self, value, metadata, segments)
+        self.counter = counter
+
+    def refresh_mark(self, mark):
+        with self.counter['lock']:
+            self.counter['n'] += 1
+        time.sleep(0.01)
+        if self._value == 'broken':
+            raise ValueError('broken')
+        return {}
+
+
+@pytest.mark.unittest
+class TestSyncMarks:
+    def test_refresh_marks_failed(self):
+        counter = {'lock': threading.Lock(), 'n': 0}
+        jobs = [(_CountedItem('broken', {}, ['0.txt'], counter), None)]
+        jobs.extend((_CountedItem('text', {}, [f'{i}.txt'], counter), None) for i in range(1, 1000))
+        with disable_output(), pytest.raises(ValueError):
+            refresh_marks(jobs, workers=4)
+        assert counter['n'] < 100  # the refreshes not started are cancelled
+
+    @pytest.mark.parametrize('workers', [0, 4])
+    def test_refresh_marks(self, url_to_testfile, workers):
+        url = f'{url_to_testfile}/example_text.txt'
+        future = time.time() + 10000
+        jobs = [
+            (RemoteSyncItem(url, {}, ['1.txt']), None),
+            (RemoteSyncItem(url, {}, ['2.txt']), {'type': 'remote', 'mark': {'url': url, 'expires': future}}),
+            (RemoteSyncItem(url, {}, ['3.txt']), {'type': 'text', 'mark': {}}),
+            (TextOutputSyncItem('text', {}, ['4.txt']), {'type': 'text', 'mark': {'a': 1}}),
+            (TextOutputSyncItem('text', {}, ['5.txt']), None),
+        ]
+
+        stats = MarkRefreshStats()
+        with disable_output():
+            results = refresh_marks(jobs, workers=workers, stats=stats)
+
+        assert len(results) == 5
+        need_load, mark = results[0]
+        assert need_load
+        assert mark['url'] == url
+        assert mark['content_length'] == 1503
+        assert results[1] == (False, {'url': url, 'expires': future})
+        assert results[2][0]
+        assert results[2][1]['url'] == url
+        assert results[3] == (True, {'a': 1})
+        assert results[4] == (True, {})
+
+        assert stats.items == 5
+        assert stats.changed == 4
+        assert stats.not_changed == 1
+        assert stats.requests == 2
+        assert stats.saved_requests == 1
+        assert repr(stats) == '<MarkRefreshStats items: 5, changed: 4, not_changed: 1, ' \
+                              'requests: 2, saved_requests: 1>'
@@ -0,0 +1,123 @@
+import asyncio
+import glob
+import json
+import os.path
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, AsyncSyncTask, JsonMetaFormat, JsonLinesMetaFormat, MsgpackMetaFormat
+from hfmirror.sync.metafile import to_meta_format
+from .conftest import CountedResource
+
+_META_DATA = {
+    'path': 'a/b',
+    'metadata': {'title': '中文', 'index': 1},
+    'digest': 'x' * 64,
+    'stable_until': 1.5,
+    'files': [
+        {'name': f'{i}.txt', 'type': 'text', 'mark': {'value': i}, 'metadata': {}}
+        for i in range(5)
+    ],
+    'folders': [{'name': 'c', 'metadata': {}, 'digest': 'y' * 64, 'stable_until': None}],
+}
+
+
+def _read_meta(meta_format, filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return meta_format.loads(data if meta_format.__binary__ else data.decode('utf-8'))
+
+
+@pytest.mark.unittest
+class TestSyncMetafile:
+    @pytest.mark.parametrize(['meta_format'], [
+        (JsonMetaFormat(),),
+        (JsonLinesMetaFormat('json'),),
+        (JsonLinesMetaFormat('orjson'),),
+        (MsgpackMetaFormat(),),
+    ])
+    def test_dump_and_loads(self, meta_format):
+        with isolated_directory():
+            filename = meta_format.filename_of('.meta.json')
+            meta_format.dump(_META_DATA, filename)
+            assert _read_meta(meta_format, filename) == _META_DATA
+
+            meta_format.dump({**_META_DATA, 'files': [], 'folders': []}, filename)
+            assert _read_meta(meta_format, filename) == {**_META_DATA, 'files': [], 'folders': []}
+
+    def test_formats(self):
+        assert to_meta_format('json').filename_of('.meta.json') == '.meta.json'
+        assert to_meta_format('jsonl').filename_of('.meta.json') == '.meta.jsonl'
+        assert to_meta_format('msgpack').filename_of('.meta.json') == '.meta.msgpack'
+        meta_format = JsonLinesMetaFormat()
+        assert to_meta_format(meta_format) is meta_format
+        with pytest.raises(TypeError):
+            to_meta_format('yaml')
+        with pytest.raises(ValueError):
+            JsonLinesMetaFormat('ujson')
+
+    @pytest.mark.parametrize(['meta_format', 'prefetch_meta'], [
+        ('jsonl', False),
+        ('jsonl', True),
+        ('msgpack', False),
+        ('msgpack', True),
+    ])
+    def test_sync(self, meta_format, prefetch_meta):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('legacy'), batch=5).sync()
+                task = SyncTask(CountedResource({}), LocalStorage('repo'), batch=5,
+                                meta_format=meta_format, prefetch_meta=prefetch_meta)
+                task.sync()
+
+            suffix = task.meta_format.__suffix__
+            assert not glob.glob('repo/**/.meta.json', recursive=True)
+            for legacy_file in glob.glob('legacy/**/.meta.json', recursive=True):
+                with open(legacy_file, 'r', encoding='utf-8') as f:
+                    expected = json.load(f)
+                new_file = os.path.join('repo', os.path.relpath(legacy_file, 'legacy'))[:-len('.json')] + suffix
+                assert _read_meta(task.meta_format, new_file) == expected
+
+            counter = {}
+            with disable_output():
+                report = SyncTask(CountedResource(counter), LocalStorage('repo'), batch=5,
+                                  meta_format=meta_format, prefetch_meta=prefetch_meta).sync()
+            assert counter.get('load', 0) == 0
+            assert report.counters['commits'] == 0
+
+    @pytest.mark.parametrize(['prefetch_meta'], [(False,), (True,)])
+    def test_migrate_legacy(self, prefetch_meta):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('repo'), batch=5).sync()
+            assert len(glob.glob('repo/**/.meta.json', recursive=True)) == 5
+
+            counter = {}
+            with disable_output():
+                SyncTask(CountedResource(counter), LocalStorage('repo'), batch=5,
+                         meta_format='jsonl', prefetch_meta=prefetch_meta).sync()
+            assert counter.get('load', 0) == 0  # the marks in legacy meta files are used
+            assert not glob.glob('repo/**/.meta.json', recursive=True)
+            assert len(glob.glob('repo/**/.meta.jsonl', recursive=True)) == 5
+
+            counter = {}
+            with disable_output():
+                report = SyncTask(CountedResource(counter, version='v2'), LocalStorage('repo'), batch=5,
+                                  meta_format='jsonl', prefetch_meta=prefetch_meta).sync()
+            assert counter['load'] == 12
+            assert report.counters['operations'] == 12 + 5
+
+    def test_async_migrate_legacy(self):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('repo'), batch=5).sync()
+
+            counter = {}
+            with disable_output():
+                asyncio.run(AsyncSyncTask(CountedResource(counter), LocalStorage('repo'), batch=5,
+                                          meta_format='msgpack').sync())
+            assert counter.get('load', 0) == 0
+            assert not glob.glob('repo/**/.meta.json', recursive=True)
+            assert len(glob.glob('repo/**/.meta.msgpack', recursive=True)) == 5
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import time
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, AsyncSyncTask, SyncReport
+from .conftest import CountedResource
+
+_CONTENT_SIZE = len('content 0-0')
+
+
+@pytest.mark.unittest
+class TestSyncMetrics:
+    def test_phases(self):
+        report = SyncReport()
+        with report.phase('download'):
+            time.sleep(0.02)
+        assert list(report.iter_phase('crawl', range(3))) == [0, 1, 2]
+        report.count('commits', 2)
+        report.finish()
+
+        data = report.to_json()
+        assert data['finished']
+        assert data['phases']['download']['count'] == 1
+        assert data['phases']['download']['seconds'] >= 0.02
+        assert data['phases']['crawl']['count'] == 3
+        assert data['counters']['commits'] == 2
+        assert data['counters']['mark_requests'] == 0
+
+    @pytest.mark.parametrize(['batch', 'workers', 'pipeline'], [
+        (0, 0, 0),
+        (5, 2, 0),
+        (5, 0, 1),
+    ])
+    def test_sync_report(self, batch, workers, pipeline):
+        reports = []
+        with isolated_directory():
+            with disable_output():
+                task = SyncTask(CountedResource({}), LocalStorage('repo'), batch=batch, workers=workers,
+                                pipeline=pipeline, on_report=lambda r: reports.append(r.to_json()))
+                report = task.sync()
+
+            assert report is task.report
+            data = report.to_json()
+            json.dumps(data)
+            assert data['finished']
+            assert reports[-1] == data
+            assert len(reports) == data['counters']['commits'] + 1
+
+            counters = data['counters']
+            assert counters['files_loaded'] == 12
+            assert counters['bytes_in'] == 12 * _CONTENT_SIZE
+            assert counters['bytes_out'] > counters['bytes_in']  # with the meta files
+            assert counters['operations'] == 12 + 5
+            assert counters['not_changed'] == 0
+            for name in ['crawl', 'tree', 'meta_read', 'mark', 'download', 'commit']:
+                assert data['phases'][name]['count'] > 0, name
+            if batch > 0:
+                assert data['phases']['staging']['count'] == 12 + 5
+                assert data['phases']['cleanup']['count'] == counters['commits']
+
+            with disable_output():
+                data = SyncTask(CountedResource({}), LocalStorage('repo'), batch=batch).sync().to_json()
+            assert data['counters']['files_loaded'] == 0
+            assert data['counters']['not_changed'] == 12
+            assert data['counters']['commits'] == 0
+
+    def test_async_sync_report(self):
+        with isolated_directory():
+            with disable_output():
+                report = asyncio.run(AsyncSyncTask(CountedResource({}), LocalStorage('repo'), batch=5).sync())
+
+            data = report.to_json()
+            assert data['counters']['files_loaded'] == 12
+            assert data['counters']['bytes_in'] == 12 * _CONTENT_SIZE
+            for name in ['crawl', 'tree', 'meta_read', 'mark', 'download', 'staging', 'commit', 'cleanup']:
+                assert data['phases'][name]['count'] > 0, name
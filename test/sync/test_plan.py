@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, BudgetBatchPolicy
+from .conftest import CountedResource
+
+
+@pytest.mark.unittest
+class TestSyncPlan:
+    def test_plan_fresh(self):
+        counter = {}
+        with isolated_directory():
+            task = SyncTask(CountedResource(counter), LocalStorage('repo'), batch=8)
+            with disable_output():
+                plan = task.plan()
+
+            assert counter == {'mark': 12}
+            assert not os.path.exists('repo')
+            assert [d.path for d in plan.directories] == ['d0', 'd1', 'd2', 'd3', '']
+            assert plan.total_files == 12
+            assert plan.directories[0].added == ['0.txt', '1.txt', '2.txt']
+            assert plan.directories[0].operations == 4
+
+            total = plan.to_json()['total']
+            assert total['added'] == 12
+            assert total['changed'] == 0
+            assert total['deleted'] == 0
+            assert total['unknown_sizes'] == 12
+            assert total['operations'] == 17
+            assert total['commits'] == 3
+            json.dumps(plan.to_json())
+
+    def test_plan_after_sync(self):
+        counter = {}
+        with isolated_directory():
+            storage = LocalStorage('repo')
+            with disable_output():
+                SyncTask(CountedResource(counter), storage).sync()
+                plan = SyncTask(CountedResource(counter, directories=3, version='x'), storage).plan()
+
+            assert [d.path for d in plan.directories] == ['d0', 'd1', 'd2', '']
+            total = plan.to_json()['total']
+            assert total['added'] == 0
+            assert total['changed'] == 9
+            assert plan.directories[-1].deleted == ['d3']
+            assert total['commits'] == 1
+
+    def test_sync_with_plan(self):
+        counter = {}
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('expected')).sync()
+
+                task = SyncTask(CountedResource(counter), LocalStorage('repo'),
+                                batch=BudgetBatchPolicy(max_operations=5))
+                plan = task.plan()
+                assert plan.commits == 4
+                task.sync(plan=plan)
+
+            assert counter == {'mark': 12, 'load': 12}
+            for d in ['d0', 'd1', 'd2', 'd3']:
+                for f in ['0.txt', '1.txt', '2.txt']:
+                    with open(os.path.join('repo', d, f)) as fa, open(os.path.join('expected', d, f)) as fb:
+                        assert fa.read() == fb.read()
+                with open(os.path.join('repo', d, '.meta.json')) as fa, \
+                        open(os.path.join('expected', d, '.meta.json')) as fb:
+                    assert json.load(fa) == json.load(fb)
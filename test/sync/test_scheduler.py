@@ -0,0 +1,103 @@
+import asyncio
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from hbutils.system import TemporaryDirectory
+
+from hfmirror.resource import CustomSyncItem
+from hfmirror.sync.scheduler import LoadScheduler, AsyncLoadScheduler
+
+_OPENED = set()
+_LOCK = threading.Lock()
+
+
+def _slow_gene(content: str, delay: float):
+    @contextmanager
+    def _gene():
+        time.sleep(delay)
+        with TemporaryDirectory() as td:
+            filename = os.path.join(td, 'file')
+            pathlib.Path(filename).write_text(content)
+            with _LOCK:
+                _OPENED.add(filename)
+            try:
+                yield filename
+            finally:
+                with _LOCK:
+                    _OPENED.discard(filename)
+
+    return _gene
+
+
+def _item(content: str, delay: float = 0.0):
+    return CustomSyncItem(_slow_gene(content, delay), {}, [content])
+
+
+@pytest.mark.unittest
+class TestSyncScheduler:
+    @pytest.mark.parametrize('workers', [0, 1, 4])
+    def test_submit_in_order(self, workers):
+        results = []
+        with LoadScheduler(workers, window=2) as scheduler:
+            for i in range(6):
+                items = [_item(f'{i}-{j}', delay=0.05 * ((6 - i) % 3)) for j in range(i % 3)]
+                scheduler.submit(items, lambda paths, i_=i: results.append(
+                    (i_, [pathlib.Path(p).read_text() for p in paths])
+                ))
+
+        assert results == [(i, [f'{i}-{j}' for j in range(i % 3)]) for i in range(6)]
+        assert not _OPENED
+
+    def test_error(self):
+        def _broken():
+            raise FileNotFoundError('broken')
+
+        results = []
+        with pytest.raises(FileNotFoundError):
+            with LoadScheduler(4) as scheduler:
+                scheduler.submit([_item('a', 0.1), CustomSyncItem(_broken, {}, ['b'])], results.append)
+                scheduler.submit([_item('c', 0.1)], results.append)
+
+        assert results == []
+        assert not _OPENED
+
+    @pytest.mark.parametrize('concurrency', [1, 4])
+    def test_async_submit_in_order(self, concurrency):
+        results = []
+
+        async def _run():
+            async with AsyncLoadScheduler(concurrency, window=2) as scheduler:
+                for i in range(6):
+                    items = [_item(f'{i}-{j}', delay=0.05 * ((6 - i) % 3)) for j in range(i % 3)]
+
+                    async def _callback(paths, i_=i):
+                        results.append((i_, [pathlib.Path(p).read_text() for p in paths]))
+
+                    await scheduler.submit(items, _callback)
+
+        asyncio.run(_run())
+        assert results == [(i, [f'{i}-{j}' for j in range(i % 3)]) for i in range(6)]
+        assert not _OPENED
+
+    def test_async_error(self):
+        def _broken():
+            raise FileNotFoundError('broken')
+
+        results = []
+
+        async def _callback(paths):
+            results.append(paths)
+
+        async def _run():
+            async with AsyncLoadScheduler(4) as scheduler:
+                await scheduler.submit([_item('a', 0.1), CustomSyncItem(_broken, {}, ['b'])], _callback)
+                await scheduler.submit([_item('c', 0.1)], _callback)
+
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(_run())
+        assert results == []
+        assert not _OPENED
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from hbutils.testing import disable_output, isolated_directory
+
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, ShardManifest, sync_shards
+from hfmirror.sync.shard import _sync_shard
+from .conftest import CountedResource
+from .test_sync import _dir_snapshot
+
+
+def _repo_task():
+    return SyncTask(CountedResource({}, directories=6), LocalStorage(os.path.abspath('repo')), batch=4)
+
+
+def _stream_task():
+    return SyncTask(CountedResource({}), LocalStorage(os.path.abspath('repo')), stream=True)
+
+
+@pytest.mark.unittest
+class TestSyncShard:
+    def test_manifest(self):
+        manifest = ShardManifest(3, {'d0': 2})
+        assert manifest.shard_of('d0') == 2
+        assert manifest.shard_of('d1') == ShardManifest(3).shard_of('d1')
+        assert {manifest.shard_of(f'd{i}') for i in range(20)} == {0, 1, 2}
+
+        with isolated_directory():
+            manifest.save('manifest.json')
+            loaded = ShardManifest.load('manifest.json')
+        assert loaded.to_json() == manifest.to_json()
+
+        with pytest.raises(ValueError):
+            ShardManifest(0)
+        with pytest.raises(ValueError):
+            ShardManifest(2, {'d0': 2})
+
+    def test_stream_not_supported(self):
+        with pytest.raises(ValueError):
+            SyncTask(CountedResource({}), LocalStorage('repo'), sharding=ShardManifest(2), shard=0, stream=True)
+        with isolated_directory():
+            with disable_output(), pytest.raises(ValueError):  # sharded after created by the factory
+                _sync_shard(_stream_task, ShardManifest(2), 0)
+            assert not os.path.exists('repo')
+
+    def test_sync_shards(self):
+        manifest = ShardManifest(2, {'d0': 0, 'd1': 1, 'd2': 1})
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}), LocalStorage('expected')).sync()
+
+                with pytest.raises(ValueError):  # shards not synced yet
+                    SyncTask(CountedResource({}), LocalStorage('repo'), sharding=manifest).sync()
+
+                counter = {}
+                SyncTask(CountedResource(counter), LocalStorage('repo'), sharding=manifest, shard=0).sync()
+                assert counter['load'] == 3
+                assert os.listdir('repo') == ['d0']
+
+                counter = {}
+                SyncTask(CountedResource(counter), LocalStorage('repo'), sharding=manifest, shard=1).sync()
+                assert counter['load'] == 9
+                assert not os.path.exists(os.path.join('repo', '.meta.json'))
+
+                counter = {}
+                SyncTask(CountedResource(counter), LocalStorage('repo'), sharding=manifest).sync()
+                assert counter == {}  # the coordinator loads no files of the shards
+
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+
+    def test_coordinator_deletes(self):
+        manifest = ShardManifest(2)
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}, directories=3), LocalStorage('expected')).sync()
+                SyncTask(CountedResource({}, directories=4), LocalStorage('repo')).sync()
+
+                for shard in [0, 1, None]:
+                    SyncTask(CountedResource({}, directories=3), LocalStorage('repo'),
+                             sharding=manifest, shard=shard).sync()
+
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+
+    def test_plan(self):
+        manifest = ShardManifest(2, {'d0': 0, 'd1': 1, 'd2': 1, 'd3': 1})
+        with isolated_directory():
+            with disable_output():
+                plan = SyncTask(CountedResource({}), LocalStorage('repo'), sharding=manifest, shard=1).plan()
+        assert [directory.path for directory in plan.directories] == ['d1', 'd2', 'd3']
+
+    def test_sync_in_processes(self):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(CountedResource({}, directories=6), LocalStorage('expected')).sync()
+                sync_shards(_repo_task, ShardManifest(3), processes=2)
+
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
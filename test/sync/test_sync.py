@@ -1,10 +1,44 @@
 import glob
+import json
 import os
+import pathlib
+from hashlib import sha256, sha1
 
 import pytest
+import responses
 from gchar.games.arknights import Character
+from hbutils.testing import disable_output, isolated_directory
 
-from hfmirror.sync import SyncTask
+from hfmirror.resource import LocalDirectoryResource, SyncResource, RemoteSyncItem
+from hfmirror.storage import LocalStorage
+from hfmirror.sync import SyncTask, SizeLanes
+from hfmirror.sync.batch import BudgetBatchPolicy
+from .conftest import BrokenStreamResource
+from ..testing import TESTFILE_DIR
+
+
+def _dir_snapshot(directory):
+    retval = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            path = os.path.join(root, file)
+            retval[os.path.relpath(path, directory)] = pathlib.Path(path).read_bytes()
+    return retval
+
+
+def _assert_testfile_synced(directory, repeats: int = 3):
+    for i in range(repeats):
+        assert pathlib.Path(directory, f'r{i}', 'example_text.txt').read_bytes() == \
+               pathlib.Path(TESTFILE_DIR, 'example_text.txt').read_bytes()
+        assert pathlib.Path(directory, f'r{i}', 'sub', 'README.md').read_bytes() == \
+               pathlib.Path(TESTFILE_DIR, 'subdirectory', 'README.md').read_bytes()
+        assert pathlib.Path(directory, f'r{i}', 'version.txt').read_text() == f'content of {i}'
+    assert pathlib.Path(directory, 'root.txt').read_text() == 'root file'
+
+    root_meta = json.loads(pathlib.Path(directory, '.meta.json').read_text(encoding='utf-8'))
+    assert root_meta['path'] == ''
+    assert root_meta['files'][0]['name'] == 'root.txt'
+    assert [f['name'] for f in root_meta['folders']] == [f'r{i}' for i in range(repeats)]
 
 
 @pytest.fixture()
@@ -32,6 +66,12 @@ def skin_sync_l_bx(arknights_sync_large, isolated_storage):
     yield SyncTask(arknights_sync_large, isolated_storage, batch=-1)
 
 
+class _RemoteFilesResource(SyncResource):
+    def iter_sync_items(self):
+        yield RemoteSyncItem('https://example.com/a.txt', {}, ['a.txt'])
+        yield RemoteSyncItem('https://example.com/b.txt', {}, ['b.txt'])
+
+
 # noinspection DuplicatedCode
 @pytest.mark.unittest
 class TestSyncSync:
@@ -114,3 +154,134 @@ class TestSyncSync:
                         f'Character {ch!r} directory not contain skins!'
                 else:
                     assert not os.path.exists(ch.index), f'Character {ch!r}\'s directory not removed.'
+
+    @pytest.mark.parametrize('batch', [0, 3, -1])
+    def test_sync_with_workers(self, testfile_sync, isolated_storage, batch):
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch).sync()
+        _assert_testfile_synced('.')
+        serial_snapshot = _dir_snapshot('.')
+
+        for file in serial_snapshot:
+            os.remove(file)
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch, workers=4).sync()
+        _assert_testfile_synced('.')
+        assert _dir_snapshot('.') == serial_snapshot
+
+        task = SyncTask(testfile_sync, isolated_storage, batch=batch, workers=4, mark_workers=4)
+        with disable_output():
+            task.sync()
+        assert _dir_snapshot('.') == serial_snapshot
+        assert task.mark_stats.items == 10
+        assert task.mark_stats.requests == 6
+        assert task.mark_stats.saved_requests == 0
+
+    @pytest.mark.parametrize('batch', [0, 3, -1])
+    def test_sync_stream(self, testfile_sync, isolated_storage, batch):
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch).sync()
+        batch_snapshot = _dir_snapshot('.')
+
+        for file in batch_snapshot:
+            os.remove(file)
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch, stream=True, workers=2).sync()
+        _assert_testfile_synced('.')
+        assert _dir_snapshot('.') == batch_snapshot
+
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=batch, stream=True).sync()
+        assert _dir_snapshot('.') == batch_snapshot
+
+    def test_sync_stream_local(self, isolated_storage):
+        resource = LocalDirectoryResource(TESTFILE_DIR)
+        with disable_output():
+            SyncTask(resource, isolated_storage).sync()
+        batch_snapshot = _dir_snapshot('.')
+
+        for file in batch_snapshot:
+            os.remove(file)
+        with disable_output():
+            SyncTask(resource, isolated_storage, stream=True).sync()
+        assert _dir_snapshot('.') == batch_snapshot
+        assert os.path.exists(os.path.join('subdirectory', 'README.md'))
+
+    def test_sync_stream_broken(self, isolated_storage):
+        with disable_output(), pytest.raises(ValueError):
+            SyncTask(BrokenStreamResource(), isolated_storage, stream=True).sync()
+
+    def test_sync_with_budget(self, testfile_sync, isolated_storage):
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, batch=0).sync()
+        snapshot = _dir_snapshot('.')
+
+        for file in snapshot:
+            os.remove(file)
+        decisions = []
+        task = SyncTask(testfile_sync, isolated_storage, batch=BudgetBatchPolicy(max_size=2000, max_operations=4),
+                        on_flush=decisions.append)
+        with disable_output():
+            task.sync()
+        assert _dir_snapshot('.') == snapshot
+
+        assert sum(d.operations for d in decisions) == len(snapshot)
+        assert all(d.operations <= 4 for d in decisions)
+        assert all(d.size <= 2000 or d.operations == 1 for d in decisions)
+        assert all(d.seconds is not None for d in decisions)
+        assert {d.reason for d in decisions[:-1]} <= {'size', 'operations'}
+        assert decisions[-1].reason in {'size', 'operations', 'final'}
+
+    def test_sync_with_prefetch_meta(self, testfile_sync, isolated_storage):
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage).sync()
+        snapshot = _dir_snapshot('.')
+
+        with open(os.path.join('r1', 'garbage.txt'), 'w') as f:
+            f.write('garbage')
+        meta = json.loads(pathlib.Path('r1', '.meta.json').read_text(encoding='utf-8'))
+        meta['files'].append({'name': 'garbage.txt', 'type': 'text', 'mark': {}, 'metadata': {}})
+        pathlib.Path('r1', '.meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+        with disable_output():
+            SyncTask(testfile_sync, isolated_storage, prefetch_meta=True).sync()
+        assert _dir_snapshot('.') == snapshot
+
+    @pytest.mark.parametrize('batch', [3, -1])
+    def test_sync_with_staging_dir(self, testfile_sync, batch):
+        with isolated_directory():
+            with disable_output():
+                SyncTask(testfile_sync, LocalStorage('expected'), batch=batch).sync()
+                SyncTask(testfile_sync, LocalStorage('repo'), batch=batch, staging_dir='staging').sync()
+
+            _assert_testfile_synced('repo')
+            assert _dir_snapshot('repo') == _dir_snapshot('expected')
+            assert os.listdir('staging') == []
+
+    @pytest.mark.parametrize('lanes', [None, SizeLanes(threshold=100)])
+    @responses.activate
+    def test_sync_remote_digests(self, lanes):
+        contents = {'a.txt': b'a' * 10, 'b.txt': b'b' * 1000}
+        for name, content in contents.items():
+            headers = {'ETag': f'"{name}"', 'Content-Length': str(len(content))}
+            responses.add_callback(
+                responses.HEAD, f'https://example.com/{name}',
+                callback=lambda r, h=headers: (304 if r.headers.get('If-None-Match') == h['ETag'] else 200, h, b''),
+            )
+            responses.add(responses.GET, f'https://example.com/{name}', body=content, headers=headers)
+
+        with isolated_directory():
+            with disable_output():
+                SyncTask(_RemoteFilesResource(), LocalStorage('repo'), lanes=lanes).sync()
+
+            meta = json.loads(pathlib.Path('repo', '.meta.json').read_text(encoding='utf-8'))
+            for file in meta['files']:
+                content = contents[file['name']]
+                assert pathlib.Path('repo', file['name']).read_bytes() == content
+                assert file['mark']['etag'] == f'"{file["name"]}"'
+                assert file['mark']['sha256'] == sha256(content).hexdigest()
+                assert file['mark']['git_sha1'] == sha1(f'blob {len(content)}\0'.encode() + content).hexdigest()
+
+            with disable_output():  # the marks with digests are not regarded as changed
+                report = SyncTask(_RemoteFilesResource(), LocalStorage('repo'), lanes=lanes).sync()
+            assert report.counters.get('files_loaded', 0) == 0
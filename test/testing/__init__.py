@@ -1 +1,2 @@
-from .testfile import TESTFILE_DIR, isolated_to_testfile, start_http_server, start_http_server_to_testfile
+from .testfile import TESTFILE_DIR, isolated_to_testfile, start_http_server, start_http_server_to_testfile, \
+    start_aiohttp_server_to_testfile
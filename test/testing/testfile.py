@@ -2,8 +2,8 @@ import os
 import os.path
 import subprocess
 import sys
-from contextlib import contextmanager
-from typing import ContextManager, Optional
+from contextlib import contextmanager, asynccontextmanager
+from typing import ContextManager, Optional, AsyncContextManager
 from urllib.error import URLError
 
 import requests
@@ -56,3 +56,21 @@ def start_http_server_to_testfile(port: Optional[int] = None, silent: bool = Tru
     port = port or get_free_port(strict=False)
     with start_http_server(TESTFILE_DIR, port, silent) as url:
         yield url
+
+
+@asynccontextmanager
+async def start_aiohttp_server_to_testfile(port: Optional[int] = None) -> AsyncContextManager[str]:
+    # stand-in server on the running event loop, which supports ETag and If-None-Match
+    from aiohttp import web
+
+    port = port or get_free_port(strict=False)
+    app = web.Application()
+    app.router.add_static('/', TESTFILE_DIR)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, '127.0.0.1', port)
+        await site.start()
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        await runner.cleanup()
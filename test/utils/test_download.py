@@ -1,16 +1,190 @@
+import json
 import os.path
 import pathlib
-from hashlib import sha256
+import re
+from hashlib import sha256, sha1
 
 import pytest
+import requests
+import responses
 from hbutils.testing import disable_output
 
-from hfmirror.utils import download_file
+from hfmirror.utils import download_file, release_file_digests
 from ..testing import isolated_to_testfile
 
 
+_CONTENT = bytes(range(256)) * 400  # 102400 bytes
+
+
+def _git_sha1(content: bytes) -> str:
+    return sha1(f'blob {len(content)}\0'.encode() + content).hexdigest()
+
+
+class _RangeServer:
+    # serve the range requests of content, the ranges starting in `broken` end halfway for the given times
+    def __init__(self, url, content=_CONTENT, etag='"v1"', broken=None, accept_ranges=True):
+        self.content = content
+        self.etag = etag
+        self.broken = dict(broken or {})
+        self.accept_ranges = accept_ranges
+        self.ranges = []
+        responses.add_callback(responses.GET, url, callback=self._callback)
+
+    def _callback(self, request):
+        headers = {'ETag': self.etag}
+        if self.accept_ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        range_ = request.headers.get('Range')
+        if range_ is None or request.headers.get('If-Range') != self.etag:
+            self.ranges.append(None)
+            headers['Content-Length'] = str(len(self.content))
+            if self.broken.get(0):  # broken before the content length
+                self.broken[0] -= 1
+                return 200, headers, self.content[:len(self.content) // 2]
+            return 200, headers, self.content
+
+        start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', range_).groups())
+        self.ranges.append((start, end))
+        data = self.content[start:end + 1]
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(self.content)}'
+        if self.broken.get(start):
+            self.broken[start] -= 1
+            data = data[:len(data) // 2]
+        headers['Content-Length'] = str(len(data))
+        return 206, headers, data
+
+
 @pytest.mark.unittest
 class TestUtilsDownload:
+    @responses.activate
+    def test_segmented_download(self, tmp_path):
+        ranges = _RangeServer('https://example.com/f.bin').ranges
+        filename = str(tmp_path / 'f.bin')
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=4, min_segment_size=10000)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert ranges[0] is None
+        assert sorted(ranges[1:]) == [(25600, 51199), (51200, 76799), (76800, 102399)]
+
+    @responses.activate
+    def test_segmented_min_size(self, tmp_path):
+        ranges = _RangeServer('https://example.com/f.bin').ranges
+        filename = str(tmp_path / 'f.bin')
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=8, min_segment_size=40000)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert sorted(ranges[1:]) == [(51200, 102399)]
+
+    @responses.activate
+    def test_segmented_resumed(self, tmp_path):
+        ranges = _RangeServer('https://example.com/f.bin', broken={51200: 1}).ranges
+        filename = str(tmp_path / 'f.bin')
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=4, min_segment_size=10000)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert (51200, 76799) in ranges
+        assert (51200 + 12800, 76799) in ranges  # resumed from where it was broken
+
+    @responses.activate
+    def test_segmented_failed(self, tmp_path):
+        _RangeServer('https://example.com/f.bin', broken={51200: 1, 64000: 1})
+        filename = str(tmp_path / 'f.bin')
+        with disable_output(), pytest.raises(requests.exceptions.ChunkedEncodingError):
+            download_file('https://example.com/f.bin', filename, segments=4, min_segment_size=10000,
+                          segment_retries=1)
+
+    @responses.activate
+    def test_segmented_single_stream(self, tmp_path):
+        ranges = _RangeServer('https://example.com/f.bin', accept_ranges=False).ranges
+        filename = str(tmp_path / 'f.bin')
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=4, min_segment_size=10000)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert ranges == [None]
+
+        ranges = _RangeServer('https://example.com/g.bin').ranges
+        filename = str(tmp_path / 'g.bin')
+        with disable_output():
+            download_file('https://example.com/g.bin', filename, segments=4, min_segment_size=60000)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert ranges == [None]
+
+    @responses.activate
+    def test_segmented_changed(self, tmp_path):
+        # the file is changed after the first request, so the ranges are not served
+        headers = {'Accept-Ranges': 'bytes', 'ETag': '"v1"', 'Content-Length': str(len(_CONTENT))}
+        responses.add(responses.GET, 'https://example.com/f.bin', body=_CONTENT, headers=headers)
+        responses.add(responses.GET, 'https://example.com/f.bin', body=_CONTENT[::-1], headers={'ETag': '"v2"'})
+        filename = str(tmp_path / 'f.bin')
+        with disable_output(), pytest.raises(requests.exceptions.HTTPError):
+            download_file('https://example.com/f.bin', filename, segments=4, min_segment_size=10000)
+
+    @responses.activate
+    def test_resume(self, tmp_path):
+        server = _RangeServer('https://example.com/f.bin', broken={51200: 1, 76800: 2})
+        filename = str(tmp_path / 'f.bin')
+        with disable_output(), pytest.raises(requests.exceptions.ChunkedEncodingError):
+            download_file('https://example.com/f.bin', filename, segments=2, min_segment_size=10000,
+                          segment_retries=1, resume=True)
+        assert not os.path.exists(filename)
+        assert os.path.getsize(f'{filename}.part') == len(_CONTENT)
+        with open(f'{filename}.part.json') as f:
+            state = json.load(f)
+        assert state['url'] == 'https://example.com/f.bin'
+        assert state['validator'] == '"v1"'
+        assert state['received'] == 51200 + 25600 + 12800
+        assert state['ranges'] == [[0, 51200, 51199], [51200, 89600, 102399]]
+
+        server.ranges.clear()
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=2, min_segment_size=10000, resume=True)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert server.ranges == [(89600, 102399)]
+        assert not os.path.exists(f'{filename}.part')
+        assert not os.path.exists(f'{filename}.part.json')
+
+    @responses.activate
+    def test_resume_changed(self, tmp_path):
+        server = _RangeServer('https://example.com/f.bin', broken={0: 1})
+        filename = str(tmp_path / 'f.bin')
+        with disable_output(), pytest.raises(requests.exceptions.RequestException):
+            download_file('https://example.com/f.bin', filename, segments=1, min_segment_size=10000,
+                          segment_retries=0, resume=True)
+        assert os.path.exists(f'{filename}.part.json')
+
+        server.content, server.etag = _CONTENT[::-1], '"v2"'
+        server.ranges.clear()
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, segments=1, min_segment_size=10000, resume=True)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT[::-1]
+        assert server.ranges == [None]  # started over with the whole file
+        assert not os.path.exists(f'{filename}.part.json')
+
+    @responses.activate
+    def test_resume_not_supported(self, tmp_path):
+        responses.add(responses.GET, 'https://example.com/f.bin', body=_CONTENT)
+        filename = str(tmp_path / 'f.bin')
+        with disable_output():
+            download_file('https://example.com/f.bin', filename, resume=True)
+        assert pathlib.Path(filename).read_bytes() == _CONTENT
+        assert os.listdir(str(tmp_path)) == ['f.bin']
+
+    @responses.activate
+    def test_digests(self, tmp_path):
+        _RangeServer('https://example.com/f.bin')
+        responses.add(responses.GET, 'https://example.com/g.bin', body=_CONTENT,
+                      headers={'Content-Length': str(len(_CONTENT))})
+        expected = {'sha256': sha256(_CONTENT).hexdigest(), 'git_sha1': _git_sha1(_CONTENT)}
+        for url, kwargs in [
+            ('https://example.com/f.bin', dict(segments=4, min_segment_size=10000)),
+            ('https://example.com/f.bin', dict(segments=1, min_segment_size=10000, resume=True)),
+            ('https://example.com/g.bin', dict()),
+        ]:
+            filename = str(tmp_path / f'{len(os.listdir(str(tmp_path)))}.bin')
+            with disable_output():
+                download_file(url, filename, digests=True, **kwargs)
+            assert release_file_digests(filename) == expected
+
     @isolated_to_testfile()
     def test_download_file(self, url_to_testfile, url_to_game_character_skins):
         with disable_output():
@@ -5,7 +5,8 @@ import pytest
 from hbutils.system import TemporaryDirectory
 from hbutils.testing import isolated_directory
 
-from hfmirror.utils.filepool import FilePool
+from hfmirror.utils import cached_file_digests, register_file_digests, file_digest
+from hfmirror.utils.filepool import FilePool, clone_file, reflink_file
 
 
 @pytest.mark.unittest
@@ -66,3 +67,96 @@ class TestUtilsFilepool:
         fp.cleanup()
         assert not os.path.exists(f2)
         assert len(fp) == 0
+
+    def test_filepool_with_directory(self):
+        with isolated_directory():
+            fp = FilePool('staging')
+            with open('file.txt', 'w') as f:
+                f.write('content')
+            f1 = fp.put_file('file.txt')
+            assert os.path.abspath(f1).startswith(os.path.abspath('staging'))
+
+            del fp
+            with open(f1, 'r') as f:
+                assert f.read() == 'content'
+
+            fp = FilePool('staging')
+            f2 = fp.put_file('file.txt')
+            fp.cleanup()
+            assert not os.path.exists(f2)
+            assert os.path.exists(f1)
+            assert len(fp) == 0
+
+    def test_filepool_owned(self):
+        with isolated_directory():
+            fp = FilePool('staging', persistent=False)
+            with open('file.txt', 'w') as f:
+                f.write('content')
+            f1 = fp.put_file('file.txt', owned=True)
+            assert not os.path.exists('file.txt')
+            assert os.path.abspath(f1).startswith(os.path.abspath('staging'))
+            with open(f1, 'r') as f:
+                assert f.read() == 'content'
+            assert fp.transfers == {'rename': 1}
+
+            with open('file.txt', 'w') as f:
+                f.write('content 2')
+            f2 = fp.put_file('file.txt')
+            assert os.path.exists('file.txt')
+            assert not os.path.samefile('file.txt', f2)
+            with open(f2, 'r') as f:
+                assert f.read() == 'content 2'
+            assert set(fp.transfers.keys()) & {'copy', 'reflink'}
+
+            del fp
+            assert os.listdir('staging') == []
+
+    def test_filepool_digests(self):
+        with isolated_directory():
+            fp = FilePool('staging', persistent=False)
+            for file in ['owned.txt', 'shared.txt']:
+                with open(file, 'w') as f:
+                    f.write('content')
+                register_file_digests(file, {'sha256': 'registered'})
+
+            f1 = fp.put_file('owned.txt', owned=True)
+            f2 = fp.put_file('shared.txt')
+            assert cached_file_digests(f1) == {'sha256': 'registered'}
+            assert cached_file_digests('owned.txt') == {}  # handed over
+            assert cached_file_digests(f2) == {'sha256': 'registered'}
+            assert cached_file_digests('shared.txt') == {'sha256': 'registered'}
+
+            # the digests of the files in the pool are saved when calculated
+            with open('other.txt', 'w') as f:
+                f.write('content')
+            f3 = fp.put_file('other.txt')
+            assert cached_file_digests(f3) == {}
+            git_sha1 = file_digest(f3, 'git_sha1')
+            assert cached_file_digests(f3) == {'git_sha1': git_sha1}
+            file_digest('other.txt', 'git_sha1')
+            assert cached_file_digests('other.txt') == {}  # not registered, not saved
+
+            fp.cleanup()
+            assert cached_file_digests(f1) == {}
+            assert cached_file_digests(f2) == {}
+            assert cached_file_digests(f3) == {}
+
+    def test_filepool_hardlink(self):
+        with isolated_directory():
+            fp = FilePool('staging', hardlink=True)
+            with open('file.txt', 'w') as f:
+                f.write('content')
+            f1 = fp.put_file('file.txt')
+            assert os.path.samefile('file.txt', f1)
+            assert fp.transfers == {'hardlink': 1}
+
+    def test_clone_file(self):
+        with isolated_directory():
+            with open('file.txt', 'w') as f:
+                f.write('content')
+            assert clone_file('file.txt', 'file2.txt') in {'copy', 'reflink'}
+            with open('file2.txt', 'r') as f:
+                assert f.read() == 'content'
+
+            if not reflink_file('file.txt', 'file3.txt'):
+                assert not os.path.exists('file3.txt')
@@ -1,6 +1,14 @@
+import os
+import pathlib
+from hashlib import sha256
+
 import pytest
 
-from hfmirror.utils import hash_anything
+from hfmirror.utils import hash_anything, StreamDigest, file_digest, cached_file_digests, register_file_digests, \
+    release_file_digests
+
+_CONTENT = b'hello\n' * 1000
+_SHA256 = sha256(_CONTENT).hexdigest()
 
 
 @pytest.mark.unittest
@@ -13,3 +21,53 @@ class TestUtilsHash:
         assert hash_anything([1, 2, 'ds']) == hash((list, (1, 2, 'ds')))
         assert hash_anything({'b': 2, 'a': 3, 333: [1, 2, 'ds']}) == \
                hash((dict, (('a', 3), ('b', 2), (333, (list, (1, 2, 'ds'))))))
+
+    def test_stream_digest(self, tmp_path):
+        filename = str(tmp_path / 'file')
+        pathlib.Path(filename).write_bytes(_CONTENT)
+        git_sha1 = file_digest(filename, 'git_sha1')
+        assert file_digest(str(tmp_path / 'file'), 'sha256') == _SHA256
+
+        digest = StreamDigest(len(_CONTENT))
+        for offset in range(0, len(_CONTENT), 1000):
+            digest.update(offset, _CONTENT[offset:offset + 1000])
+        assert digest.position == len(_CONTENT)
+        assert digest.finish(filename) == {'sha256': _SHA256, 'git_sha1': git_sha1}
+
+        digest = StreamDigest(len(_CONTENT))
+        digest.update(0, _CONTENT[:1000])
+        digest.update(3000, _CONTENT[3000:4000])  # out of order, read back from the file
+        assert digest.position == 1000
+        assert digest.finish(filename) == {'sha256': _SHA256, 'git_sha1': git_sha1}
+
+        assert StreamDigest().finish(filename) == {'sha256': _SHA256}
+        assert StreamDigest(10).finish(filename) == {'sha256': _SHA256}
+
+    def test_git_sha1(self, tmp_path):
+        filename = str(tmp_path / 'file')
+        pathlib.Path(filename).write_bytes(b'hello\n')
+        assert file_digest(filename, 'git_sha1') == 'ce013625030ba8dba906f756967f9e9ca394464a'  # git hash-object
+        with pytest.raises(ValueError):
+            file_digest(filename, 'md5')
+
+    def test_file_digests_registry(self, tmp_path):
+        filename = str(tmp_path / 'file')
+        pathlib.Path(filename).write_bytes(_CONTENT)
+        assert cached_file_digests(filename) == {}
+        assert file_digest(filename) == _SHA256
+        assert cached_file_digests(filename) == {}  # not registered, not saved
+
+        register_file_digests(filename, {'sha256': 'registered'})
+        assert file_digest(filename) == 'registered'  # not read again
+        assert cached_file_digests(os.path.relpath(filename)) == {'sha256': 'registered'}
+
+        moved = str(tmp_path / 'moved')
+        os.replace(filename, moved)
+        assert cached_file_digests(moved) == {}  # the path is registered, not the file
+        assert release_file_digests(filename) == {'sha256': 'registered'}
+        assert cached_file_digests(filename) == {}
+        assert release_file_digests(filename) == {}
+
+        register_file_digests(moved, {})
+        assert file_digest(moved, 'git_sha1') == cached_file_digests(moved)['git_sha1']
+        release_file_digests(moved)
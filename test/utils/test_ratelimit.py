@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+import requests
+import responses
+
+from hfmirror.utils import get_requests_session, srequest, RateLimiter, TokenBucket, AdaptiveConcurrency
+
+
+@pytest.mark.unittest
+class TestUtilsRatelimit:
+    def test_token_bucket(self):
+        bucket = TokenBucket(20, burst=2)
+        start_time = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        assert 0.15 <= time.monotonic() - start_time < 1.0
+
+        with pytest.raises(ValueError):
+            TokenBucket(0)
+
+    def test_adaptive_concurrency(self):
+        concurrency = AdaptiveConcurrency(4, minimum=1, maximum=6, cooldown=60)
+        for _ in range(4 * 3):
+            concurrency.on_success()
+        assert int(concurrency.limit) == 6
+
+        concurrency.on_throttle()
+        assert int(concurrency.limit) == 3
+        concurrency.on_throttle()  # throttled in the same round
+        assert int(concurrency.limit) == 3
+
+        concurrency.cooldown = 0
+        for _ in range(5):
+            concurrency.on_throttle()
+        assert int(concurrency.limit) == 1
+
+    def test_adaptive_concurrency_blocks(self):
+        concurrency = AdaptiveConcurrency(2)
+        max_in_flight, lock = 0, threading.Lock()
+
+        def _work():
+            nonlocal max_in_flight
+            concurrency.acquire()
+            try:
+                with lock:
+                    max_in_flight = max(max_in_flight, concurrency.in_flight)
+                time.sleep(0.02)
+            finally:
+                concurrency.release()
+
+        threads = [threading.Thread(target=_work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert max_in_flight == 2
+        assert concurrency.in_flight == 0
+
+    @responses.activate
+    def test_session_with_throttling(self):
+        responses.add(responses.GET, 'https://example.com/a', status=429, headers={'Retry-After': '0.2'})
+        responses.add(responses.GET, 'https://example.com/a', status=200, body='ok')
+        responses.add(responses.GET, 'https://example.org/b', status=200, body='ok')
+
+        limiter = RateLimiter(concurrency=4)
+        session = get_requests_session(rate_limiter=limiter)
+        start_time = time.monotonic()
+        resp = srequest(session, 'GET', 'https://example.com/a')
+        assert resp.text == 'ok'
+        assert time.monotonic() - start_time >= 0.2
+        assert srequest(session, 'GET', 'https://example.org/b').text == 'ok'
+
+        state = limiter.state()
+        assert list(state.keys()) == ['example.com', 'example.org']
+        assert state['example.com']['requests'] == 2
+        assert state['example.com']['throttled'] == 1
+        assert state['example.com']['concurrency'] == 2
+        assert state['example.com']['in_flight'] == 0
+        assert state['example.org']['throttled'] == 0
+        assert state['example.org']['rate'] is None
+
+    @responses.activate
+    def test_session_throttled_too_many_times(self):
+        responses.add(responses.GET, 'https://example.com/a', status=503, headers={'Retry-After': '0'})
+        session = get_requests_session(max_retries=2, rate_limiter=RateLimiter(rate=100))
+        resp = srequest(session, 'GET', 'https://example.com/a', raise_for_status=False)
+        assert resp.status_code == 503
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_session_streamed_body(self):
+        responses.add(responses.GET, 'https://example.com/a', status=200, body=b'x' * 1000)
+        limiter = RateLimiter(concurrency=1, max_concurrency=1)
+        session = get_requests_session(rate_limiter=limiter)
+        host = limiter.host('example.com')
+
+        # the slot is held until the streamed body is consumed
+        resp = srequest(session, 'GET', 'https://example.com/a', stream=True)
+        assert host.concurrency.in_flight == 1
+        assert b''.join(resp.iter_content(chunk_size=100)) == b'x' * 1000
+        assert host.concurrency.in_flight == 0
+
+        # or until the response is closed, and the other requests wait for it
+        resp = srequest(session, 'GET', 'https://example.com/a', stream=True)
+        finished = threading.Event()
+
+        def _request():
+            assert srequest(session, 'GET', 'https://example.com/a').content == b'x' * 1000
+            finished.set()
+
+        t = threading.Thread(target=_request)
+        t.start()
+        assert not finished.wait(0.2)
+        resp.close()
+        resp.close()
+        assert finished.wait(5.0)
+        t.join()
+        assert host.concurrency.in_flight == 0
+        assert host.requests == 3
+
+    @responses.activate
+    def test_session_streamed_error(self):
+        responses.add(responses.GET, 'https://example.com/missing', status=404, body=b'not found')
+        limiter = RateLimiter(concurrency=2, max_concurrency=2)
+        session = get_requests_session(rate_limiter=limiter)
+        host = limiter.host('example.com')
+
+        # the error responses are raised without being closed, the slot should not be leaked
+        for _ in range(3):
+            with pytest.raises(requests.exceptions.HTTPError) as ei:
+                srequest(session, 'GET', 'https://example.com/missing', stream=True)
+            assert host.concurrency.in_flight == 0
+        assert ei.value.response.content == b'not found'  # still readable
+
+    def test_host_rates(self):
+        limiter = RateLimiter(rate=10, host_rates={'api.github.com': 1})
+        assert limiter.host('api.github.com').state()['rate'] == 1
+        assert limiter.host('github.com').state()['rate'] == 10
+        assert limiter.host('github.com') is limiter.host('github.com')
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+import requests
+import responses
+from requests.exceptions import ConnectionError
+
+from hfmirror.utils import get_requests_session, srequest, RetryPolicy, download_file
+
+
+@pytest.mark.unittest
+class TestUtilsRetry:
+    def test_backoff_time(self):
+        policy = RetryPolicy(backoff=1.0, multiplier=2.0, max_backoff=5.0, jitter=0.5)
+        for attempt, base in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+            for _ in range(20):
+                assert base * 0.5 <= policy.backoff_time(attempt) <= base
+        assert policy.backoff_time(1, retry_after=7.0) == 7.0
+        assert RetryPolicy(respect_retry_after=False, jitter=0).backoff_time(1, retry_after=7.0) == 1.0
+
+    @responses.activate
+    def test_retry_with_telemetry(self):
+        responses.add(responses.GET, 'https://example.com/a', status=500)
+        responses.add(responses.GET, 'https://example.com/a', status=429, headers={'Retry-After': '0.1'})
+        responses.add(responses.GET, 'https://example.com/a', status=200, body='ok')
+
+        attempts = []
+        policy = RetryPolicy(backoff=0.05, on_attempt=attempts.append)
+        session = get_requests_session(retry_policy=policy)
+        start_time = time.monotonic()
+        assert srequest(session, 'GET', 'https://example.com/a').text == 'ok'
+        assert time.monotonic() - start_time >= 0.1
+
+        assert len(responses.calls) == 3  # not retried by urllib3 or srequest again
+        assert [(a.attempt, a.status) for a in attempts] == [(1, 500), (2, 429), (3, 200)]
+        assert attempts[1].wait == 0.1
+        assert attempts[2].wait is None
+        assert attempts[0].to_json()['url'] == 'https://example.com/a'
+        assert policy.stats() == {
+            'requests': 1,
+            'attempts': 3,
+            'retries': 2,
+            'failures': 0,
+            'waited': pytest.approx(attempts[0].wait + 0.1),
+        }
+
+    @responses.activate
+    def test_max_attempts(self):
+        responses.add(responses.GET, 'https://example.com/a', status=502)
+        session = get_requests_session(max_retries=2, retry_policy=None)
+        session.get_adapter('https://').retry_policy.backoff = 0.01
+        with pytest.raises(requests.HTTPError):
+            srequest(session, 'GET', 'https://example.com/a')
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_deadline(self):
+        responses.add(responses.GET, 'https://example.com/a', status=503, headers={'Retry-After': '10'})
+        policy = RetryPolicy(deadline=1.0)
+        session = get_requests_session(retry_policy=policy)
+        start_time = time.monotonic()
+        resp = srequest(session, 'GET', 'https://example.com/a', raise_for_status=False)
+        assert resp.status_code == 503
+        assert time.monotonic() - start_time < 1.0
+        assert len(responses.calls) == 1
+        assert policy.stats()['failures'] == 1
+
+    @responses.activate
+    def test_exceptions(self):
+        responses.add(responses.GET, 'https://example.com/a', body=ConnectionError('broken'))
+        attempts = []
+        session = get_requests_session(retry_policy=RetryPolicy(
+            max_attempts=3, backoff=0.01, on_attempt=attempts.append))
+        with pytest.raises(ConnectionError):
+            srequest(session, 'GET', 'https://example.com/a')
+        assert [a.status for a in attempts] == [None, None, None]
+        assert all(isinstance(a.error, ConnectionError) for a in attempts)
+
+    @responses.activate
+    def test_plain_session(self):
+        responses.add(responses.GET, 'https://example.com/a', body=ConnectionError('broken'))
+        responses.add(responses.GET, 'https://example.com/a', status=200, body='ok')
+        session = requests.session()
+        resp = srequest(session, 'GET', 'https://example.com/a', sleep_time=0.01)
+        assert resp.text == 'ok'
+
+        responses.add(responses.GET, 'https://example.com/b', status=500)
+        responses.add(responses.GET, 'https://example.com/b', status=200, body='ok')
+        resp = srequest(session, 'GET', 'https://example.com/b', retry_policy=RetryPolicy(backoff=0.01))
+        assert resp.text == 'ok'
+
+    @responses.activate
+    def test_download_file(self, tmp_path):
+        responses.add(responses.GET, 'https://example.com/f.bin', status=504)
+        responses.add(responses.GET, 'https://example.com/f.bin', status=200, body=b'x' * 100)
+        policy = RetryPolicy(backoff=0.01)
+        filename = str(tmp_path / 'f.bin')
+        download_file('https://example.com/f.bin', filename, retry_policy=policy)
+        with open(filename, 'rb') as f:
+            assert f.read() == b'x' * 100
+        assert policy.stats()['retries'] == 1
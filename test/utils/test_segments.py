@@ -19,3 +19,8 @@ class TestUtilsSegments:
             to_segments('con')
 
         assert to_segments('') == []
+
+    def test_to_segments_interned(self):
+        segments1 = to_segments('dir_' + 'x' * 20 + '/1.txt')
+        segments2 = to_segments(['dir_' + 'x' * 20, '2.txt'])
+        assert segments1[0] is segments2[0]
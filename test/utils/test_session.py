@@ -1,7 +1,10 @@
+import threading
+
 import pytest
 from requests import RequestException
 
-from hfmirror.utils import get_requests_session, srequest
+from hfmirror.utils import get_requests_session, get_shared_session, close_shared_sessions, srequest, RetryPolicy
+from hfmirror.utils.session import DEFAULT_POOL_MAXSIZE
 
 
 @pytest.fixture(scope='module')
@@ -32,3 +35,42 @@ class TestUtilsSession:
 
         resp = srequest(session, 'HEAD', f'{url_to_testfile}/_file_should_not_exist', raise_for_status=False)
         assert resp.status_code == 404
+
+    def test_shared_session(self):
+        session = get_shared_session(headers={'User-Agent': 'a', 'X-Token': 'b'})
+        assert get_shared_session(headers={'X-Token': 'b', 'User-Agent': 'a'}) is session
+        assert get_shared_session(headers={'User-Agent': 'a'}) is not session
+        assert get_shared_session(headers={'User-Agent': 'a', 'X-Token': 'b'}, timeout=30) is not session
+        assert session.headers['X-Token'] == 'b'
+
+        policy = RetryPolicy()
+        assert get_shared_session(retry_policy=policy) is get_shared_session(retry_policy=policy)
+        assert get_shared_session(retry_policy=policy) is not get_shared_session(retry_policy=RetryPolicy())
+        assert get_shared_session(retry_policy=policy).get_adapter('https://').retry_policy is policy
+
+    def test_shared_session_threads(self):
+        sessions = []
+
+        def _get():
+            sessions.append(get_shared_session(headers={'X-Threads': '1'}))
+
+        threads = [threading.Thread(target=_get) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(s) for s in sessions}) == 1
+
+    def test_pool_size(self):
+        adapter = get_shared_session().get_adapter('https://')
+        assert adapter._pool_maxsize == DEFAULT_POOL_MAXSIZE
+
+        adapter = get_requests_session(pool_connections=4, pool_maxsize=8).get_adapter('https://')
+        assert adapter._pool_connections == 4
+        assert adapter._pool_maxsize == 8
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 8
+
+    def test_close_shared_sessions(self):
+        session = get_shared_session(headers={'X-Close': '1'})
+        close_shared_sessions()
+        assert get_shared_session(headers={'X-Close': '1'}) is not session